@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+# A stand-in for a container shell, used by the paks proxy benchmarks.
+# It echoes what it reads (like readline does), marks the prompt with
+# bracketed paste, and understands two commands:
+#
+#   flood <bytes>   write that many bytes of output (in the background,
+#                   so keystrokes are still echoed), then DONE
+#   exit            exit the shell
+
+import threading
+import tty
+import os
+
+prompt = b"\x1b[?2004h$ "
+paste_start = b"\x1b[200~"
+paste_end = b"\x1b[201~"
+line = b"0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ!?\r\n" * 16
+
+
+def write(data):
+    view = memoryview(data)
+    while view:
+        written = os.write(1, view)
+        view = view[written:]
+
+
+def flood(size):
+    while size > 0:
+        chunk = line[:size]
+        write(chunk)
+        size -= len(chunk)
+    write(b"\r\nDONE\r\n" + prompt)
+
+
+def main():
+    tty.setraw(0)
+    write(prompt)
+    current = bytearray()
+    pasting = False
+    while True:
+        data = os.read(0, 65536)
+        if not data:
+            return
+
+        # A paste is echoed and counted, but not run
+        if pasting or paste_start in data:
+            pasting = paste_end not in data
+            if not pasting:
+                write(b"\r\nPASTED\r\n" + prompt)
+            continue
+
+        write(data)
+        for byte in data:
+            if byte not in (0x0D, 0x0A):
+                current.append(byte)
+                continue
+            command = bytes(current).strip()
+            current.clear()
+            if command == b"exit":
+                return
+            if command.startswith(b"flood "):
+                size = int(command.split()[1])
+                threading.Thread(target=flood, args=(size,)).start()
+                continue
+            write(b"\r\n" + prompt)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+# Benchmark the paks interactive loop (ContainerTechnology._interactive_command)
+# against a fake shell instead of a container engine. Each run forks a child
+# on a new pseudo-terminal (the "user terminal") that runs paks, and this
+# process types into it and reads what it shows.
+#
+#   python benchmarks/proxy.py --output results.json
+
+import argparse
+import platform
+import tempfile
+import select
+import json
+import time
+import pty
+import sys
+import os
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import paks.backends.base
+import paks.backends.proxy
+import paks.commands
+import paks.defaults
+import paks.settings
+from paks.backends.latency import Histogram
+
+fake_shell = [sys.executable, os.path.join(here, "fake_shell.py")]
+
+
+class BenchContainer(paks.backends.base.ContainerTechnology):
+    """
+    A container technology that runs the fake shell, with canned history.
+    """
+
+    def __init__(self, settings, history_lines=1000):
+        super(BenchContainer, self).__init__(settings)
+        self.image = "benchmark"
+        self.uri = paks.backends.base.ContainerName("docker.io/library/benchmark")
+        self.commands = paks.commands.DockerCommands("docker")
+        self.history_lines = history_lines
+
+    def sync_history(self, offset):
+        if offset:
+            return ""
+        return "".join("echo history %s\n" % i for i in range(self.history_lines))
+
+
+class Terminal:
+    """
+    The user side of a benchmark session.
+    """
+
+    def __init__(self, chunk_size, settings=None, record=False):
+        self.pid, self.fd = pty.fork()
+        if self.pid == 0:
+            self.child(chunk_size, settings or {}, record)
+        self.buffer = bytearray()
+
+    def child(self, chunk_size, settings, record):
+        try:
+            tmpdir = tempfile.mkdtemp(prefix="paks-bench-")
+            paks.defaults.history_dir = os.path.join(tmpdir, "history")
+            paks.defaults.latency_dir = os.path.join(tmpdir, "latency")
+            paks.backends.proxy.chunk_size = chunk_size
+            paks.backends.proxy.high_water = 4 * chunk_size
+            config = paks.settings.Settings(None)
+            for key, value in settings.items():
+                config.set(key, value)
+            if record:
+                record = os.path.join(tmpdir, "session.cast.gz")
+            BenchContainer(config).interactive_command(fake_shell, record=record)
+        finally:
+            os._exit(0)
+
+    def write(self, data):
+        os.write(self.fd, data)
+
+    def read_until(self, token, timeout=60):
+        """
+        Read until token is seen, returning the number of bytes read.
+        """
+        end = time.monotonic() + timeout
+        total = 0
+        while time.monotonic() < end:
+            index = self.buffer.find(token)
+            if index != -1:
+                total += index + len(token)
+                del self.buffer[: index + len(token)]
+                return total
+            total += max(0, len(self.buffer) - len(token))
+            del self.buffer[: max(0, len(self.buffer) - len(token))]
+            ready, _, _ = select.select([self.fd], [], [], 0.1)
+            if ready:
+                try:
+                    data = os.read(self.fd, 1024 * 1024)
+                except OSError:
+                    break
+                if not data:
+                    break
+                self.buffer += data
+        raise RuntimeError("Timed out waiting for %s" % token)
+
+    def cpu_time(self):
+        """
+        Seconds of CPU used by paks so far (Linux only, otherwise None).
+        """
+        try:
+            with open("/proc/%s/stat" % self.pid) as fd:
+                fields = fd.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def close(self):
+        self.write(b"exit\r")
+        try:
+            self.read_until(b"Container exited.", timeout=10)
+        except RuntimeError:
+            pass
+        os.waitpid(self.pid, 0)
+        os.close(self.fd)
+
+
+def summarize(histogram):
+    summary = histogram.summary()
+    return {
+        key: summary[key] for key in ["count", "p50", "p99", "max"] if key in summary
+    }
+
+
+def bench_throughput(term, size):
+    """
+    MB/s of container output shown on the terminal.
+    """
+    cpu = term.cpu_time()
+    start = time.monotonic()
+    term.write(b"flood %d\r" % size)
+    term.read_until(b"DONE\r\n")
+    elapsed = time.monotonic() - start
+    term.read_until(b"$ ")
+    result = {"bytes": size, "seconds": elapsed, "mb_per_second": size / elapsed / 1e6}
+    if cpu is not None:
+        result["paks_cpu_seconds"] = term.cpu_time() - cpu
+    return result
+
+
+def bench_echo(term, count):
+    """
+    Time from a keystroke to its echo, in milliseconds.
+    """
+    histogram = Histogram()
+    for i in range(count):
+        key = b"abcdefghijklmnopqrstuvwxyz"[i % 26 : i % 26 + 1]
+        start = time.monotonic()
+        term.write(key)
+        term.read_until(key)
+        histogram.record(time.monotonic() - start)
+    term.write(b"\x15\r")
+    term.read_until(b"$ ")
+    return summarize(histogram)
+
+
+def bench_paste(term, lines):
+    """
+    Time for a bracketed paste of many lines to reach the shell.
+    """
+    paste = b"".join(b"echo line %d\n" % i for i in range(lines))
+    start = time.monotonic()
+    term.write(b"\x1b[200~" + paste + b"\x1b[201~")
+    term.read_until(b"PASTED\r\n")
+    elapsed = time.monotonic() - start
+    term.read_until(b"$ ")
+    return {"lines": lines, "bytes": len(paste), "ms": elapsed * 1000}
+
+
+def bench_history(term, count):
+    """
+    Time for an up arrow (history lookup in paks) to reach the shell.
+    """
+    histogram = Histogram()
+    for _ in range(count):
+        start = time.monotonic()
+        term.write(b"\x1b[A")
+        term.read_until(b"\x1b[A")
+        histogram.record(time.monotonic() - start)
+    term.write(b"\x15\r")
+    term.read_until(b"$ ")
+    return summarize(histogram)
+
+
+def bench_echo_under_load(term, size, count):
+    """
+    Keystroke echo while the container floods output.
+    """
+    histogram = Histogram()
+    term.write(b"flood %d\r" % size)
+    for i in range(count):
+        start = time.monotonic()
+        term.write(b"~")
+        term.read_until(b"~")
+        histogram.record(time.monotonic() - start)
+    term.read_until(b"DONE\r\n")
+    term.read_until(b"$ ")
+    term.write(b"\x15\r")
+    term.read_until(b"$ ")
+    return summarize(histogram)
+
+
+def run(args):
+    results = []
+    for chunk_size in args.chunk_sizes:
+        settings = {"output_passthrough": args.passthrough}
+        term = Terminal(chunk_size, settings=settings, record=args.record)
+        try:
+            term.read_until(b"$ ")
+            result = {"chunk_size": chunk_size, "record": args.record}
+            result.update(settings)
+            result["throughput"] = bench_throughput(term, args.flood)
+            result["echo_ms"] = bench_echo(term, args.keystrokes)
+            result["paste"] = bench_paste(term, args.paste_lines)
+            result["history_key_ms"] = bench_history(term, args.keystrokes)
+            result["echo_under_load_ms"] = bench_echo_under_load(
+                term, args.flood, min(args.keystrokes, 50)
+            )
+        finally:
+            term.close()
+        results.append(result)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="paks proxy benchmarks")
+    parser.add_argument(
+        "--chunk-sizes",
+        dest="chunk_sizes",
+        default="4096,16384,65536",
+        type=lambda x: [int(size) for size in x.split(",")],
+        help="comma separated proxy read sizes to test",
+    )
+    parser.add_argument(
+        "--flood", default=50 * 1000 * 1000, type=int, help="bytes of output"
+    )
+    parser.add_argument(
+        "--keystrokes", default=200, type=int, help="keystrokes to time"
+    )
+    parser.add_argument(
+        "--paste-lines",
+        dest="paste_lines",
+        default=5000,
+        type=int,
+        help="lines in the pasted block",
+    )
+    parser.add_argument(
+        "--record",
+        default=False,
+        action="store_true",
+        help="record the sessions, to measure the recorder",
+    )
+    parser.add_argument(
+        "--passthrough",
+        default=False,
+        action="store_true",
+        help="splice container output to the terminal (output_passthrough)",
+    )
+    parser.add_argument("--output", "-o", help="write json results here")
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    results = run(args)
+    content = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(content)
+    print(content)
+
+
+if __name__ == "__main__":
+    main()
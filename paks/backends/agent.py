@@ -0,0 +1,256 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.logger import logger
+import subprocess
+import threading
+import secrets
+import select
+import struct
+import time
+
+# Frames are a header (operation or status, payload length) and a payload of
+# arguments separated by NUL bytes
+header = struct.Struct("!BI")
+
+# Operations, and response status
+READ, APPEND, RUN, MKDIR = 1, 2, 3, 4
+OK, ERROR = 0, 1
+
+# Seconds to wait for a response, and before starting again after a failure
+request_timeout = 10
+retry_interval = 30
+
+# Exports are appended to a file in a private directory the agent makes (mode
+# 0700) on the first export, which the shell sources before its next command.
+# The path (put in the shell's trap when the session starts) has a random part,
+# and a directory there made by anyone else isn't used
+env_prefix = "/tmp/paks-"
+env_name = "env"
+
+# The agent, run with python3 inside the container. Kept small (and to the
+# standard library) since it is sent on the command line.
+script = r"""
+import os, stat, struct, subprocess, sys
+head = struct.Struct("!BI")
+stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+
+def read(size):
+    data = b""
+    while len(data) < size:
+        more = stdin.read(size - len(data))
+        if not more:
+            sys.exit(0)
+        data += more
+    return data
+
+while True:
+    op, size = head.unpack(read(head.size))
+    args = read(size).split(b"\0")
+    try:
+        if op == 1:
+            with open(args[0], "rb") as fd:
+                fd.seek(int(args[1]))
+                out, status = fd.read(), 0
+        elif op == 2:
+            with open(args[0], "ab") as fd:
+                fd.write(b"\0".join(args[1:]))
+            out, status = b"", 0
+        elif op == 4:
+            try:
+                os.mkdir(args[0], 0o700)
+            except FileExistsError:
+                st = os.lstat(args[0])
+                if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+                    raise
+                if stat.S_IMODE(st.st_mode) != 0o700:
+                    raise
+            out, status = b"", 0
+        elif op == 3:
+            p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            out, err = p.communicate()
+            if p.returncode:
+                out, status = err, 1
+            else:
+                status = 0
+        else:
+            out, status = b"unknown operation", 1
+    except Exception as e:
+        out, status = str(e).encode("utf-8"), 1
+    stdout.write(head.pack(status, len(out)) + out)
+    stdout.flush()
+"""
+
+
+class HelperAgent:
+    """
+    A helper running inside the container, for paks to talk to directly.
+
+    The agent is started with exec (on first use) and reads request frames
+    on its stdin, answering each with one frame on stdout. Nothing goes
+    through the user's terminal, and file contents and command output
+    come back as they are. Calls are made one at a time (they come from
+    command workers and history sync) under a lock. If the agent can't be
+    started (e.g., there is no python3 in the container) or stops
+    answering, calls return None so the caller can fall back to the
+    terminal, and it is tried again after retry_interval.
+    """
+
+    def __init__(self, tech, container_name, exports=False):
+        self.tech = tech
+        self.container_name = container_name
+
+        # Exports need the shell to source them (see get_trap)
+        self.env_dir = env_prefix + secrets.token_hex(8) if exports else None
+        self.env_ready = False
+        self.process = None
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the agent in the container, if it isn't running.
+        """
+        if self.process and self.process.poll() is None:
+            return True
+        if time.time() - self.failed < retry_interval:
+            return False
+        cmd = [self.tech, "exec", "-i", self.container_name]
+        self.process = subprocess.Popen(
+            cmd + ["python3", "-u", "-c", script],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+        )
+        return True
+
+    def call(self, op, *args):
+        """
+        Make a request, returning the payload of the response.
+
+        Returns None if the agent is not available, or the request failed.
+        """
+        payload = b"\0".join(
+            arg if isinstance(arg, bytes) else str(arg).encode("utf-8") for arg in args
+        )
+        with self.lock:
+            try:
+                if not self.start():
+                    return
+                self.process.stdin.write(header.pack(op, len(payload)) + payload)
+                status, size = header.unpack(self.read(header.size))
+                data = self.read(size)
+            except (OSError, ValueError, struct.error) as e:
+                logger.debug("Helper agent is not available: %s" % e)
+                self.stop()
+                self.failed = time.time()
+                return
+        if status != OK:
+            logger.debug("Helper agent request failed: %s" % data.decode("utf-8"))
+            return
+        return data
+
+    def read(self, size):
+        """
+        Read exactly size bytes of a response.
+        """
+        data = b""
+        fd = self.process.stdout
+        while len(data) < size:
+            if not select.select([fd], [], [], request_timeout)[0]:
+                raise OSError("timed out waiting for a response")
+            more = fd.read(size - len(data))
+            if not more:
+                raise OSError("the agent exited")
+            data += more
+        return data
+
+    def read_file(self, path, offset=0):
+        """
+        Read a file in the container, starting at a byte offset.
+        """
+        return self.call(READ, path, offset)
+
+    def append_file(self, path, data):
+        """
+        Append bytes to a file in the container.
+        """
+        return self.call(APPEND, path, data) is not None
+
+    @property
+    def env_file(self):
+        return self.env_dir + "/" + env_name if self.env_dir else None
+
+    def make_env_dir(self):
+        """
+        Make the private directory for exports, if it isn't there yet.
+
+        This is done on the first export (from a worker) since the container
+        may not be running when the session starts. If it fails, the export
+        is typed instead and it is tried again on the next one.
+        """
+        if not self.env_ready:
+            self.env_ready = self.call(MKDIR, self.env_dir) is not None
+            if not self.env_ready:
+                logger.debug("Exports are typed, no directory for them yet.")
+        return self.env_ready
+
+    def export(self, name, value):
+        """
+        Export an environment variable to the shell, before its next command.
+
+        The value is shell text, as it would be typed.
+        """
+        if not self.env_dir or not self.make_env_dir():
+            return False
+        line = "export %s=%s\n" % (name, value)
+        return self.append_file(self.env_file, line.encode("utf-8"))
+
+    def run(self, cmd):
+        """
+        Run a command in the container, returning its output.
+        """
+        return self.call(RUN, *cmd)
+
+    def close(self):
+        """
+        Remove the directory for exports, and stop the agent (session end).
+        """
+        if self.env_ready and self.process:
+            self.run(["rm", "-rf", self.env_dir])
+        self.env_ready = False
+        self.stop()
+
+    def stop(self):
+        """
+        Stop the agent (closing its stdin ends it).
+        """
+        process, self.process = self.process, None
+        if not process:
+            return
+        process.stdin.close()
+        try:
+            process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        process.stdout.close()
+
+
+def get_trap(env_file):
+    """
+    Get a bash DEBUG trap that sources exports from the agent.
+
+    Only a file (and directory) owned by the shell's user is sourced, so
+    another user of the container can't put commands there. The file is
+    renamed before it is sourced, so an export that arrives at the same
+    time is kept for the next command.
+    """
+    paths = {"dir": env_file.rsplit("/", 1)[0], "file": env_file}
+    paths["moved"] = env_file + ".$$"
+    return (
+        "trap '[ -s %(file)s ] && [ -O %(dir)s ] && [ ! -L %(dir)s ]"
+        " && [ -O %(file)s ] && [ ! -L %(file)s ]"
+        " && mv %(file)s %(moved)s && { . %(moved)s; rm -f %(moved)s; }' DEBUG"
+    ) % paths
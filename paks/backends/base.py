@@ -9,14 +9,32 @@ import paks.defaults
 import paks.templates
 import paks.commands
 import paks.settings
-
+import paks.backends.agent
+import paks.backends.breaker
+import paks.backends.cache
+import paks.backends.editor
+import paks.backends.frames
+import paks.backends.history
+import paks.backends.latency
+import paks.backends.model
+import paks.backends.predict
+import paks.backends.proxy
+import paks.backends.recorder
+import paks.backends.scrollback
+import paks.backends.search
+import paks.backends.size
+import paks.backends.stats
+import paks.backends.status
+import paks.backends.vt
+
+import concurrent.futures
 import subprocess
-import select
-import string
+import shutil
 import pty
 import termios
 import tty
 import os
+import time
 import sys
 import re
 
@@ -80,96 +98,272 @@ class ContainerTechnology:
             settings = paks.settings.Settings(paks.defaults.settings_file)
         self.settings = settings
 
-    def get_history(self, line, openpty):
+        # Engine API client, when there is one (commands use the CLI without)
+        self.engine = None
+
+    def get_history(self, index):
         """
-        Given an input with some number of up/down and newline, derive command.
+        Given a number of steps back into history, derive the command.
         """
-        up = line.count("[A")
-        down = line.count("[B")
-        change = up - down
-
         # pushed down below history
-        if change <= 0:
+        if index <= 0 or not self.history:
             return ""
-        history = self.hist.run(
+
+        # Like the shell, stop at the oldest entry
+        self.history_index = min(index, len(self.history))
+        return self.history.get(self.history_index) or ""
+
+    def sync_history(self, offset):
+        """
+        Read the container history file after an offset (in a thread)
+        """
+        return self.hist.run(
             container_name=self.uri.extended_name,
-            out=openpty,
+            out=self.proxy.fd,
             history_file=self.settings.history_file,
             user=self.settings.user,
+            offset=offset,
+            agent=self.agent,
         )
-        history = [x for x in history.split("\n") if x]
-
-        if not history:
-            return ""
-
-        if change > len(history):
-            return ""
-
-        # here we are looking back up into history (negative index)
-        newline = history[-1 * change]
-
-        # Add back any characters typed
-        newline += re.split("(\[A|\[B)", line, 1)[-1]
-        return newline
 
     def encode(self, msg):
         return bytes((msg).encode("utf-8"))
 
-    def interactive_command(self, cmd):
+    def interactive_command(self, cmd, record=None):
         """
         Ensure we always restore original TTY otherwise terminal gets messed up
+
+        If record is a path (or True for the default) the session is saved
+        there as an asciicast.
         """
-        # Controller to get history
+        self.record = record
+
+        # Controller to get history, and the host-side copy we navigate
         self.hist = self.commands.history
+        self.history = paks.backends.history.SessionHistory(
+            sync=self.sync_history,
+            size=self.settings.history_size,
+            interval=self.settings.history_sync_interval,
+        )
+
+        # History across all sessions of this image, for reverse search
+        self.search_index = paks.backends.search.get_index(
+            self.uri.slug, self.settings.history_persist
+        )
+        self.search_index.load()
 
         # save original tty setting then set it to raw mode
         old_tty = termios.tcgetattr(sys.stdin)
         old_pty = termios.tcgetattr(sys.stdout)
         try:
-            self._interactive_command(cmd)
+            return self._interactive_command(cmd)
         finally:
             termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_tty)
             termios.tcsetattr(sys.stdout, termios.TCSADRAIN, old_pty)
 
-    def run_executor(self, string_input, openpty):
+    def get_kwargs(self, string_input):
+        """
+        Get the session data a command line is run with.
+        """
+        return {
+            "name": self.image,
+            "container_name": self.uri.extended_name,
+            "original": string_input,
+            "latency": self.latency,
+            "scrollback": self.scrollback,
+            "agent": self.agent,
+            "engine": self.engine,
+            "cache": self.cache,
+            "model": self.model,
+            "sizes": self.sizes,
+            "stats": self.stats,
+            "on_loop": self.proxy.call_soon_threadsafe,
+        }
+
+    def measure_size(self):
+        """
+        Measure the container's size (on a worker) when the session attaches,
+        the baseline #size says how much it grew from.
+        """
+        if self.sizes.has_baseline(self.uri.extended_name):
+            return
+        executor = self.commands.get_executor("#size")
+        self.workers.submit(executor.run, **self.get_kwargs("#size"))
+
+    def run_executor(self, string_input):
         """
         Given a string input, run executor
+
+        Commands run on a worker, so the session carries on while they do,
+        and report progress to the status line. Their output to the
+        container and the status line are handed back to the loop.
         """
-        string_input = string_input.replace("[A", "").replace("[B", "")
         if not string_input.startswith("#"):
             return
 
-        executor = self.commands.get_executor(string_input, out=openpty)
-        if executor is not None:
+        executor = self.commands.get_executor(
+            string_input,
+            out=lambda data: self.proxy.call_soon_threadsafe(self.inject, data),
+            status=lambda text: self.proxy.call_soon_threadsafe(self.status.show, text),
+        )
+        if executor is None:
+            return
 
-            # Provide pre-command message to the terminal
-            if executor.pre_message:
-                print("\n\r" + executor.pre_message)
+        # If we have an executor for the command, run it!
+        # All commands require the original / current name
+        name = executor.latency_name or self.commands.parse_name(string_input)
+        kwargs = self.get_kwargs(string_input)
+
+        # Quick commands that look at session state run here
+        if not executor.background:
+            future = concurrent.futures.Future()
+            self.running[future] = (executor, name, time.monotonic())
+            try:
+                future.set_result(executor.run(**kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return self.command_done(future)
+
+        # Provide pre-command message to the status line
+        self.status.show(executor.pre_message or "Running %s..." % name)
+        future = self.workers.submit(executor.run, **kwargs)
+        self.running[future] = (executor, name, time.monotonic())
+        future.add_done_callback(
+            lambda future: self.proxy.call_soon_threadsafe(self.command_done, future)
+        )
 
-            # If we have an executor for the command, run it!
-            # All commands require the original / current name
-            result = executor.run(
-                name=self.image,
-                container_name=self.uri.extended_name,
-                original=string_input,
+    def command_done(self, future):
+        """
+        Show the result of a finished command, above the shell's prompt.
+        """
+        executor, name, start = self.running.pop(future)
+        self.latency.record(name, time.monotonic() - start)
+        if not self.running and not self.stats.running:
+            self.status.close()
+
+        try:
+            result = future.result()
+            message = result.message
+        except Exception as e:
+            message = (
+                "Cancelled." if executor.cancelled else "%s failed: %s" % (name, e)
             )
-            if result.message:
-                print("\r" + result.message)
+            logger.debug("%s failed: %s" % (name, e))
+        if message:
+            self.show_message(message)
+
+    def inject(self, data):
+        """
+        Type bytes from a paks command into the shell (e.g., an export).
+
+        Commands finish whenever they do, so the bytes are held while the
+        user has something on the line, and sent once it is submitted or
+        cleared, instead of landing in the middle of it.
+        """
+        self.injected += data
+        self.flush_injected()
+
+    def flush_injected(self):
+        if self.injected and not self.search and not self.editor.line:
+            self.proxy.write(bytes(self.injected))
+            self.injected = bytearray()
+
+    def show_message(self, message):
+        """
+        Show a message above the shell's prompt.
+        """
+        # Clear the line being typed and put it back after the message
+        if self.frames:
+            self.frames.write()
+        message = self.encode(message.replace("\n\r", "\n").replace("\n", "\r\n"))
+        self.proxy.echo(b"\r\x1b[2K" + message + b"\r\n" + bytes(self.last_line))
+
+    def on_engine_event(self, event):
+        """
+        Keep up with an engine event (this is called in the event thread).
+        """
+        state, action, notice = self.model.update(event)
+        if not state or state.name != self.uri.extended_name:
+            return
+
+        # Our own exec calls (e.g., history sync) don't change anything
+        if not action.startswith("exec_"):
+            self.cache.invalidate(state.name)
+        if state.state == "removed":
+            self.sizes.forget(state.name)
+        if action == "start":
+            self.proxy.call_soon_threadsafe(self.measure_size)
+        if notice:
+            self.proxy.call_soon_threadsafe(self.show_message, notice)
+
+    def show_stats(self, summary):
+        """
+        Show container stats on the status line, unless a command is using it.
+        """
+        if not self.running and self.stats.running:
+            self.status.show(summary)
+
+    def stats_ended(self):
+        """
+        The stats stream ended on its own (e.g., the container stopped).
+        """
+        if not self.running:
+            self.status.close()
+        self.show_message("Container stats ended.")
+
+    def cancel_commands(self):
+        """
+        Cancel the commands that are running (the shell is not touched).
+        """
+        for future, (executor, name, _) in self.running.items():
+            if not future.cancel():
+                executor.cancel()
+        self.status.show("Cancelling...")
 
-    def clean(self, string_input):
-        string_input = re.sub(
-            r"[^a-zA-Z0-9%s\n\r\w ]" % string.punctuation, "", string_input
+    def save_latency(self):
+        """
+        Save latency histograms of the session, if we have any.
+        """
+        summary = self.latency.summary()
+        if not summary:
+            return
+        paks.utils.mkdir_p(paks.defaults.latency_dir)
+        filename = os.path.join(
+            paks.defaults.latency_dir, "%s.json" % self.uri.extended_name
         )
-        return string_input.replace("\x1b", "")
+        paks.utils.write_json(summary, filename)
+        logger.debug("Latency histograms saved to %s" % filename)
 
-    def welcome(self, openpty):
+    def get_recorder(self, cmd):
+        """
+        Get a session recorder, if asked to record.
+        """
+        if not self.record:
+            return
+        path = self.record
+        if path is True:
+            path = os.path.join(
+                paks.defaults.recordings_dir, "%s.cast.gz" % self.uri.extended_name
+            )
+        size = shutil.get_terminal_size()
+        env = {"SHELL": cmd[-1], "TERM": os.environ.get("TERM")}
+        recorder = paks.backends.recorder.SessionRecorder(
+            path, width=size.columns, height=size.lines, env=env
+        )
+        logger.debug("Recording session to %s" % path)
+        return recorder.open()
+
+    def welcome(self):
         """
         Welcome the user and clear terminal
         """
         # Don't add commands executed to history
-        os.write(openpty, self.encode(" export PROMPT_COMMAND='history -a'\r"))
-        os.write(openpty, self.encode(" clear\r"))
-        os.write(openpty, self.encode(" ### Welcome to PAKS! ###\r"))
+        self.proxy.write(self.encode(" export PROMPT_COMMAND='history -a'\r"))
+        if self.agent and self.agent.env_file:
+            trap = paks.backends.agent.get_trap(self.agent.env_file)
+            self.proxy.write(self.encode(" %s\r" % trap))
+        self.proxy.write(self.encode(" clear\r"))
+        self.proxy.write(self.encode(" ### Welcome to PAKS! ###\r"))
 
     def _interactive_command(self, cmd):
         """
@@ -190,68 +384,345 @@ class ContainerTechnology:
             universal_newlines=True,
         )
 
+        # The child has its copy, closing ours lets us see when it goes away
+        os.close(opentty)
+        self.recorder = self.get_recorder(cmd)
+
+        # Output can skip paks entirely if nothing needs to look at it
+        self.passthrough = bool(
+            self.settings.output_passthrough
+            and not self.recorder
+            and not self.settings.output_frame_rate
+        )
+        self.proxy = paks.backends.proxy.PtyProxy(
+            p,
+            openpty,
+            on_input=self.on_input,
+            on_output=self.on_output,
+            recorder=self.recorder,
+            passthrough=self.passthrough,
+        )
+
+        # Time keystrokes to their echo, and paks commands
+        self.latency = paks.backends.latency.LatencyTracker()
+
+        # Talk to the container with a helper agent instead of typing
+        self.agent = None
+        if self.settings.helper_agent:
+            self.agent = paks.backends.agent.HelperAgent(
+                self.commands.command,
+                self.uri.extended_name,
+                exports=cmd[-1].endswith("bash"),
+            )
+
         # Welcome to Paks!
-        self.welcome(openpty)
-        string_input = ""
-
-        while p.poll() is None:
-            r, w, e = select.select([sys.stdin, openpty], [], [])
-            if sys.stdin in r:
-                terminal_input = os.read(sys.stdin.fileno(), 10240)
-                new_char = terminal_input.decode("utf-8")
-
-                # if we have a backspace (ord 127)
-                if len(new_char) == 1 and ord(new_char) == 127:
-
-                    # Backspace to empty line
-                    if len(string_input) > 0:
-                        string_input = string_input[:-1]
-                    if not string_input:
-                        os.write(openpty, terminal_input)
-                        continue
-                else:
-                    string_input = string_input + new_char
-
-                # Get rid of left/right
-                string_input = string_input.replace("[D", "").replace("[C", "")
-                has_newline = "\n" in string_input or "\r" in string_input
-
-                # Replace weird characters and escape sequences
-                string_input = self.clean(string_input)
-
-                # Universal exit command
-                if "exit" in string_input and has_newline:
-                    print("\n\rContainer exited.\n\r")
-                    return self.uri.extended_name
-
-                # Pressing up or down, but not enter
-                if ("[A" in string_input or "[B" in string_input) and not has_newline:
-                    string_input = self.get_history(string_input, openpty)
-                    os.write(openpty, terminal_input)
-                    continue
+        self.welcome()
+        self.parser = paks.backends.vt.VtParser()
+        self.flush_scheduled = False
+        self.editor = paks.backends.editor.LineEditor()
+        self.history_index = 0
+        self.history.sync(force=True)
+        self.search = None
+
+        # Container data for commands, kept until the engine says it changed,
+        # the state of paks containers (from the same events), and the
+        # writable layers we watch for #size
+        self.cache = paks.backends.cache.MetadataCache()
+        self.model = paks.backends.model.SessionModel()
+        self.sizes = paks.backends.size.LayerSizes()
+        self.events = paks.backends.cache.EventWatcher(
+            self.commands.command,
+            {"label": [paks.backends.model.managed_label], "type": ["container"]},
+            self.on_engine_event,
+            engine=self.engine,
+            on_end=self.model.disconnected,
+        ).start()
+
+        # Commands run on workers, and report on a status line
+        self.workers = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.settings.command_workers or 1
+        )
+        self.status = paks.backends.status.StatusArea(self.proxy)
+        self.running = {}
+
+        # Resource use of the container, shown on the status line with #stats
+        self.stats = paks.backends.stats.StatsMonitor(
+            self.commands.command,
+            self.uri.extended_name,
+            lambda summary: self.proxy.call_soon_threadsafe(self.show_stats, summary),
+            engine=self.engine,
+            on_end=lambda: self.proxy.call_soon_threadsafe(self.stats_ended),
+        )
+
+        # Tell the user when the engine stops answering (commands fail fast)
+        self.breaker = paks.backends.breaker.get_breaker(self.commands.command)
+        self.breaker.notify = lambda message: self.proxy.call_soon_threadsafe(
+            self.show_message, message
+        )
+        self.last_line = bytearray()
+
+        # What commands type into the shell waits for the user's line to be empty
+        self.injected = bytearray()
+
+        # The line being typed, and lines to save once we know they were echoed
+        self.typed_line = paks.backends.search.TypedLine()
+        self.unsaved = []
+
+        # Ask the terminal to mark pastes, and track if the shell wants them too.
+        # With passthrough the shell's own requests go straight to the terminal
+        self.shell_paste = self.passthrough
+        self.shell_prompts = False
+        if not self.passthrough:
+            self.proxy.echo(paks.backends.vt.paste_on)
+
+        # Optionally send output to the terminal in frames
+        self.frames = None
+        if self.settings.output_frame_rate:
+            self.frames = paks.backends.frames.FrameCoalescer(
+                self.proxy, self.settings.output_frame_rate
+            )
 
-                # Pressing up or down with enter
-                if ("[A" in string_input or "[B" in string_input) and has_newline:
-                    string_input = self.get_history(string_input, openpty)
-                    os.write(openpty, terminal_input)
+        # Keep output that scrolls by, to search with #grep
+        self.scrollback = None
+        if self.settings.scrollback_size and not self.passthrough:
+            self.scrollback = paks.backends.scrollback.Scrollback(
+                int(self.settings.scrollback_size * 1024 * 1024)
+            )
 
-                if not string_input:
+        # Show typed characters before their echo on slow engines
+        predict = self.settings.predict_echo or "never"
+        self.predictor = paks.backends.predict.EchoPredictor(
+            self.proxy, self.latency, "never" if self.passthrough else predict
+        )
+
+        # How much the container grew is told from its size when we attach
+        self.measure_size()
+        try:
+            return self.proxy.run()
+        finally:
+            for executor, _, _ in self.running.values():
+                executor.cancel()
+            self.workers.shutdown(wait=False)
+            self.stats.stop()
+            self.breaker.notify = None
+            self.status.close()
+            if self.agent:
+                self.agent.close()
+            self.events.stop()
+            self.sizes.close()
+            self.save_latency()
+            if self.frames:
+                self.frames.write()
+            if not self.passthrough:
+                self.proxy.echo(paks.backends.vt.paste_off)
+            self.proxy.drain()
+            os.close(openpty)
+            if self.recorder:
+                self.recorder.close()
+
+    def on_output(self, data):
+        """
+        Handle raw output from the container, showing it on the terminal.
+        """
+        self.latency.output(data)
+        self.typed_line.output(data)
+        if self.unsaved:
+            self.save_echoed(data)
+        if self.scrollback:
+            self.scrollback.feed(data)
+
+        # Keep the line on screen, to put back after showing messages above it
+        end = data.rfind(b"\n") + 1
+        if end:
+            self.last_line.clear()
+        self.last_line += data[end:]
+        del self.last_line[:-1024]
+        data = self.predictor.output(data)
+        if not data:
+            return
+
+        # Shells like bash turn bracketed paste on and off around commands
+        if b"\x1b[?2004" in data:
+            on = data.rfind(paks.backends.vt.paste_on)
+            off = data.rfind(paks.backends.vt.paste_off)
+            if on != off:
+                self.shell_paste = on > off
+                self.shell_prompts = True
+        if self.frames:
+            return self.frames.feed(data)
+        self.proxy.echo(data)
+
+    def on_input(self, terminal_input):
+        """
+        Handle raw input from the user terminal, forwarding to the container.
+
+        Input is parsed into events (keeping state across reads) and bytes
+        are forwarded as they come, except that a submitted line is checked
+        for paks commands before its newline reaches the shell.
+        """
+        if not terminal_input:
+            return
+        self.latency.typed(terminal_input)
+        self.on_events(self.parser.feed(terminal_input))
+
+        # A lone ESC (or a sequence cut short) goes on if nothing follows soon
+        if self.parser.pending and not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.proxy.call_later(paks.backends.vt.escape_timeout, self.flush_input)
+
+    def flush_input(self):
+        """
+        Stop waiting for the rest of an escape sequence.
+        """
+        self.flush_scheduled = False
+        if self.parser.pending:
+            self.on_events(self.parser.flush())
+
+    def on_events(self, events):
+        """
+        Handle terminal events, forwarding their bytes to the container.
+        """
+        forward = bytearray()
+        for event in events:
+            kind = event.kind
+
+            # Reverse search gets keys until it is done
+            if self.search:
+                done = self.search.handle(event)
+                if not done:
+                    continue
+                event = self.on_search(event, *done)
+                if event is None:
                     continue
+                kind = event.kind
+
+            # A paste goes to the shell as is, with the markers if it wants them
+            if (
+                kind == paks.backends.vt.PASTE_START
+                or kind == paks.backends.vt.PASTE_END
+            ):
+                if self.shell_paste:
+                    forward += event.raw
+                continue
+
+            # Ctrl-C stops paks commands if any are running, not the shell
+            if self.running and kind == paks.backends.vt.CONTROL and event.value == 3:
+                self.cancel_commands()
+                continue
+
+            # Any other key (e.g., a newline or moving the cursor) ends the
+            # epoch of echo predictions
+            if kind != paks.backends.vt.PRINT:
+                self.predictor.reset()
+            if kind not in (paks.backends.vt.PRINT, paks.backends.vt.PASTE):
+                self.typed_line.stop()
+
+            handled = self.editor.handle(event)
+            if not handled:
+                forward += event.raw
+                if kind in (paks.backends.vt.PRINT, paks.backends.vt.PASTE):
+                    self.typed_line.typed(event.raw)
+                if kind == paks.backends.vt.PRINT:
+                    pending = self.frames and self.frames.pending
+                    self.predictor.typed(event.raw, self.editor, not pending)
+                continue
+            action, line = handled
+
+            # Pressing up or down moves through history (the shell gets it too)
+            if action == "up":
+                self.editor.set(self.get_history(self.history_index + 1))
+                forward += event.raw
+                continue
+            if action == "down":
+                self.history_index = max(self.history_index - 1, 0)
+                self.editor.set(self.get_history(self.history_index))
+                forward += event.raw
+                continue
+
+            # Everything before the newline (or search key) goes to the shell first
+            self.proxy.write(forward)
+            forward = bytearray()
+
+            # Reverse search is handled here, not by the shell
+            if action == "search":
+                self.search = paks.backends.search.HistorySearch(
+                    self.search_index, self.proxy.echo
+                )
+                self.search.start()
+                continue
+
+            forward += event.raw
+            self.history_index = 0
+            typed, self.typed_line = self.typed_line, paks.backends.search.TypedLine()
+            typed.submit()
+            if not line:
+                continue
+            self.history.add(line)
+            if self.should_save(line):
+                self.unsaved.append((line, typed))
+                self.save_echoed()
+            line = line.strip()
+
+            # What the shell runs can change the size (without an event)
+            if not line.startswith("#"):
+                self.cache.invalidate(self.uri.extended_name, ["size"])
+
+            # Universal exit command
+            if line == "exit" or line.startswith("exit "):
+                self.proxy.echo(b"\n\rContainer exited.\n\r")
+                return self.proxy.stop(self.uri.extended_name)
+
+            # If we have a newline (and possibly a command)
+            self.run_executor(line)
+        self.proxy.write(forward)
+        self.flush_injected()
+
+    def should_save(self, line):
+        """
+        Should a line be saved in the history file on the host?
 
-                # If we have a newline (and possibly a command)
-                if has_newline:
-                    self.run_executor(string_input, openpty)
+        Only lines typed at the shell's prompt (when it marks it by asking
+        for bracketed paste, like bash does) are, and once the terminal
+        echoed them (see save_echoed). Like HISTCONTROL=ignorespace, a
+        leading space keeps a line out of it.
+        """
+        if line.startswith(" "):
+            return False
+        return self.shell_paste or not self.shell_prompts
 
-                    # Add derived line to the history
-                    os.write(openpty, terminal_input)
-                    string_input = ""
-                else:
-                    os.write(openpty, terminal_input)
+    def save_echoed(self, data=None):
+        """
+        Save the submitted lines that were echoed, dropping those that weren't.
+        """
+        unsaved = []
+        for line, typed in self.unsaved:
+            if data:
+                typed.output(data)
+            if typed.echoed:
+                self.search_index.save(line)
+            elif not typed.ended:
+                unsaved.append((line, typed))
+        self.unsaved = unsaved
+
+    def on_search(self, event, action, match, again):
+        """
+        A reverse search ended with event: put the match on the line.
 
-            elif openpty in r:
-                o = os.read(openpty, 10240)
-                if o:
-                    os.write(sys.stdout.fileno(), o)
+        Returns an event to handle as usual (the key that ended the search,
+        or a newline to run the match), or None.
+        """
+        self.search = None
+
+        # Replace whatever is on the shell line with the match
+        if match:
+            if self.editor.line:
+                self.proxy.write(b"\x05\x15")
+            self.proxy.write(self.encode(match))
+            self.editor.set(match)
+        if action == "run":
+            return paks.backends.vt.Event(paks.backends.vt.CONTROL, 0x0D, b"\r")
+        if again:
+            return event
 
     def __str__(self):
         return str(self.__class__.__name__)
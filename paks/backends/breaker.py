@@ -0,0 +1,189 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.logger import logger
+import paks.backends.engine
+import subprocess
+import threading
+import socket
+import math
+import time
+
+# Timeouts in a row before we stop sending work to the engine, and seconds we
+# wait before trying it again (doubling while it still doesn't answer)
+failure_threshold = 3
+backoff_base = 2
+backoff_max = 120
+
+# Seconds an engine command may take (by its subcommand), before it is killed.
+# A command we stream is killed after this long without output instead
+budgets = {
+    "inspect": 15,
+    "exec": 15,
+    "image": 15,
+    "container": 60,
+    "stop": 30,
+    "rmi": 60,
+    "cp": 300,
+    "commit": 600,
+    "build": 1800,
+}
+default_budget = 60
+
+# Operations that take longer the more data they move, so a large one running
+# over its budget doesn't count against the engine
+data_bound = ("cp", "commit", "build")
+
+# Errors that mean the engine took too long (a CLI command, or an API request)
+timeouts = (subprocess.TimeoutExpired, socket.timeout)
+
+
+class EngineUnavailable(Exception):
+    """
+    The engine didn't answer in time, or we are giving it a rest.
+    """
+
+
+def get_budget(cmd):
+    """
+    Get the seconds a command to the engine (e.g., docker inspect) may take.
+    """
+    return budgets.get(cmd[1] if len(cmd) > 1 else None, default_budget)
+
+
+def counted(cmd):
+    """
+    Should a command running over its budget count against the engine?
+    """
+    return not (len(cmd) > 1 and cmd[1] in data_bound)
+
+
+class CircuitBreaker:
+    """
+    Stop sending work to an engine that doesn't answer.
+
+    Calls that time out are failures (unless they aren't counted, like a
+    large copy that is slow because of its size), and after failure_threshold
+    of them in a row the circuit opens: calls fail right away (saying when we will
+    try again) instead of each waiting out its budget on a hung engine.
+    Once the backoff has passed one call is let through, and if it is
+    answered the circuit closes, otherwise it opens for twice as long.
+    notify is called with a message when the circuit opens or closes.
+    """
+
+    def __init__(self, name, notify=None):
+        self.name = name
+        self.notify = notify
+        self.failures = 0
+        self.opened = 0
+        self.retry_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def closed(self):
+        return self.retry_at is None
+
+    def check(self):
+        """
+        Raise EngineUnavailable if a call shouldn't be made now.
+        """
+        with self.lock:
+            if self.retry_at is None:
+                return
+            wait = self.retry_at - time.monotonic()
+            if wait <= 0 and not self.probing:
+                self.probing = True
+                return
+        if wait <= 0:
+            raise EngineUnavailable("%s is not responding, checking on it." % self.name)
+        raise EngineUnavailable(
+            "%s is not responding, trying again in %ds." % (self.name, math.ceil(wait))
+        )
+
+    def success(self):
+        with self.lock:
+            recovered = self.retry_at is not None
+            self.failures = self.opened = 0
+            self.retry_at = None
+            self.probing = False
+        if recovered:
+            self.tell("%s is responding again." % self.name)
+
+    def failure(self):
+        """
+        Count a call that timed out, opening the circuit if it's time.
+        """
+        with self.lock:
+            self.failures += 1
+            if not self.probing and self.failures < failure_threshold:
+                return
+            delay = min(backoff_max, backoff_base * 2**self.opened)
+            self.opened += 1
+            self.retry_at = time.monotonic() + delay
+            self.probing = False
+        self.tell(
+            "%s is not responding, paks commands will wait %ds before trying it again."
+            % (self.name, delay)
+        )
+
+    def release(self):
+        """
+        A call ended without telling us if the engine is well (e.g., it failed
+        to connect), so another can be let through.
+        """
+        with self.lock:
+            self.probing = False
+
+    def timed_out(self, counted=True):
+        """
+        A call timed out, which is a failure if it's counted.
+        """
+        if counted:
+            self.failure()
+        else:
+            self.release()
+
+    def call(self, func, *args, counted=True, **kwargs):
+        """
+        Make a call to the engine, raising EngineUnavailable if it times out.
+        """
+        self.check()
+        try:
+            result = func(*args, **kwargs)
+        except timeouts as e:
+            self.timed_out(counted)
+            message = (
+                "%s did not answer in time."
+                if counted
+                else "%s did not finish in time."
+            )
+            raise EngineUnavailable(message % self.name) from e
+
+        # An error from the engine is still an answer
+        except paks.backends.engine.EngineError:
+            self.success()
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.success()
+        return result
+
+    def tell(self, message):
+        logger.debug(message)
+        if self.notify:
+            self.notify(message)
+
+
+# One breaker for each engine, shared by the commands and threads of a session
+breakers = {}
+breakers_lock = threading.Lock()
+
+
+def get_breaker(tech):
+    with breakers_lock:
+        if tech not in breakers:
+            breakers[tech] = CircuitBreaker(tech)
+        return breakers[tech]
@@ -0,0 +1,189 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.logger import logger
+import paks.backends.engine
+import concurrent.futures
+import subprocess
+import socket
+import threading
+import json
+import time
+
+# Seconds each kind of data is kept. Events clear it sooner, but the size
+# also changes with what is run in the container (which has no events)
+default_ttls = {"inspect": 300, "size": 30}
+
+# Seconds before watching events again after the stream ends (doubling while
+# it keeps ending without events, up to retry_max)
+retry_interval = 10
+retry_max = 300
+
+
+class MetadataCache:
+    """
+    Data about containers (e.g., inspect and size), kept for a while.
+
+    Entries are kept per (container, kind) until their ttl runs out, or
+    they are invalidated (by an engine event, or when the shell runs a
+    command). If a value is being fetched when another thread asks for
+    it, that thread waits for the same fetch instead of starting its own,
+    and a fetch that finished after an invalidation is not kept.
+    """
+
+    def __init__(self, ttls=None):
+        self.ttls = ttls or default_ttls
+        self.entries = {}
+        self.pending = {}
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def get(self, container, kind, fetch, keep=None):
+        """
+        Get a value from the cache, or by calling fetch.
+
+        keep(value) can say if a fetched value should be kept (e.g., not a
+        failure). Exceptions from fetch are raised to every caller waiting.
+        """
+        key = (container, kind)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+            future = self.pending.get(key)
+            if future:
+                fetching = False
+            else:
+                fetching = True
+                future = self.pending[key] = concurrent.futures.Future()
+                generation = self.generations.get(key, 0)
+
+        if not fetching:
+            return future.result()
+        try:
+            value = fetch()
+        except BaseException as e:
+            with self.lock:
+                del self.pending[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            del self.pending[key]
+            fresh = self.generations.get(key, 0) == generation
+            if fresh and (keep is None or keep(value)):
+                self.entries[key] = (time.monotonic() + self.ttls[kind], value)
+        future.set_result(value)
+        return value
+
+    def invalidate(self, container, kinds=None):
+        """
+        Forget data about a container (of some kinds, or all).
+        """
+        with self.lock:
+            for kind in kinds or self.ttls:
+                key = (container, kind)
+                self.generations[key] = self.generations.get(key, 0) + 1
+                self.entries.pop(key, None)
+
+
+class EventWatcher:
+    """
+    Watch engine events (matching filters), calling on_event for each.
+
+    Events come from the engine API when we have a client, otherwise from
+    one long running "events" command. The stream is watched in a daemon
+    thread, and opened again if it ends while the session goes on (after
+    calling on_end, since events may have been missed), backing off while
+    the engine isn't giving us any. Stopping ends the stream (the API
+    connection or the command) too.
+    """
+
+    def __init__(self, tech, filters, on_event, engine=None, on_end=None):
+        self.tech = tech
+        self.filters = filters
+        self.on_event = on_event
+        self.on_end = on_end
+        self.engine = engine
+        self.process = None
+        self.conn = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.watch, daemon=True)
+        self.thread.start()
+        return self
+
+    def watch(self):
+        delay = retry_interval
+        while not self.stopped.is_set():
+            try:
+                for event in self.events():
+                    if self.stopped.is_set():
+                        return
+                    delay = retry_interval
+                    self.on_event(event)
+            except (
+                paks.backends.engine.EngineError,
+                ValueError,
+            ) + paks.backends.engine.unavailable as e:
+                logger.debug("Event stream for %s ended: %s" % (self.tech, e))
+            if self.stopped.is_set():
+                return
+            if self.on_end:
+                self.on_end()
+            self.stopped.wait(delay)
+            delay = min(retry_max, delay * 2)
+
+    def events(self):
+        """
+        Yield events (as dicts).
+        """
+        if self.engine:
+            yield from self.engine.events(self.filters, opened=self.opened)
+            return
+
+        cmd = [self.tech, "events", "--format", "{{json .}}"]
+        for key, values in self.filters.items():
+            for value in values:
+                cmd += ["--filter", "%s=%s" % (key, value)]
+        self.process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+        if self.stopped.is_set():
+            self.process.terminate()
+        for line in self.process.stdout:
+            if line.strip():
+                yield json.loads(line)
+        self.process.wait()
+
+    def opened(self, conn):
+        self.conn = conn
+        if self.stopped.is_set():
+            self.close_stream()
+
+    def close_stream(self):
+        """
+        Shut down the API connection, so a read waiting on it returns.
+        """
+        conn = self.conn
+        if conn and conn.sock:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stop(self):
+        """
+        Stop watching, ending the events stream.
+        """
+        self.stopped.set()
+        self.close_stream()
+        process = self.process
+        if process and process.poll() is None:
+            process.terminate()
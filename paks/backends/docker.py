@@ -5,6 +5,9 @@ __license__ = "Apache-2.0"
 from paks.logger import logger
 import paks.commands
 from .base import ContainerTechnology, ContainerName
+import paks.backends.breaker
+import paks.backends.engine
+import paks.backends.model
 import paks.utils
 
 import subprocess
@@ -26,9 +29,11 @@ class DockerContainer(ContainerTechnology):
         super(DockerContainer, self).__init__(settings)
         self.image = image
         self.uri = ContainerName(self.add_registry(image))
-        self.commands = paks.commands.DockerCommands("docker")
+        self.commands = paks.commands.DockerCommands(self.command)
+        if self.settings.engine_api:
+            self.engine = paks.backends.engine.get_client(self.command)
 
-    def run(self, shell):
+    def run(self, shell, record=None):
         """
         Interactive shell into a container image.
         """
@@ -39,15 +44,42 @@ class DockerContainer(ContainerTechnology):
             "--rm",
             "--name",
             self.uri.extended_name,
+            "--label",
+            "%s=true" % paks.backends.model.managed_label,
             self.image,
             shell,
         ]
-        name = self.interactive_command(cmd)
+        name = self.interactive_command(cmd, record=record)
+
+        # Events may have told us why a session went wrong
+        state = self.model.get(self.uri.extended_name)
+        if state and state.oom_kills:
+            logger.warning(
+                "%s ran out of memory during the session: %s"
+                % (self.uri.extended_name, state.summary())
+            )
 
         # Remove the temporary container.
         if name:
-            p = subprocess.Popen([self.command, "stop", name])
-            p.wait()
+            self.stop(name)
+
+    def stop(self, name):
+        """
+        Stop a container, with the engine API if we can.
+        """
+        if self.engine:
+            try:
+                return self.engine.stop_container(name)
+            except paks.backends.engine.EngineError as e:
+                return logger.warning("Could not stop %s: %s" % (name, e))
+            except paks.backends.engine.unavailable as e:
+                logger.debug("Engine API failed, using %s: %s" % (self.command, e))
+        p = subprocess.Popen([self.command, "stop", name])
+        try:
+            p.wait(timeout=paks.backends.breaker.get_budget([self.command, "stop"]))
+        except subprocess.TimeoutExpired:
+            p.kill()
+            logger.warning("%s did not stop %s in time." % (self.command, name))
 
     def add_registry(self, uri):
         """
@@ -0,0 +1,203 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from .vt import PRINT, CONTROL, CSI, SS3, PASTE
+
+# The longest line we keep track of (longer lines can't be paks commands)
+max_length = 8192
+
+
+class LineEditor:
+    """
+    Keep track of the line the user is typing, from terminal events.
+
+    The line is stored as a gap buffer (bytes left of the cursor, and bytes
+    right of the cursor in reverse) so typing, deleting and moving the
+    cursor are constant work per character. Keys come in as events from a
+    VtParser, so escape sequences and characters are already whole.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit or max_length
+        self.left = bytearray()
+        self.right = bytearray()
+        self.overflow = False
+
+        # Control characters handled in the ground state
+        self.controls = {
+            0x01: self.home,  # Ctrl-A
+            0x02: self.backward,  # Ctrl-B
+            0x03: self.clear,  # Ctrl-C
+            0x04: self.delete,  # Ctrl-D
+            0x05: self.end,  # Ctrl-E
+            0x06: self.forward,  # Ctrl-F
+            0x08: self.backspace,  # Ctrl-H
+            0x0A: self.submit,  # Newline
+            0x0B: self.kill_forward,  # Ctrl-K
+            0x0D: self.submit,  # Enter
+            0x0E: self.down,  # Ctrl-N
+            0x10: self.up,  # Ctrl-P
+            0x12: self.search,  # Ctrl-R
+            0x15: self.kill_backward,  # Ctrl-U
+            0x17: self.kill_word,  # Ctrl-W
+            0x7F: self.backspace,
+        }
+
+        # Final bytes of CSI / SS3 sequences (cursor keys and friends)
+        self.finals = {
+            0x41: self.up,  # A
+            0x42: self.down,  # B
+            0x43: self.forward,  # C
+            0x44: self.backward,  # D
+            0x46: self.end,  # F
+            0x48: self.home,  # H
+        }
+
+        # Parameters of CSI ... ~ sequences
+        self.tilde = {
+            b"1": self.home,
+            b"3": self.delete,
+            b"4": self.end,
+            b"7": self.home,
+            b"8": self.end,
+        }
+
+    @property
+    def line(self):
+        """
+        The current line as a string.
+        """
+        return (self.left + self.right[::-1]).decode("utf-8", errors="replace")
+
+    @property
+    def cursor(self):
+        return len(self.left)
+
+    def set(self, line):
+        """
+        Replace the line (e.g., with an entry from history)
+        """
+        self.left = bytearray(line.encode("utf-8")[: self.limit])
+        self.right = bytearray()
+        self.overflow = False
+
+    def paste(self, data):
+        """
+        Add pasted bytes to the line without looking at them.
+
+        Only text after the last newline is kept, since anything before it
+        has already been handed to the shell.
+        """
+        newline = max(data.rfind(b"\n"), data.rfind(b"\r"))
+        if newline != -1:
+            self.clear()
+            data = data[newline + 1 :]
+        room = self.limit - len(self.left) - len(self.right)
+        if len(data) > room:
+            self.overflow = True
+            data = data[:room]
+        self.left += data
+
+    def handle(self, event):
+        """
+        Update the line for an event from the parser.
+
+        Returns None, or a tuple (name, value) for events that are not
+        just editing: "up" and "down" for history navigation, "search" for
+        a reverse history search, and "submit" (with the line, or None if
+        it was too long) for a newline.
+        """
+        kind, value = event.kind, event.value
+        action = None
+        if kind == PRINT:
+            self.insert(value)
+        elif kind == CONTROL:
+            action = self.controls.get(value)
+        elif kind == CSI or kind == SS3:
+            params, final = value
+            if final == 0x7E:
+                action = self.tilde.get(params)
+            else:
+                action = self.finals.get(final)
+        elif kind == PASTE:
+            self.paste(value)
+        if action:
+            return action()
+
+    # Editing
+
+    def insert(self, text):
+        room = self.limit - len(self.left) - len(self.right)
+        if len(text) > room:
+            self.overflow = True
+            return
+        self.left += text
+
+    def backspace(self):
+        while self.left:
+            byte = self.left.pop()
+
+            # Remove a whole utf-8 character, not just its last byte
+            if byte & 0xC0 != 0x80:
+                break
+
+    def delete(self):
+        while self.right:
+            self.right.pop()
+            if not self.right or self.right[-1] & 0xC0 != 0x80:
+                break
+
+    def backward(self):
+        while self.left:
+            byte = self.left.pop()
+            self.right.append(byte)
+            if byte & 0xC0 != 0x80:
+                break
+
+    def forward(self):
+        while self.right:
+            self.left.append(self.right.pop())
+            if not self.right or self.right[-1] & 0xC0 != 0x80:
+                break
+
+    def home(self):
+        self.right += self.left[::-1]
+        self.left.clear()
+
+    def end(self):
+        self.left += self.right[::-1]
+        self.right.clear()
+
+    def kill_backward(self):
+        self.left.clear()
+
+    def kill_forward(self):
+        self.right.clear()
+
+    def kill_word(self):
+        while self.left and self.left[-1] == 0x20:
+            self.left.pop()
+        while self.left and self.left[-1] != 0x20:
+            self.left.pop()
+
+    def clear(self):
+        self.left.clear()
+        self.right.clear()
+        self.overflow = False
+
+    # Events
+
+    def up(self):
+        return "up", None
+
+    def down(self):
+        return "down", None
+
+    def search(self):
+        return "search", None
+
+    def submit(self):
+        line = None if self.overflow else self.line
+        self.clear()
+        return "submit", line
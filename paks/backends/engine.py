@@ -0,0 +1,467 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.logger import logger
+import urllib.parse
+import http.client
+import threading
+import codecs
+import base64
+import socket
+import json
+import re
+import os
+import paks.backends.breaker
+
+# Default sockets of the engines we can talk to (rootless podman is per user)
+sockets = {"docker": "/var/run/docker.sock", "podman": "/run/podman/podman.sock"}
+
+# Environment variables that can point us to a socket instead
+hosts = {"docker": "DOCKER_HOST", "podman": "CONTAINER_HOST"}
+
+# The libpod API version asked for if the engine doesn't tell us
+libpod_version = "4.0.0"
+
+# Idle keep-alive connections kept open, and the requests that may use one
+# (a reused connection can fail after the engine got the request, so it is
+# sent again, and a POST like a commit must not happen twice)
+pool_size = 4
+reuse_methods = ("GET", "HEAD", "PUT", "DELETE")
+
+# Seconds to wait for a response to a lookup, to other requests, and between
+# the progress messages of a build (events and stats can be quiet for long).
+# Operations that answer only once done (commit, copy) get their budgets
+quick_timeout = 10
+default_timeout = 60
+build_timeout = 300
+
+# Whitespace between json documents in a stream
+whitespace = re.compile(r"\s*")
+
+# Errors that mean the engine can't be reached (so use the CLI)
+unavailable = (OSError, http.client.HTTPException)
+
+# Errors connecting to the engine (nothing was sent)
+unreachable = (FileNotFoundError, ConnectionRefusedError, PermissionError)
+
+
+class EngineError(Exception):
+    """
+    The engine answered a request with an error.
+    """
+
+    def __init__(self, status, message):
+        self.status = status
+        self.message = message
+        super().__init__(message)
+
+
+class UnixConnection(http.client.HTTPConnection):
+    """
+    An HTTP connection over a unix socket.
+    """
+
+    def __init__(self, socket_path, timeout=default_timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class EngineClient:
+    """
+    A client for the Docker Engine API over its unix socket.
+
+    Connections are kept alive and reused from a small pool, so a request
+    costs a round trip on an open socket instead of starting the CLI.
+    Responses are decoded from json, and long running operations (like a
+    build) are streamed, decoding each progress message as it arrives.
+    Requests raise EngineError when the engine returns an error, or the
+    errors in unavailable when it can't be reached.
+    """
+
+    # Put before API paths (e.g., to ask for a version)
+    prefix = ""
+
+    def __init__(self, socket_path, size=pool_size):
+        self.socket_path = socket_path
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def connection(self, reuse=True):
+        """
+        Get an idle connection (and True), or a new one.
+        """
+        with self.lock:
+            if reuse and self.idle:
+                return self.idle.pop(), True
+        return UnixConnection(self.socket_path), False
+
+    def release(self, conn, response):
+        """
+        Return a connection to the pool once its response is read.
+        """
+        with self.lock:
+            if not response.will_close and len(self.idle) < self.size:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+    def send(self, method, path, params=None, body=None, headers=None, timeout=None):
+        """
+        Send a request, returning the connection and response.
+
+        An idle connection the engine has closed fails on first use, so
+        the request is sent again once on a new connection (from the start
+        of body, if it is a file). Only requests in reuse_methods are sent
+        on idle connections.
+        """
+        url = path
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        while True:
+            if hasattr(body, "seek"):
+                body.seek(0)
+            conn, reused = self.connection(method in reuse_methods)
+            conn.timeout = timeout
+            if conn.sock:
+                conn.sock.settimeout(timeout)
+            try:
+                conn.request(method, url, body=body, headers=headers or {})
+                return conn, conn.getresponse()
+            except (ConnectionError, http.client.BadStatusLine):
+                conn.close()
+                if not reused:
+                    raise
+
+    def request(self, method, path, params=None, body=None, headers=None, timeout=None):
+        """
+        Make a request and return the decoded response.
+        """
+        conn, response = self.send(
+            method, path, params, body, headers, timeout=timeout or default_timeout
+        )
+        try:
+            data = response.read()
+        except unavailable:
+            conn.close()
+            raise
+        self.release(conn, response)
+        if response.status >= 400:
+            raise self.get_error(response, data)
+        if data and response.getheader("Content-Type", "").startswith(
+            "application/json"
+        ):
+            return json.loads(data)
+        return data
+
+    def stream(
+        self,
+        method,
+        path,
+        params=None,
+        body=None,
+        headers=None,
+        timeout=None,
+        opened=None,
+    ):
+        """
+        Make a request, yielding each json document of the response as it comes.
+
+        opened (if given) is called with the connection once the response
+        starts, so another thread can shut it down to end the stream.
+        """
+        conn, response = self.send(method, path, params, body, headers, timeout)
+        if opened:
+            opened(conn)
+        done = False
+        try:
+            if response.status >= 400:
+                data = response.read()
+                done = True
+                raise self.get_error(response, data)
+
+            decoder = json.JSONDecoder()
+            utf8 = codecs.getincrementaldecoder("utf-8")("replace")
+            text = ""
+            while True:
+                data = response.read1(65536)
+                if not data:
+                    break
+                text += utf8.decode(data)
+                start = 0
+                while True:
+                    start = whitespace.match(text, start).end()
+                    if start == len(text):
+                        break
+                    try:
+                        message, start = decoder.raw_decode(text, start)
+                    except ValueError:
+                        break
+                    yield message
+                text = text[start:]
+            done = True
+
+        # A stream we stopped reading early can't be reused
+        finally:
+            if done:
+                self.release(conn, response)
+            else:
+                conn.close()
+
+    def get_error(self, response, data):
+        try:
+            message = json.loads(data)["message"]
+        except (ValueError, KeyError, TypeError):
+            message = data.decode("utf-8", "replace").strip() or response.reason
+        return EngineError(response.status, message)
+
+    def quote(self, name):
+        return urllib.parse.quote(name, safe="/:@")
+
+    def ping(self):
+        return self.request("GET", "/_ping", timeout=quick_timeout) == b"OK"
+
+    def inspect_container(self, name, size=False):
+        """
+        Get the inspect document of a container (with its size, if asked).
+        """
+        params = {"size": 1} if size else None
+        return self.request(
+            "GET",
+            self.prefix + "/containers/%s/json" % self.quote(name),
+            params=params,
+            timeout=default_timeout if size else quick_timeout,
+        )
+
+    def inspect_image(self, name):
+        return self.request(
+            "GET",
+            self.prefix + "/images/%s/json" % self.quote(name),
+            timeout=quick_timeout,
+        )
+
+    def commit(self, container, repository):
+        """
+        Commit a container to a new image.
+        """
+        params = {"container": container, "repo": repository}
+        return self.request(
+            "POST",
+            self.prefix + "/commit",
+            params=params,
+            timeout=paks.backends.breaker.budgets["commit"],
+        )
+
+    def build(self, context, tag, squash=False):
+        """
+        Build an image from a tar context, yielding progress messages.
+        """
+        params = {"t": tag, "rm": 1}
+        if squash:
+            params["squash"] = 1
+        headers = {"Content-Type": "application/x-tar"}
+        return self.stream(
+            "POST",
+            self.prefix + "/build",
+            params,
+            body=context,
+            headers=headers,
+            timeout=build_timeout,
+        )
+
+    def remove_image(self, name, force=False):
+        params = {"force": 1} if force else None
+        return self.request(
+            "DELETE", self.prefix + "/images/%s" % self.quote(name), params=params
+        )
+
+    def prune_images(self):
+        """
+        Remove dangling (untagged) images.
+        """
+        params = {"filters": json.dumps({"dangling": ["true"]})}
+        return self.request("POST", self.prefix + "/images/prune", params=params)
+
+    def stop_container(self, name):
+        return self.request(
+            "POST", self.prefix + "/containers/%s/stop" % self.quote(name)
+        )
+
+    def stat_path(self, name, path):
+        """
+        Get what is at a path in a container (mode, size...), or None.
+        """
+        conn, response = self.send(
+            "HEAD",
+            self.prefix + "/containers/%s/archive" % self.quote(name),
+            {"path": path},
+            timeout=quick_timeout,
+        )
+        response.read()
+        self.release(conn, response)
+        if response.status == 404:
+            return
+        if response.status >= 400:
+            raise EngineError(response.status, response.reason)
+        try:
+            return json.loads(
+                base64.b64decode(response.getheader("X-Docker-Container-Path-Stat"))
+            )
+        except (TypeError, ValueError):
+            return {}
+
+    def put_archive(self, name, path, archive, size):
+        """
+        Extract a tar archive (a file object of size bytes) at a path in a container.
+        """
+        headers = {"Content-Type": "application/x-tar", "Content-Length": str(size)}
+        return self.request(
+            "PUT",
+            self.prefix + "/containers/%s/archive" % self.quote(name),
+            {"path": path},
+            body=archive,
+            headers=headers,
+            timeout=paks.backends.breaker.budgets["cp"],
+        )
+
+    def events(self, filters=None, opened=None):
+        """
+        Yield engine events as they happen (this doesn't end on its own).
+        """
+        params = {"filters": json.dumps(filters)} if filters else None
+        return self.stream("GET", self.prefix + "/events", params, opened=opened)
+
+    def stats(self, name):
+        """
+        Yield resource use samples of a container as they come (each second).
+        """
+        return self.stream(
+            "GET",
+            self.prefix + "/containers/%s/stats" % self.quote(name),
+            {"stream": 1},
+        )
+
+
+class LibpodClient(EngineClient):
+    """
+    A client for the podman (libpod) API.
+
+    Requests are the same as for Docker (under /libpod, for the version
+    the engine gives on ping), and podman can also mount a container's
+    filesystem for us.
+    """
+
+    def ping(self):
+        conn, response = self.send("GET", "/libpod/_ping", timeout=quick_timeout)
+        data = response.read()
+        self.release(conn, response)
+        version = response.getheader("Libpod-API-Version") or libpod_version
+        self.prefix = "/v%s/libpod" % version
+        return data == b"OK"
+
+    def mount_container(self, name):
+        """
+        Mount the filesystem of a container, returning where it is.
+        """
+        return self.request(
+            "POST", self.prefix + "/containers/%s/mount" % self.quote(name)
+        )
+
+    def unmount_container(self, name):
+        return self.request(
+            "POST", self.prefix + "/containers/%s/unmount" % self.quote(name)
+        )
+
+    def stats(self, name):
+        """
+        Yield stats samples in Docker's format (libpod's own endpoint differs).
+        """
+        return self.stream(
+            "GET", "/containers/%s/stats" % self.quote(name), {"stream": 1}
+        )
+
+
+# Clients for each container technology
+clients = {"docker": EngineClient, "podman": LibpodClient}
+
+
+def get_socket(tech):
+    """
+    Find the API socket for a container technology, if it has one.
+    """
+    if tech not in sockets:
+        return
+    host = os.environ.get(hosts[tech])
+    if host:
+        return host[len("unix://") :] if host.startswith("unix://") else None
+
+    # Rootless podman listens in the user's runtime directory
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if tech == "podman" and runtime_dir and os.getuid() != 0:
+        return os.path.join(runtime_dir, "podman", "podman.sock")
+    return sockets[tech]
+
+
+def get_client(tech):
+    """
+    Get an engine client if the API can be reached, otherwise None (use the CLI).
+    """
+    path = get_socket(tech)
+    if not path or not os.path.exists(path):
+        return
+    client = clients[tech](path)
+    try:
+        client.ping()
+    except (EngineError,) + unavailable as e:
+        logger.debug("Engine API at %s is not available: %s" % (path, e))
+        return
+    return client
+
+
+def human_size(size):
+    """
+    Format a size in bytes like the docker CLI does (e.g., 12.3kB).
+    """
+    units = ["B", "kB", "MB", "GB", "TB", "PB"]
+    size = float(size)
+    unit = 0
+    while size >= 1000 and unit < len(units) - 1:
+        size /= 1000
+        unit += 1
+    return "%.3g%s" % (size, units[unit])
+
+
+def tree_size(path):
+    """
+    Add up the size of the files under a path, like the engines do for SizeRw.
+
+    Hard links are counted once. Raises OSError if part of the tree can't
+    be read, since the total would be wrong.
+    """
+    total = 0
+    seen = set()
+
+    def error(e):
+        raise e
+
+    for root, dirs, files in os.walk(path, onerror=error):
+        for name in files:
+            st = os.lstat(os.path.join(root, name))
+            if st.st_nlink > 1:
+                if st.st_ino in seen:
+                    continue
+                seen.add(st.st_ino)
+            total += st.st_size
+    return total
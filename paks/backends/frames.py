@@ -0,0 +1,82 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+import shutil
+import time
+
+# Past this much pending output we stop waiting for the next frame
+max_pending = 1024 * 1024
+
+
+class FrameCoalescer:
+    """
+    Send container output to the terminal in frames, at most rate per second.
+
+    Output that arrives between frames is joined into one write. When more
+    than a screen of plain lines is waiting (the container is writing faster
+    than the terminal can show it) the lines that would scroll off the
+    screen within the same frame are skipped, much like mosh only sends the
+    latest screen. Lines with escape sequences are never skipped, since they
+    can change terminal state that later output depends on.
+    """
+
+    def __init__(self, proxy, rate):
+        self.proxy = proxy
+        self.interval = 1.0 / rate
+        self.pending = bytearray()
+        self.scheduled = False
+        self.last = 0
+
+    def feed(self, data):
+        """
+        Add output for the next frame.
+        """
+        self.pending += data
+        if len(self.pending) > max_pending:
+            self.collapse()
+            if len(self.pending) > max_pending:
+                return self.write()
+        if not self.scheduled:
+            self.scheduled = True
+            delay = max(0, self.last + self.interval - time.monotonic())
+            self.proxy.call_later(delay, self.flush)
+
+    def collapse(self):
+        """
+        Drop plain lines that would scroll past the screen in this frame.
+        """
+        rows = shutil.get_terminal_size().lines
+
+        # Find the start of the last screen of lines
+        cut = len(self.pending)
+        for _ in range(rows):
+            cut = self.pending.rfind(b"\n", 0, cut)
+            if cut <= 0:
+                return
+
+        # Only skip lines before the first one with an escape sequence
+        escape = self.pending.find(b"\x1b", 0, cut)
+        if escape != -1:
+            cut = self.pending.rfind(b"\n", 0, escape)
+            if cut <= 0:
+                return
+        del self.pending[: cut + 1]
+
+    def flush(self):
+        """
+        Write a frame to the terminal, unless it hasn't taken the last one.
+        """
+        if self.proxy.to_terminal:
+            return self.proxy.call_later(self.interval, self.flush)
+        self.scheduled = False
+        self.last = time.monotonic()
+        self.write()
+
+    def write(self):
+        if not self.pending:
+            return
+        self.collapse()
+        data = bytes(self.pending)
+        self.pending.clear()
+        self.proxy.echo(data)
@@ -0,0 +1,125 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from collections import deque
+import threading
+import time
+
+# Default number of lines to keep, and seconds between syncs
+default_size = 1000
+default_interval = 5
+
+
+class SessionHistory:
+    """
+    A ring buffer of history lines kept on the host.
+
+    Lines the user submits are added as they are typed. Every so often (and
+    never on a keypress) the container history file is read from where we
+    last stopped, which confirms those lines and adds anything we could not
+    see from the keystrokes alone. A line is only written once its command
+    finishes, so lines not yet in the file are kept until a line typed
+    after them is confirmed (the shell chose not to keep those). Like the shell
+    with HISTCONTROL=ignoreboth, lines starting with a space and a line
+    repeating the one before it are not kept.
+    """
+
+    def __init__(self, sync=None, size=None, interval=None):
+        self.lines = deque(maxlen=size or default_size)
+
+        # Lines typed this session not yet seen in the history file
+        self.pending = deque(maxlen=self.lines.maxlen)
+
+        # sync(offset) returns new content of the history file after offset
+        self.sync_func = sync
+        self.interval = default_interval if interval is None else interval
+        self.offset = 0
+        self.last_sync = 0
+        self.lock = threading.Lock()
+        self.syncing = False
+
+    def __len__(self):
+        return len(self.lines)
+
+    def get(self, index):
+        """
+        Get the line index steps back (1 is the most recent)
+        """
+        with self.lock:
+            if index <= 0 or index > len(self.lines):
+                return None
+            return self.lines[-index]
+
+    def add(self, line):
+        """
+        Add a submitted line.
+        """
+        # Like the shell, lines starting with a space are not kept
+        if not line or line.startswith(" "):
+            return
+        line = line.rstrip()
+        with self.lock:
+            if self.lines and self.lines[-1] == line:
+                return
+            self.lines.append(line)
+            self.pending.append(line)
+        self.sync()
+
+    def sync(self, force=False):
+        """
+        Read new history from the container in the background, if it's time.
+        """
+        if not self.sync_func or self.syncing:
+            return
+        if not force and time.time() - self.last_sync < self.interval:
+            return
+        self.syncing = True
+        self.last_sync = time.time()
+        threading.Thread(target=self._sync, daemon=True).start()
+
+    def _sync(self):
+        try:
+            content = self.sync_func(self.offset)
+        except Exception:
+            content = None
+        finally:
+            self.syncing = False
+        if content:
+            self.update(content)
+
+    def update(self, content):
+        """
+        Merge new content from the history file.
+        """
+        # Only consume complete lines, a partial one is read next time
+        end = content.rfind("\n")
+        if end == -1:
+            return
+        content = content[: end + 1]
+        self.offset += len(content.encode("utf-8"))
+
+        with self.lock:
+            for _ in range(min(len(self.pending), len(self.lines))):
+                self.lines.pop()
+
+            for line in content.split("\n"):
+                if not line:
+                    continue
+
+                # A line we already have from the keystrokes is now confirmed,
+                # and any typed before it the shell chose not to keep
+                if line in self.pending:
+                    while self.pending.popleft() != line:
+                        pass
+                if not self.lines or self.lines[-1] != line:
+                    self.lines.append(line)
+
+            # Lines the file doesn't have yet (e.g., a command still running)
+            # go back on the end
+            pending, self.pending = self.pending, deque(maxlen=self.lines.maxlen)
+            for line in pending:
+                if self.lines and self.lines[-1] == line:
+                    continue
+                self.lines.append(line)
+                self.pending.append(line)
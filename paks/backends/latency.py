@@ -0,0 +1,167 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from collections import deque
+from array import array
+import time
+
+# Values are kept in microseconds with 2^sub_bits buckets per power of two
+# (under 1% error) up to 2^max_bits microseconds (about 19 hours)
+sub_bits = 7
+max_bits = 36
+
+# Keystrokes waiting for their echo, and how long we wait for one
+max_pending = 64
+echo_timeout = 5.0
+
+
+class Histogram:
+    """
+    A log-linear (HDR style) histogram of durations.
+
+    Counts live in a single array of unsigned 64-bit integers. Values below
+    2^sub_bits microseconds each have their own bucket, and every power of
+    two above that is split into 2^(sub_bits - 1) buckets, so recording is
+    constant time and the relative error is bounded.
+    """
+
+    sub_count = 1 << sub_bits
+    half_count = 1 << (sub_bits - 1)
+
+    def __init__(self):
+        size = self.sub_count + (max_bits - sub_bits) * self.half_count
+        self.counts = array("Q", bytes(8 * size))
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def index(self, value):
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - sub_bits
+        return (
+            self.sub_count
+            + (shift - 1) * self.half_count
+            + (value >> shift)
+            - self.half_count
+        )
+
+    def value(self, index):
+        """
+        The highest value counted in a bucket.
+        """
+        if index < self.sub_count:
+            return index
+        shift, offset = divmod(index - self.sub_count, self.half_count)
+        shift += 1
+        return ((offset + self.half_count + 1) << shift) - 1
+
+    def record(self, seconds):
+        """
+        Record a duration in seconds.
+        """
+        value = min(int(seconds * 1000000), (1 << max_bits) - 1)
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def percentile(self, percent):
+        """
+        The value (in microseconds) at or below which percent of values fall.
+        """
+        if not self.count:
+            return 0
+        target = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.value(index), self.max)
+        return self.max
+
+    def summary(self):
+        """
+        Summary statistics, in milliseconds.
+        """
+        if not self.count:
+            return {"count": 0}
+        summary = {
+            "count": self.count,
+            "min": self.min / 1000,
+            "mean": self.total / self.count / 1000,
+            "max": self.max / 1000,
+        }
+        for percent in 50, 90, 99:
+            summary["p%s" % percent] = self.percentile(percent) / 1000
+        return summary
+
+
+class LatencyTracker:
+    """
+    Time keystrokes until their echo, and paks commands until they finish.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.pending = deque(maxlen=max_pending)
+
+        # Smoothed echo time in seconds (like TCP's srtt)
+        self.srtt = None
+
+    def get(self, name):
+        if name not in self.histograms:
+            self.histograms[name] = Histogram()
+        return self.histograms[name]
+
+    def record(self, name, seconds):
+        self.get(name).record(seconds)
+
+    def typed(self, data):
+        """
+        A keystroke was read from the terminal.
+        """
+        if len(data) == 1 and 0x20 <= data[0] < 0x7F:
+            self.pending.append((time.monotonic(), data))
+
+    def output(self, data):
+        """
+        Output was read from the container, and may hold the echo.
+        """
+        now = time.monotonic()
+        while self.pending:
+            sent, key = self.pending[0]
+            if now - sent > echo_timeout:
+                self.pending.popleft()
+                continue
+            if key not in data:
+                break
+            self.pending.popleft()
+            sample = now - sent
+            self.record("keystroke", sample)
+            if self.srtt is None:
+                self.srtt = sample
+            else:
+                self.srtt = 0.875 * self.srtt + 0.125 * sample
+
+    def summary(self):
+        return {name: hist.summary() for name, hist in self.histograms.items()}
+
+    def table(self):
+        """
+        A text table of the summary, one row per histogram.
+        """
+        columns = ["count", "p50", "p90", "p99", "max"]
+        rows = ["%-20s" % "latency (ms)" + "".join("%10s" % c for c in columns)]
+        for name, summary in sorted(self.summary().items()):
+            row = "%-20s" % name[:20]
+            for column in columns:
+                value = summary.get(column, "")
+                if isinstance(value, float):
+                    value = "%.2f" % value
+                row += "%10s" % value
+            rows.append(row)
+        return rows
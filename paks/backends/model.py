@@ -0,0 +1,169 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+import threading
+import time
+
+# Containers started by paks have this label, so we only watch those
+managed_label = "paks.managed"
+
+# Events that change the state of a container
+states = {
+    "create": "created",
+    "start": "running",
+    "restart": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "die": "exited",
+    "destroy": "removed",
+    "remove": "removed",
+}
+
+
+def parse_event(event):
+    """
+    Get (name, action, attributes) from an engine event.
+
+    The API (and docker events) give an Actor with attributes, podman
+    events from the CLI give them at the top level.
+    """
+    actor = event.get("Actor") or {}
+    attributes = dict(actor.get("Attributes") or event.get("Attributes") or {})
+    name = attributes.get("name") or event.get("Name")
+    action = event.get("Action") or event.get("Status") or event.get("status") or ""
+
+    # Docker gives the health in the action (health_status: healthy)
+    if action.startswith("health_status"):
+        action, _, health = action.partition(":")
+        attributes["health"] = health.strip() or event.get("health_status")
+    if "image" not in attributes and (event.get("from") or event.get("Image")):
+        attributes["image"] = event.get("from") or event.get("Image")
+    if "exitCode" not in attributes and "ContainerExitCode" in event:
+        attributes["exitCode"] = event["ContainerExitCode"]
+    return name, action.strip(), attributes
+
+
+class ContainerState:
+    """
+    What we know about a container: its state, health and troubles.
+
+    A state is synced when it was read from the engine (inspect), and kept
+    up to date by events after that.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.state = None
+        self.health = None
+        self.image = None
+        self.exit_code = None
+        self.oom_kills = 0
+        self.restarts = 0
+        self.image_changes = 0
+        self.synced = False
+        self.updated = None
+
+    def set_image(self, image):
+        if image and self.image and image != self.image:
+            self.image_changes += 1
+        self.image = image or self.image
+
+    def summary(self):
+        """
+        Describe the state in a line.
+        """
+        parts = [self.state or "unknown"]
+        if self.health:
+            parts.append(self.health)
+        if self.state == "exited" and self.exit_code is not None:
+            parts.append("exit code %s" % self.exit_code)
+        parts.append(
+            "%s OOM kill%s" % (self.oom_kills, "" if self.oom_kills == 1 else "s")
+        )
+        parts.append(
+            "%s restart%s" % (self.restarts, "" if self.restarts == 1 else "s")
+        )
+        if self.image:
+            parts.append("image %s" % self.image)
+        if self.image_changes:
+            parts.append("image changed %s times" % self.image_changes)
+        return ", ".join(parts)
+
+
+class SessionModel:
+    """
+    The state of paks containers, kept up to date with engine events.
+
+    Events are applied in the event thread, and read from commands and
+    the session, so changes are made under a lock. When the event stream
+    ends (e.g., the engine restarted) we may have missed events, so states
+    are no longer synced until they are read again.
+    """
+
+    def __init__(self):
+        self.containers = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        return self.containers.get(name)
+
+    def update(self, event):
+        """
+        Apply an event, returning the container state, the action, and a
+        notice if something happened that the user should hear about.
+        """
+        name, action, attributes = parse_event(event)
+        if not name:
+            return None, action, None
+
+        notice = None
+        with self.lock:
+            state = self.containers.setdefault(name, ContainerState(name))
+            state.updated = time.time()
+            before = state.image_changes
+            state.set_image(attributes.get("image"))
+            if state.image_changes != before:
+                notice = "Container image is now %s." % state.image
+
+            if action in states:
+                state.state = states[action]
+            if action == "die":
+                state.exit_code = attributes.get("exitCode")
+            elif action == "oom":
+                state.oom_kills += 1
+                notice = "Container ran out of memory, a process was killed."
+            elif action == "restart":
+                state.restarts += 1
+                notice = "Container was restarted."
+            elif action == "health_status" and attributes.get("health"):
+                if state.health != attributes["health"]:
+                    notice = "Container is %s." % attributes["health"]
+                state.health = attributes["health"]
+        return state, action, notice
+
+    def sync(self, name, info):
+        """
+        Set the state of a container from its inspect document.
+        """
+        current = info.get("State") or {}
+        with self.lock:
+            state = self.containers.setdefault(name, ContainerState(name))
+            state.state = current.get("Status") or state.state
+            state.exit_code = current.get("ExitCode")
+            state.health = (current.get("Health") or {}).get("Status") or None
+            if current.get("OOMKilled"):
+                state.oom_kills = max(state.oom_kills, 1)
+            state.restarts = max(state.restarts, info.get("RestartCount") or 0)
+            state.set_image((info.get("Config") or {}).get("Image"))
+            state.synced = True
+            state.updated = time.time()
+        return state
+
+    def disconnected(self):
+        """
+        The event stream ended, so what we know may be out of date.
+        """
+        with self.lock:
+            for state in self.containers.values():
+                state.synced = False
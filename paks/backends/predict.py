@@ -0,0 +1,155 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+import time
+import re
+
+# Keystrokes we know how to predict (printable ascii)
+printable = re.compile(b"[\\x20-\\x7e]+")
+
+# Adaptive mode predicts when the smoothed echo time is above this (seconds)
+threshold = 0.03
+
+# Predictions not echoed within this many smoothed echo times are taken back
+expire_factor = 4
+expire_min = 0.05
+
+# Output that switches to and from the alternate screen (vim, less, etc.)
+alternate_screen = re.compile(b"\\x1b\\[\\?(?:1049|1047|47)([hl])")
+
+# Output that moves the cursor or redraws the line (e.g., a new prompt)
+moves_cursor = re.compile(b"[\\r\\n\\b\\x1b]")
+
+
+class EchoPredictor:
+    """
+    Show typed characters before the container echoes them back.
+
+    Predictions are only made for printable characters typed at the end of
+    the line the editor is tracking. When output comes back that starts
+    with what we predicted it's already on the screen, so it is dropped.
+    Anything else takes the predictions back (backspace over them and clear
+    the line) before showing the real output. In adaptive mode predictions
+    start once the echo time measured by the latency tracker is slow
+    enough to notice.
+
+    Like mosh, predictions are made in epochs. Any other key (a newline,
+    moving the cursor) and output that moves the cursor (a new prompt)
+    end the epoch, and the next one doesn't show anything until the echo
+    of a character typed in it came back. So what is typed at a prompt
+    that doesn't echo (a password) is never shown.
+    """
+
+    def __init__(self, proxy, latency, mode="adaptive"):
+        self.proxy = proxy
+        self.latency = latency
+        self.mode = mode
+        self.pending = b""
+        self.pending_since = None
+        self.tentative = b""
+        self.confirmed = False
+        self.alternate = False
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def active(self):
+        if self.mode == "always":
+            return True
+        return self.mode == "adaptive" and (self.latency.srtt or 0) > threshold
+
+    @property
+    def expire(self):
+        return max(expire_min, expire_factor * (self.latency.srtt or 0))
+
+    def reset(self):
+        """
+        Start a new epoch: nothing is shown until an echo is confirmed.
+        """
+        self.confirmed = False
+        self.tentative = b""
+
+    def typed(self, data, editor, allowed=True):
+        """
+        Called with keystrokes on their way to the container.
+        """
+        if not printable.fullmatch(data):
+            return self.reset()
+        if (
+            not allowed
+            or not self.active
+            or self.alternate
+            or editor.right
+            or editor.overflow
+        ):
+            return self.reset()
+
+        # Wait for the container to echo something of this epoch first
+        if not self.confirmed:
+            self.tentative += data
+            return
+        if not self.pending:
+            self.pending_since = time.monotonic()
+            self.proxy.call_later(self.expire, self.check_expired)
+        self.pending += data
+        self.proxy.echo(data)
+
+    def output(self, data):
+        """
+        Reconcile output from the container, returning what to show.
+        """
+        # Full screen programs draw wherever they like, so we don't predict
+        if b"\x1b[?" in data:
+            for match in alternate_screen.finditer(data):
+                self.alternate = match.group(1) == b"h"
+
+        # The echo of a character typed in this epoch confirms it
+        if self.tentative:
+            if self.tentative.startswith(data) or data.startswith(self.tentative):
+                self.confirmed = not moves_cursor.search(data)
+            self.tentative = b""
+            return data
+
+        if not self.pending:
+            if moves_cursor.search(data):
+                self.reset()
+            return data
+
+        # The echo of some (or all) of what we predicted is already shown
+        if self.pending.startswith(data):
+            self.pending = self.pending[len(data) :]
+            self.hits += 1
+            return b""
+        if data.startswith(self.pending):
+            data = data[len(self.pending) :]
+            self.pending = b""
+            self.hits += 1
+            if moves_cursor.search(data):
+                self.reset()
+            return data
+
+        self.misses += 1
+        self.reset()
+        return self.take_back() + data
+
+    def take_back(self):
+        """
+        Remove predictions from the screen, returning the bytes to do it.
+        """
+        erase = b"\b" * len(self.pending) + b"\x1b[K" if self.pending else b""
+        self.pending = b""
+        self.pending_since = None
+        return erase
+
+    def check_expired(self):
+        """
+        The echo didn't come back in time, so stop showing predictions.
+        """
+        if not self.pending:
+            return
+        wait = self.pending_since + self.expire - time.monotonic()
+        if wait > 0:
+            return self.proxy.call_later(wait, self.check_expired)
+        self.reset()
+        self.proxy.echo(self.take_back())
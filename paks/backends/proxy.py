@@ -0,0 +1,485 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from collections import deque
+import itertools
+import selectors
+import heapq
+import time
+import signal
+import fcntl
+import errno
+import sys
+import os
+
+# Read size for a single wakeup of either direction
+chunk_size = 65536
+
+# Stop reading container output when this much is waiting for the terminal
+high_water = 4 * chunk_size
+
+
+class PtyProxy:
+    """
+    Shuttle bytes between the user terminal and the pseudo-terminal of a
+    container process.
+
+    The loop is event driven (epoll on Linux) and all descriptors are non
+    blocking. Each direction has its own output buffer so partial writes
+    and EAGAIN never lose data, and keystrokes going to the container are
+    always handled before bulk output coming back from it.
+
+    With passthrough (Linux) container output is not read at all: it is
+    spliced from the pseudo-terminal into a pipe and from the pipe to the
+    terminal inside the kernel, so on_output is not called. If the kernel
+    can't splice these descriptors we go back to reading.
+    """
+
+    def __init__(
+        self,
+        process,
+        openpty,
+        stdin=None,
+        stdout=None,
+        on_input=None,
+        on_output=None,
+        recorder=None,
+        passthrough=False,
+    ):
+        self.process = process
+        self.fd = openpty
+        self.stdin = stdin if stdin is not None else sys.stdin.fileno()
+        self.stdout = stdout if stdout is not None else sys.stdout.fileno()
+
+        # Called with raw bytes from the user, forwards with self.write
+        self.on_input = on_input or self.write
+
+        # Called with raw bytes from the container, shows with self.echo
+        self.on_output = on_output or self.echo
+
+        # Optionally tee raw bytes in both directions (a SessionRecorder)
+        self.recorder = recorder
+
+        # Splice output to the terminal, and bytes waiting in the pipe
+        self.passthrough = passthrough and hasattr(os, "splice")
+        self.piped = 0
+        self._pipe = None
+
+        # Bytes waiting for the container, and for the user terminal
+        self.to_pty = bytearray()
+        self.to_terminal = bytearray()
+
+        # Callbacks to run later, a heap of (when, count, callback)
+        self.timers = []
+        self._count = itertools.count()
+
+        # Callbacks from other threads, and the pipe that wakes the loop for them
+        self.calls = deque()
+        self._wake = None
+
+        self.selector = None
+        self.running = False
+        self.result = None
+        self._flags = {}
+        self._interest = {}
+        self._exit_fd = None
+        self._wakeup = None
+
+    def write(self, data):
+        """
+        Queue bytes to send to the container.
+        """
+        self.to_pty += data
+        if self.running:
+            self._flush_pty()
+
+    def echo(self, data):
+        """
+        Queue bytes to show on the user terminal.
+        """
+        self.to_terminal += data
+        if self.running:
+            self._flush_terminal()
+
+    def call_later(self, delay, callback):
+        """
+        Run a callback from the loop after delay seconds.
+        """
+        when = time.monotonic() + delay
+        heapq.heappush(self.timers, (when, next(self._count), callback))
+
+    def call_soon_threadsafe(self, callback, *args):
+        """
+        Run a callback from the loop, from any thread.
+        """
+        self.calls.append((callback, args))
+        try:
+            os.write(self._wake[1], b"\0")
+        except (TypeError, OSError):
+            pass
+
+    def stop(self, result=None):
+        """
+        Stop the loop after the current wakeup, returning result from run.
+        """
+        self.result = result
+        self.running = False
+
+    def run(self):
+        """
+        Run the proxy until the process exits or stop is called.
+        """
+        self.selector = selectors.DefaultSelector()
+        for fd in set([self.stdin, self.stdout, self.fd]):
+            self._set_blocking(fd, False)
+        try:
+            self._open_exit_fd()
+            self._open_pipe()
+            self._wake = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+            self.selector.register(self._wake[0], selectors.EVENT_READ, "wake")
+            self.selector.register(self.stdin, selectors.EVENT_READ, "stdin")
+            if self._exit_fd is not None:
+                self.selector.register(self._exit_fd, selectors.EVENT_READ, "exit")
+            self.running = True
+            self._interest = {}
+            self._flush_pty()
+            self._loop()
+        finally:
+            self.running = False
+            self._close_exit_fd()
+            self.selector.close()
+            self._restore_blocking()
+            self.drain()
+            self._close_pipe()
+            wake, self._wake = self._wake, None
+            for fd in wake or []:
+                os.close(fd)
+        return self.result
+
+    def _loop(self):
+        """
+        Handle every ready event for each wakeup, keystrokes first.
+        """
+        while self.running:
+            events = self.selector.select(self._timeout())
+            ready = {key.data: mask for key, mask in events}
+
+            if "stdin" in ready:
+                self._read_stdin()
+                if not self.running:
+                    break
+
+            pty_mask = ready.get("pty", 0)
+            if pty_mask & selectors.EVENT_WRITE:
+                self._flush_pty()
+            if pty_mask & selectors.EVENT_READ:
+                self._read_pty()
+
+            if "stdout" in ready:
+                self._flush_terminal()
+
+            if "wake" in ready:
+                self._run_calls()
+
+            if "exit" in ready and self._exited():
+                self._finish()
+
+            # Without an exit descriptor we wake up periodically to poll
+            elif self._exit_fd is None and self.process.poll() is not None:
+                self._finish()
+
+            self._run_timers()
+
+    def _timeout(self):
+        """
+        How long to wait for events, given timers and how we detect exit.
+        """
+        timeout = None if self._exit_fd is not None else 0.5
+        if self.timers:
+            until = max(0, self.timers[0][0] - time.monotonic())
+            timeout = until if timeout is None else min(timeout, until)
+        return timeout
+
+    def _run_calls(self):
+        try:
+            while os.read(self._wake[0], 512):
+                pass
+        except BlockingIOError:
+            pass
+        while self.running and self.calls:
+            callback, args = self.calls.popleft()
+            callback(*args)
+
+    def _run_timers(self):
+        now = time.monotonic()
+        while self.running and self.timers and self.timers[0][0] <= now:
+            _, _, callback = heapq.heappop(self.timers)
+            callback()
+
+    def _read_stdin(self):
+        try:
+            data = os.read(self.stdin, chunk_size)
+        except BlockingIOError:
+            return
+
+        # The terminal hung up, nobody is left to type: end the session
+        if not data:
+            self.selector.unregister(self.stdin)
+            return self.stop(self.result)
+        if self.recorder:
+            self.recorder.input(data)
+        self.on_input(data)
+
+    def _read_pty(self):
+        if self._pipe:
+            return self._splice_pty()
+        try:
+            data = os.read(self.fd, chunk_size)
+        except BlockingIOError:
+            return
+
+        # EIO means the other side of the terminal is gone
+        except OSError as e:
+            if e.errno != errno.EIO:
+                raise
+            data = b""
+        if not data:
+            return self._finish()
+        if self.recorder:
+            self.recorder.output(data)
+        self.on_output(data)
+
+    def _exited(self):
+        """
+        A pidfd is only readable on exit, SIGCHLD can come from any child.
+        """
+        if not self._wakeup:
+            return True
+        try:
+            os.read(self._exit_fd, 512)
+        except BlockingIOError:
+            pass
+        return self.process.poll() is not None
+
+    def _finish(self):
+        """
+        The process has exited: drain what it printed and stop.
+        """
+        while True:
+            try:
+                data = os.read(self.fd, chunk_size)
+            except OSError:
+                break
+            if not data:
+                break
+            if self.recorder:
+                self.recorder.output(data)
+            self.on_output(data)
+        self.process.wait()
+        self.stop(self.result)
+
+    def _flush_pty(self):
+        self._flush(self.fd, self.to_pty)
+        self._update("pty", self.fd, self._pty_events())
+
+    def _flush_terminal(self):
+        # Spliced output is older than anything in the buffer
+        if self.piped:
+            self._flush_pipe()
+        if not self.piped:
+            self._flush(self.stdout, self.to_terminal)
+        events = selectors.EVENT_WRITE if self.to_terminal or self.piped else 0
+        self._update("stdout", self.stdout, events)
+
+        # Backpressure: stop reading output the terminal can't keep up with
+        self._update("pty", self.fd, self._pty_events())
+
+    def _flush(self, fd, buffer):
+        """
+        Write as much of a buffer as the descriptor will take right now.
+        """
+        while buffer:
+            try:
+                written = os.write(fd, buffer[:chunk_size])
+            except BlockingIOError:
+                return
+            except OSError as e:
+                if e.errno == errno.EIO:
+                    buffer.clear()
+                    return
+                raise
+            del buffer[:written]
+
+    def _pty_events(self):
+        events = 0
+
+        # Output is only spliced once everything before it was written
+        if self._pipe:
+            readable = not self.piped and not self.to_terminal
+        else:
+            readable = len(self.to_terminal) < high_water
+        if readable:
+            events |= selectors.EVENT_READ
+        if self.to_pty:
+            events |= selectors.EVENT_WRITE
+        return events
+
+    def _update(self, name, fd, events):
+        """
+        Register, modify or unregister interest in a descriptor.
+        """
+        current = self._interest.get(name, 0)
+        if not self.running or events == current:
+            return
+        if not events:
+            self.selector.unregister(fd)
+        elif current:
+            self.selector.modify(fd, events, name)
+        else:
+            self.selector.register(fd, events, name)
+        self._interest[name] = events
+
+    def _open_pipe(self):
+        """
+        Make the pipe output is spliced through, sized to hold a few reads.
+        """
+        if not self.passthrough:
+            return
+        self._pipe = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        try:
+            fcntl.fcntl(self._pipe[1], fcntl.F_SETPIPE_SZ, high_water)
+        except (AttributeError, OSError):
+            pass
+
+    def _close_pipe(self):
+        if self._pipe:
+            for fd in self._pipe:
+                os.close(fd)
+            self._pipe = None
+            self.piped = 0
+
+    def _splice_pty(self):
+        """
+        Move container output into the pipe, and on to the terminal.
+        """
+        # Anything in the buffer (e.g., a message) is older, so it goes first
+        if self.to_terminal:
+            return self._flush_terminal()
+        try:
+            moved = os.splice(
+                self.fd, self._pipe[1], chunk_size, flags=os.SPLICE_F_NONBLOCK
+            )
+        except BlockingIOError:
+            return
+        except OSError as e:
+
+            # EIO means the other side of the terminal is gone
+            if e.errno == errno.EIO:
+                moved = 0
+
+            # This kernel can't splice from a terminal: read instead
+            elif e.errno in (errno.EINVAL, errno.ENOSYS):
+                self._stop_passthrough()
+                return self._read_pty()
+            else:
+                raise
+        if not moved:
+            return self._finish()
+        self.piped += moved
+        self._flush_terminal()
+
+    def _flush_pipe(self):
+        """
+        Splice as much of the pipe to the terminal as it will take right now.
+        """
+        while self.piped:
+            try:
+                moved = os.splice(
+                    self._pipe[0], self.stdout, self.piped, flags=os.SPLICE_F_NONBLOCK
+                )
+            except BlockingIOError:
+                return
+            except OSError as e:
+                if e.errno == errno.EIO:
+                    self._stop_passthrough(keep=False)
+                    return
+                if e.errno in (errno.EINVAL, errno.ENOSYS):
+                    self._stop_passthrough()
+                    return
+                raise
+            self.piped -= moved
+
+    def _stop_passthrough(self, keep=True):
+        """
+        Go back to reading output, keeping what is in the pipe (in order).
+        """
+        if self.piped and keep:
+            self.to_terminal[:0] = os.read(self._pipe[0], self.piped)
+        self._close_pipe()
+        self.passthrough = False
+
+    def _open_exit_fd(self):
+        """
+        Get a descriptor that becomes readable when the process exits.
+
+        A pidfd is used when the platform has it, otherwise SIGCHLD wakes
+        the loop through a pipe. If neither works we fall back to polling.
+        """
+        try:
+            self._exit_fd = os.pidfd_open(self.process.pid)
+            return
+        except (AttributeError, OSError):
+            pass
+        try:
+            read_fd, write_fd = os.pipe()
+            for fd in read_fd, write_fd:
+                self._set_blocking(fd, False, remember=False)
+            previous = signal.set_wakeup_fd(write_fd)
+            handler = signal.signal(signal.SIGCHLD, lambda *args: None)
+            self._wakeup = (read_fd, write_fd, previous, handler)
+            self._exit_fd = read_fd
+        except ValueError:
+            self._exit_fd = None
+
+    def _close_exit_fd(self):
+        if self._wakeup:
+            read_fd, write_fd, previous, handler = self._wakeup
+            signal.set_wakeup_fd(previous)
+            signal.signal(signal.SIGCHLD, handler)
+            os.close(write_fd)
+            self._wakeup = None
+        if self._exit_fd is not None:
+            os.close(self._exit_fd)
+            self._exit_fd = None
+
+    def _set_blocking(self, fd, blocking, remember=True):
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        if remember:
+            self._flags.setdefault(fd, flags)
+        if blocking:
+            flags &= ~os.O_NONBLOCK
+        else:
+            flags |= os.O_NONBLOCK
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags)
+
+    def _restore_blocking(self):
+        for fd, flags in self._flags.items():
+            try:
+                fcntl.fcntl(fd, fcntl.F_SETFL, flags)
+            except OSError:
+                pass
+
+    def drain(self):
+        """
+        Write anything left for the terminal (descriptors are blocking again)
+        """
+        try:
+            while self.piped:
+                self.piped -= os.splice(self._pipe[0], self.stdout, self.piped)
+            while self.to_terminal:
+                written = os.write(self.stdout, self.to_terminal)
+                del self.to_terminal[:written]
+        except OSError:
+            self.piped = 0
+            self.to_terminal.clear()
@@ -0,0 +1,157 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from collections import deque
+import threading
+import codecs
+import json
+import gzip
+import time
+import os
+
+# How often the writer wakes up, and flushes a compressed block to disk
+write_interval = 0.2
+flush_interval = 5.0
+
+# Compression is streamed, a middle level keeps up with bulk output
+compress_level = 6
+
+# Captured bytes the writer can fall behind by before we drop (and mark) them
+max_pending = 16 * 1024 * 1024
+
+
+class SessionRecorder:
+    """
+    Record a session as an asciicast (version 2) file.
+
+    The interactive loop only appends (time, kind, bytes) to a deque, which
+    is safe to share with a single consumer without a lock. A writer thread
+    takes everything queued every write_interval, decodes and encodes the
+    events and streams them through gzip, so the live session never waits
+    on json or compression. Each side keeps its own byte count, and if the
+    writer falls more than max_pending behind new data is dropped and a
+    marker event records how much, so memory stays bounded however long
+    the session runs.
+    """
+
+    def __init__(self, path, width=80, height=24, env=None):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.env = env or {}
+        self.queue = deque()
+        self.start = None
+
+        # The loop counts captured and dropped bytes, the writer the rest
+        self.captured = 0
+        self.dropped = 0
+        self.written = 0
+        self.reported = 0
+
+        self.decoders = {}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def open(self):
+        """
+        Write the header and start the writer thread.
+        """
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        # Keystrokes are recorded (e.g., a password typed at a prompt), so
+        # only the user may read it
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+        self.file = self.fd = os.fdopen(fd, "wb")
+        if self.path.endswith(".gz"):
+            self.fd = gzip.GzipFile(
+                fileobj=self.file, mode="wb", compresslevel=compress_level
+            )
+        self.start = time.monotonic()
+        header = {
+            "version": 2,
+            "width": self.width,
+            "height": self.height,
+            "timestamp": int(time.time()),
+            "env": self.env,
+        }
+        self.fd.write(json.dumps(header).encode("utf-8") + b"\n")
+        self.thread = threading.Thread(target=self.writer, daemon=True)
+        self.thread.start()
+        return self
+
+    def output(self, data):
+        """
+        Bytes written to the terminal.
+        """
+        self.capture("o", data)
+
+    def input(self, data):
+        """
+        Bytes typed by the user.
+        """
+        self.capture("i", data)
+
+    def capture(self, kind, data):
+        if self.captured - self.written > max_pending:
+            self.dropped += len(data)
+            return
+        self.captured += len(data)
+        self.queue.append((time.monotonic(), kind, data))
+
+    def writer(self):
+        """
+        Move queued events to the file until the recorder is closed.
+        """
+        flushed = time.monotonic()
+        while not self.stopped.wait(write_interval):
+            self.write()
+            if time.monotonic() - flushed > flush_interval:
+                self.fd.flush()
+                flushed = time.monotonic()
+        self.write()
+
+    def write(self):
+        lines = []
+        while self.queue:
+            when, kind, data = self.queue.popleft()
+            self.written += len(data)
+            text = self.decode(kind, data)
+            if text:
+                lines.append(json.dumps([round(when - self.start, 6), kind, text]))
+
+            # Give the interpreter back to the session between events
+            time.sleep(0)
+
+        # Let players (and post-mortems) know there is a gap
+        dropped = self.dropped
+        if dropped > self.reported:
+            elapsed = round(time.monotonic() - self.start, 6)
+            message = "paks dropped %s bytes" % (dropped - self.reported)
+            lines.append(json.dumps([elapsed, "m", message]))
+            self.reported = dropped
+        if lines:
+            self.fd.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+    def decode(self, kind, data):
+        """
+        Decode a stream of bytes, keeping characters split across reads.
+        """
+        if kind not in self.decoders:
+            self.decoders[kind] = codecs.getincrementaldecoder("utf-8")("replace")
+        return self.decoders[kind].decode(data)
+
+    def close(self):
+        """
+        Write what is left and close the file.
+        """
+        if not self.thread:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+        self.fd.close()
+        self.file.close()
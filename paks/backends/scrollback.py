@@ -0,0 +1,125 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from collections import deque
+from array import array
+import bisect
+import re
+
+# Output is sealed into chunks of about this size once they end a line
+chunk_size = 256 * 1024
+
+# Default bytes of output to keep
+default_size = 64 * 1024 * 1024
+
+# Escape sequences (CSI, OSC and two byte) are not searched or shown
+escapes = re.compile(
+    b"\\x1b(?:\\[[0-?]*[ -/]*[@-~]|\\][^\\x07\\x1b\\n]*(?:\\x07|\\x1b\\\\)|[@-Z\\\\-_])"
+)
+newline = re.compile(b"\\n")
+
+
+class Chunk:
+    """
+    A piece of output ending with a full line.
+
+    It is cleaned of escape sequences and indexed (where each line ends)
+    the first time it is searched, and never changes after that.
+    """
+
+    def __init__(self, first, text):
+        self.first = first
+        self.text = text
+        self.size = len(text)
+        self.count = text.count(b"\n")
+        self.ends = None
+
+    def index(self):
+        if self.ends is None:
+            self.text = escapes.sub(b"", self.text).replace(b"\r", b"")
+            self.ends = array("I", [m.end() for m in newline.finditer(self.text)])
+
+    def line(self, index):
+        start = self.ends[index - 1] if index else 0
+        return self.text[start : self.ends[index] - 1]
+
+
+class Scrollback:
+    """
+    A bounded ring of container output that can be searched.
+
+    Output is appended to an open buffer. Once the buffer is past chunk_size
+    the complete lines in it are sealed into a Chunk, which only counts its
+    lines so keeping up with the container stays cheap. A search cleans and
+    indexes chunks it has not seen before (keeping the line ends, so a match
+    becomes a line and line number with a bisect) and reuses the rest, so
+    the index is brought up to date incrementally. When the chunks are over
+    size the oldest are dropped.
+    """
+
+    def __init__(self, size=default_size):
+        self.size = size
+        self.chunks = deque()
+        self.pending = bytearray()
+        self.total = 0
+        self.lines = 0
+
+    def feed(self, data):
+        """
+        Add output from the container.
+        """
+        self.pending += data
+        if len(self.pending) >= chunk_size:
+            self.seal()
+
+    def seal(self):
+        """
+        Move the complete lines waiting in the buffer to a new chunk.
+        """
+        end = self.pending.rfind(b"\n") + 1
+
+        # A very long line without a newline is cut where it is
+        if not end and len(self.pending) >= 4 * chunk_size:
+            end = len(self.pending)
+        if not end:
+            return
+        text = bytes(self.pending[:end])
+        del self.pending[:end]
+        if not text.endswith(b"\n"):
+            text += b"\n"
+
+        chunk = Chunk(self.lines, text)
+        self.chunks.append(chunk)
+        self.lines += chunk.count
+        self.total += chunk.size
+        while self.total > self.size and len(self.chunks) > 1:
+            self.total -= self.chunks.popleft().size
+
+    def grep(self, pattern, limit=100):
+        """
+        Find the most recent lines (up to limit) matching a regular expression.
+
+        Returns a list of (line number, line, match spans) from oldest to
+        newest. The line being typed (not yet ended) is not searched.
+        """
+        if isinstance(pattern, str):
+            pattern = re.compile(pattern.encode("utf-8"), re.MULTILINE)
+        self.seal()
+
+        found = []
+        for chunk in reversed(self.chunks):
+            chunk.index()
+            lines = {}
+            for match in pattern.finditer(chunk.text):
+                if match.start() == match.end() == len(chunk.text):
+                    continue
+                index = bisect.bisect_right(chunk.ends, match.start())
+                lines.setdefault(index, []).append(match.span())
+            for index in sorted(lines, reverse=True):
+                start = chunk.ends[index - 1] if index else 0
+                spans = [(s - start, e - start) for s, e in lines[index]]
+                found.append((chunk.first + index + 1, chunk.line(index), spans))
+                if len(found) >= limit:
+                    return found[::-1]
+        return found[::-1]
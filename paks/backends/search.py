@@ -0,0 +1,342 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.logger import logger
+from .vt import PRINT, CONTROL
+import paks.defaults
+import paks.utils
+
+import threading
+import shutil
+import os
+
+# Longest n-gram indexed, and deepest prefix kept in the trie
+ngram = 3
+max_depth = 32
+
+# Search prompt shown on the line under the cursor
+prompt = "(paks-search)`%s': %s"
+
+# Characters at the start of a typed line that must be echoed to save it
+echo_check = 3
+
+
+class HistoryIndex:
+    """
+    An index of history lines shared by all sessions of the same image.
+
+    Lines are stored once (a repeated line moves to the front) and indexed
+    in a prefix trie and in n-gram posting lists. Both are updated when a
+    line is added, and ids only grow, so walking a posting list backwards
+    gives the most recent matches first without any sorting.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = []
+        self.ids = {}
+        self.trie = {}
+        self.grams = {}
+        self.lock = threading.Lock()
+        self.loaded = threading.Event()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def load(self, background=True):
+        """
+        Load lines saved by previous sessions.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return self.loaded.set()
+        if background:
+            return threading.Thread(
+                target=self.load, args=(False,), daemon=True
+            ).start()
+        try:
+            with open(self.path, "r", errors="replace") as fd:
+                for line in fd:
+                    self.add(line.rstrip("\n"))
+            self.compact()
+        finally:
+            self.loaded.set()
+
+    def compact(self):
+        """
+        Rewrite the history file without duplicate lines, if worth it.
+        """
+        if len(self.entries) < 2 * len(self.ids) + 1000:
+            return
+        with self.lock:
+            lines = [x for x in self.entries if x is not None]
+        tmpfile = self.path + ".tmp"
+        with self.open(tmpfile, os.O_WRONLY | os.O_TRUNC) as fd:
+            fd.writelines(line + "\n" for line in lines)
+        os.replace(tmpfile, self.path)
+
+    def open(self, path, flags):
+        """
+        Open a history file for writing, only readable by the user.
+        """
+        fd = os.open(path, flags | os.O_CREAT, 0o600)
+        os.fchmod(fd, 0o600)
+        return os.fdopen(fd, "w")
+
+    def save(self, line):
+        """
+        Add a line and append it to the history file.
+        """
+        if not self.add(line) or not self.path:
+            return
+        try:
+            with self.open(self.path, os.O_WRONLY | os.O_APPEND) as fd:
+                fd.write(line + "\n")
+        except OSError as e:
+            logger.debug("Cannot save history to %s: %s" % (self.path, e))
+
+    def add(self, line):
+        """
+        Index a line, returning True if it was added.
+        """
+        line = line.strip()
+        if not line or "\n" in line:
+            return False
+        with self.lock:
+            previous = self.ids.get(line)
+            if previous is not None:
+                self.entries[previous] = None
+            uid = len(self.entries)
+            self.entries.append(line)
+            self.ids[line] = uid
+
+            # Every prefix (up to a depth) knows the lines under it
+            node = self.trie
+            for char in line[:max_depth]:
+                child = node.get(char)
+                if child is None:
+                    child = node[char] = {None: []}
+                child[None].append(uid)
+                node = child
+
+            grams = self.grams
+            for gram in self.get_grams(line):
+                postings = grams.get(gram)
+                if postings is None:
+                    grams[gram] = [uid]
+                else:
+                    postings.append(uid)
+        return True
+
+    def get_grams(self, text):
+        """
+        All distinct 1 to n character substrings of text.
+        """
+        grams = set(text)
+        for size in range(2, ngram + 1):
+            grams.update([text[i : i + size] for i in range(len(text) - size + 1)])
+        return grams
+
+    def candidates(self, query):
+        """
+        Ids that might match a query (oldest first), to be checked.
+        """
+        if query.startswith("^"):
+            node = self.trie
+            for char in query[1 : max_depth + 1]:
+                node = node.get(char)
+                if node is None:
+                    return []
+            return node.get(None, [])
+
+        # The rarest n-gram of the query has the shortest list to walk
+        size = min(len(query), ngram)
+        best = None
+        for start in range(len(query) - size + 1):
+            postings = self.grams.get(query[start : start + size])
+            if postings is None:
+                return []
+            if best is None or len(postings) < len(best):
+                best = postings
+        return best
+
+    def search(self, query, before=None):
+        """
+        Find the most recent line matching a query, older than id before.
+
+        A query starting with ^ matches the start of a line, anything else
+        matches anywhere in the line. Returns (id, line) or (None, None).
+        """
+        if not query or query == "^":
+            return None, None
+        prefix = query.startswith("^")
+        text = query[1:] if prefix else query
+        with self.lock:
+            postings = self.candidates(query)
+            if before is None:
+                before = len(self.entries)
+            index = len(postings) - 1
+            while index >= 0:
+                uid = postings[index]
+                index -= 1
+                if uid >= before:
+                    continue
+                line = self.entries[uid]
+                if line is None:
+                    continue
+                if (prefix and line.startswith(text)) or (not prefix and text in line):
+                    return uid, line
+        return None, None
+
+
+class TypedLine:
+    """
+    A line typed in the terminal, and if the terminal echoed it back.
+
+    The first characters typed (before any other key) must come back in
+    the output on one screen line, before the newline that ends the line
+    once it was submitted. A prompt that doesn't echo (a password) shows
+    nothing there. A line only put there by other keys (e.g., history)
+    counts as echoed.
+    """
+
+    def __init__(self):
+        self.start = bytearray()
+        self.typing = True
+        self.shown = bytearray()
+        self.submitted = False
+        self.echoed = False
+        self.ended = False
+
+    @property
+    def done(self):
+        return self.echoed or self.ended
+
+    def typed(self, data):
+        if self.typing:
+            self.start += data[: echo_check - len(self.start)]
+            self.typing = len(self.start) < echo_check
+
+    def stop(self):
+        """
+        Another key was pressed, so the start of the line is known.
+        """
+        self.typing = False
+
+    def submit(self):
+        self.typing = False
+        self.submitted = True
+        self.echoed = not self.start
+
+    def output(self, data):
+        """
+        Look for the echo in output from the container.
+        """
+        if not self.start or self.done:
+            return
+        while data:
+            part, newline, data = data.partition(b"\n")
+            self.shown += part
+            del self.shown[:-1024]
+            if self.start in self.shown:
+                self.echoed = True
+                return
+            if newline:
+                if self.submitted:
+                    self.ended = True
+                    return
+                self.shown.clear()
+
+
+def get_index(slug, persist=True):
+    """
+    Get the (not yet loaded) history index for an image.
+
+    Without persist, the index only has the lines of this session.
+    """
+    if not persist:
+        return HistoryIndex()
+    paks.utils.mkdir_p(paks.defaults.history_dir)
+    return HistoryIndex(os.path.join(paks.defaults.history_dir, slug))
+
+
+class HistorySearch:
+    """
+    A reverse incremental search over a HistoryIndex, driven by keystrokes.
+
+    The search is drawn on the line under the cursor so the shell prompt is
+    left alone. When it ends, handle returns an action: "accept" (put the
+    match on the line), "run" (put it on the line and submit it) or
+    "cancel", along with the match and if the key that ended the search
+    should still be handled (e.g., an arrow key to edit the match).
+    """
+
+    def __init__(self, index, echo):
+        self.index = index
+        self.echo = echo
+        self.raw = bytearray()
+        self.match = None
+        self.uid = None
+        self.width = shutil.get_terminal_size().columns
+
+    @property
+    def query(self):
+        return self.raw.decode("utf-8", errors="ignore")
+
+    def start(self):
+        """
+        Make room for the search line and remember the cursor.
+        """
+        self.raw.clear()
+        self.match = None
+        self.uid = None
+        self.width = shutil.get_terminal_size().columns
+        self.echo(b"\n\x1b[A\x1b7")
+        self.render()
+
+    def render(self):
+        line = prompt % (self.query, self.match or "")
+        line = line[: self.width - 1]
+        self.echo(b"\x1b8\n\r\x1b[K" + line.encode("utf-8"))
+
+    def finish(self, action, again=False):
+        self.echo(b"\x1b8\n\r\x1b[K\x1b8")
+        return action, self.match, again
+
+    def find(self, older=False):
+        """
+        Search for the query, or the next older match.
+        """
+        before = self.uid if older else None
+        uid, match = self.index.search(self.query, before)
+
+        # No (older) match, keep showing the last one
+        if uid is not None:
+            self.uid, self.match = uid, match
+        elif not older:
+            self.uid, self.match = None, None
+        self.render()
+
+    def handle(self, event):
+        """
+        Handle a key (a VtParser event), returning None until the search is done.
+        """
+        kind, value = event.kind, event.value
+        if kind == PRINT:
+            self.raw += value
+            return self.find()
+        if kind == CONTROL:
+            if value == 0x12:  # Ctrl-R
+                return self.find(older=True)
+            if value in (0x7F, 0x08):
+                while self.raw and self.raw.pop() & 0xC0 == 0x80:
+                    pass
+                return self.find()
+            if value in (0x0D, 0x0A):
+                return self.finish("run" if self.match else "cancel")
+            if value in (0x03, 0x07):  # Ctrl-C, Ctrl-G
+                self.match = None
+                return self.finish("cancel")
+
+        # Any other key (arrows, escape) keeps the match to edit it
+        return self.finish("accept" if self.match else "cancel", again=True)
@@ -0,0 +1,273 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.logger import logger
+import ctypes.util
+import threading
+import ctypes
+import struct
+import stat
+import os
+
+# inotify events we ask for (a change to a file, or to what is in a directory)
+IN_MODIFY = 0x2
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_ONLYDIR = 0x1000000
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+watch_mask = (
+    IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+)
+
+# An event is (watch, mask, cookie, length of name) and the name
+event_header = struct.Struct("iIII")
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+except (OSError, AttributeError):
+    libc = None
+
+
+class LayerSize:
+    """
+    The size of a container's writable layer, kept up to date with inotify.
+
+    The layer (e.g., the overlay upperdir) is walked once, keeping the size
+    of each file, and every directory in it is watched. Changes are read
+    (without blocking) when the size is asked for, and only the files they
+    name are looked at again, so the size costs a few stats instead of a
+    walk. If the kernel dropped events, the layer is walked again. Hard
+    links are counted once, like tree_size does.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.watches = {}
+        self.files = {}
+        self.inodes = {}
+        self.total = 0
+        self.image_size = None
+        self.lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.fd is not None
+
+    def start(self):
+        """
+        Watch the layer and add it up, returning False if we can't.
+        """
+        if not libc:
+            return False
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return False
+        self.fd = fd
+        try:
+            self.scan(self.path)
+        except OSError as e:
+            logger.debug("Cannot watch %s: %s" % (self.path, e))
+            self.close()
+            return False
+        return True
+
+    def watch(self, path):
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(path), watch_mask | IN_ONLYDIR)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self.watches[wd] = path
+
+    def scan(self, path):
+        """
+        Watch a directory (and those under it) and add up its files.
+
+        Each directory is watched before it is listed, so a file created
+        while we look is either listed or gives an event.
+        """
+
+        def error(e):
+            raise e
+
+        for root, dirs, files in os.walk(path, onerror=error):
+            self.watch(root)
+            links = [d for d in dirs if os.path.islink(os.path.join(root, d))]
+            for name in files + links:
+                self.update(os.path.join(root, name))
+
+    def update(self, path):
+        """
+        Look at a file again (it changed, appeared, or is gone).
+        """
+        self.forget(path)
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            return
+        if stat.S_ISDIR(st.st_mode):
+            return
+        self.files[path] = st.st_ino
+        entry = self.inodes.setdefault(st.st_ino, [0, 0])
+        self.total += st.st_size - entry[0]
+        entry[0] = st.st_size
+        entry[1] += 1
+
+    def forget(self, path):
+        ino = self.files.pop(path, None)
+        if ino is None:
+            return
+        entry = self.inodes[ino]
+        entry[1] -= 1
+        if not entry[1]:
+            self.total -= entry[0]
+            del self.inodes[ino]
+
+    def forget_tree(self, path):
+        """
+        Forget a directory that is gone (or moved), and stop watching it.
+        """
+        prefix = path + os.sep
+        for name in [name for name in self.files if name.startswith(prefix)]:
+            self.forget(name)
+        for wd, name in list(self.watches.items()):
+            if name == path or name.startswith(prefix):
+                libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def read_events(self):
+        """
+        Read the events waiting, as (directory, watch, mask, name).
+        """
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, size = event_header.unpack_from(data, offset)
+                offset += event_header.size
+                name = data[offset : offset + size].rstrip(b"\0")
+                offset += size
+                yield self.watches.get(wd), wd, mask, os.fsdecode(name)
+
+    def size(self):
+        """
+        Get the size of the layer now, or None if it is no longer there.
+        """
+        with self.lock:
+            if not self.active:
+                return
+            try:
+                self.apply()
+            except OSError as e:
+                logger.debug("Stopped watching %s: %s" % (self.path, e))
+                self.close()
+                return
+            return self.total
+
+    def apply(self):
+        """
+        Apply the waiting events, looking at each file they name once.
+        """
+        changed = []
+        for directory, wd, mask, name in self.read_events():
+            if mask & IN_Q_OVERFLOW:
+                changed = []
+                self.files, self.inodes, self.total = {}, {}, 0
+                self.scan(self.path)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if directory is None:
+                continue
+            if mask & IN_DELETE_SELF and directory == self.path:
+                raise OSError("the layer was removed")
+            path = os.path.join(directory, name) if name else directory
+            if mask & IN_ISDIR:
+                if mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.forget_tree(path)
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    self.scan(path)
+            elif name:
+                changed.append(path)
+        for path in dict.fromkeys(changed):
+            self.update(path)
+
+    def close(self):
+        fd, self.fd = self.fd, None
+        if fd is not None:
+            os.close(fd)
+
+
+class LayerSizes:
+    """
+    Writable layer sizes of the session's containers, and where they started.
+
+    A layer is watched from the first time its size is asked for. The
+    size each container had when the session attached (or, if it couldn't
+    be measured then, when it first was) is kept, however it was measured,
+    so we can say how much it grew in the session.
+    """
+
+    def __init__(self):
+        self.layers = {}
+        self.baselines = {}
+        self.lock = threading.Lock()
+
+    def get(self, name, path):
+        """
+        Get the watched layer of a container, or None if it can't be watched.
+        """
+        with self.lock:
+            layer = self.layers.get(name)
+            if layer and layer.path == path and layer.active:
+                return layer
+            if layer:
+                layer.close()
+            layer = LayerSize(path)
+            if not layer.start():
+                self.layers.pop(name, None)
+                return
+            self.layers[name] = layer
+            return layer
+
+    def has_baseline(self, name):
+        with self.lock:
+            return name in self.baselines
+
+    def growth(self, name, size):
+        """
+        Get how much a container grew since the session attached.
+
+        The baseline is the size measured then (see measure_size), or the
+        first one measured after, if it couldn't be.
+        """
+        with self.lock:
+            return size - self.baselines.setdefault(name, size)
+
+    def forget(self, name):
+        """
+        Stop watching a container (e.g., it was removed).
+        """
+        with self.lock:
+            layer = self.layers.pop(name, None)
+        if layer:
+            layer.close()
+
+    def close(self):
+        with self.lock:
+            layers, self.layers = self.layers, {}
+        for layer in layers.values():
+            layer.close()
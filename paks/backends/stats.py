@@ -0,0 +1,182 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.engine import human_size
+from paks.logger import logger
+import paks.backends.engine
+import subprocess
+import threading
+import time
+import re
+
+# Seconds between redraws of the stats (the engines sample about once a second)
+refresh_interval = 1.0
+
+# Fields asked of the stats command, when there is no engine client
+stats_format = "{{.CPUPerc}}|{{.MemUsage}}|{{.MemPerc}}|{{.NetIO}}|{{.BlockIO}}"
+
+# The stats command clears the screen before each sample
+escapes = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+
+
+def summarize(stats):
+    """
+    Describe a stats sample from the engine API in a line, like docker stats.
+    """
+    cpu = stats.get("cpu_stats") or {}
+    previous = stats.get("precpu_stats") or {}
+    usage = cpu.get("cpu_usage") or {}
+    cpu_delta = usage.get("total_usage", 0) - (previous.get("cpu_usage") or {}).get(
+        "total_usage", 0
+    )
+    system_delta = (cpu.get("system_cpu_usage") or 0) - (
+        previous.get("system_cpu_usage") or 0
+    )
+    online = cpu.get("online_cpus") or len(usage.get("percpu_usage") or []) or 1
+    percent = 0.0
+    if cpu_delta > 0 and system_delta > 0:
+        percent = cpu_delta / system_delta * online * 100
+
+    # Page cache that can be dropped isn't counted as used
+    memory = stats.get("memory_stats") or {}
+    used = memory.get("usage") or 0
+    details = memory.get("stats") or {}
+    for key in ["total_inactive_file", "inactive_file"]:
+        if key in details and details[key] < used:
+            used -= details[key]
+            break
+    limit = memory.get("limit") or 0
+    memory_percent = used / limit * 100 if limit else 0.0
+
+    networks = (stats.get("networks") or {}).values()
+    received = sum(network.get("rx_bytes", 0) for network in networks)
+    sent = sum(network.get("tx_bytes", 0) for network in networks)
+
+    read = written = 0
+    for entry in (stats.get("blkio_stats") or {}).get(
+        "io_service_bytes_recursive"
+    ) or []:
+        op = (entry.get("op") or "").lower()
+        if op == "read":
+            read += entry.get("value", 0)
+        elif op == "write":
+            written += entry.get("value", 0)
+
+    return "CPU %.2f%% | MEM %s / %s (%.2f%%) | NET %s / %s | BLOCK %s / %s" % (
+        percent,
+        human_size(used),
+        human_size(limit),
+        memory_percent,
+        human_size(received),
+        human_size(sent),
+        human_size(read),
+        human_size(written),
+    )
+
+
+def summarize_line(line):
+    """
+    Describe a line of stats_format output in the same way.
+    """
+    fields = escapes.sub("", line).strip().split("|")
+    if len(fields) != 5:
+        return
+    cpu, memory, memory_percent, network, block = [field.strip() for field in fields]
+    return "CPU %s | MEM %s (%s) | NET %s | BLOCK %s" % (
+        cpu,
+        memory,
+        memory_percent,
+        network,
+        block,
+    )
+
+
+class StatsMonitor:
+    """
+    Follow the resource use of a container, calling on_stats with a summary.
+
+    Samples come from one streaming stats request to the engine API when
+    we have a client (each decoded as it arrives), otherwise from one
+    long running "stats" command. They are read in a daemon thread, and
+    on_stats is called at most once per refresh_interval, and only when
+    the summary changed. When the stream ends on its own (e.g., the
+    container stopped) on_end is called.
+    """
+
+    def __init__(self, tech, container_name, on_stats, engine=None, on_end=None):
+        self.tech = tech
+        self.container_name = container_name
+        self.on_stats = on_stats
+        self.on_end = on_end
+        self.engine = engine
+        self.process = None
+        self.stopped = threading.Event()
+        self.stopped.set()
+
+    @property
+    def running(self):
+        return not self.stopped.is_set()
+
+    def start(self):
+        """
+        Start following stats (a new thread, since an old one may be ending).
+        """
+        if self.running:
+            return self
+        self.stopped = threading.Event()
+        threading.Thread(target=self.watch, args=(self.stopped,), daemon=True).start()
+        return self
+
+    def watch(self, stopped):
+        last, shown = None, 0
+        try:
+            for summary in self.samples(stopped):
+                if stopped.is_set():
+                    return
+                now = time.monotonic()
+                if summary == last or now - shown < refresh_interval:
+                    continue
+                last, shown = summary, now
+                self.on_stats(summary)
+        except (
+            paks.backends.engine.EngineError,
+            ValueError,
+        ) + paks.backends.engine.unavailable as e:
+            logger.debug("Stats for %s ended: %s" % (self.container_name, e))
+        if not stopped.is_set():
+            stopped.set()
+            if self.on_end:
+                self.on_end()
+
+    def samples(self, stopped):
+        """
+        Yield a summary of each sample.
+        """
+        if self.engine:
+            for stats in self.engine.stats(self.container_name):
+                yield summarize(stats)
+            return
+
+        process = self.process = subprocess.Popen(
+            [self.tech, "stats", "--format", stats_format, self.container_name],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+        if stopped.is_set():
+            process.terminate()
+        for line in process.stdout:
+            summary = summarize_line(line)
+            if summary:
+                yield summary
+        process.wait()
+
+    def stop(self):
+        """
+        Stop following stats (an API stream ends at its next sample).
+        """
+        self.stopped.set()
+        process = self.process
+        if process and process.poll() is None:
+            process.terminate()
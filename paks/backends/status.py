@@ -0,0 +1,60 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+import shutil
+
+
+class StatusArea:
+    """
+    A line at the bottom of the terminal for paks commands to report on.
+
+    While it is open the scrolling region of the terminal stops one row
+    short of the bottom (like apt's progress bar), so container output
+    keeps scrolling above it and the status is redrawn in place. It is
+    only drawn from the loop, with proxy.echo.
+    """
+
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.rows = None
+        self.columns = None
+        self.text = ""
+
+    @property
+    def active(self):
+        return self.rows is not None
+
+    def open(self):
+        """
+        Make room at the bottom and keep output scrolling above it.
+        """
+        size = shutil.get_terminal_size()
+        if size.lines < 3:
+            return
+        self.rows, self.columns = size.lines, size.columns
+        self.proxy.echo(b"\n\x1b7\x1b[1;%dr\x1b8\x1b[1A" % (self.rows - 1))
+
+    def show(self, text):
+        """
+        Replace the status line.
+        """
+        if not self.active:
+            self.open()
+        if not self.active:
+            return
+        self.text = " ".join(text.split())[: self.columns - 1]
+        self.proxy.echo(
+            b"\x1b7\x1b[%d;1H\x1b[2K\x1b[7m%s\x1b[0m\x1b8"
+            % (self.rows, self.text.encode("utf-8"))
+        )
+
+    def close(self):
+        """
+        Give the whole screen back to the container.
+        """
+        if not self.active:
+            return
+        self.proxy.echo(b"\x1b7\x1b[r\x1b[%d;1H\x1b[2K\x1b8" % self.rows)
+        self.rows = None
+        self.text = ""
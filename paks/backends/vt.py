@@ -0,0 +1,274 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from collections import namedtuple
+import re
+
+# Bracketed paste: turning it on and off, and the markers around a paste
+paste_on = b"\x1b[?2004h"
+paste_off = b"\x1b[?2004l"
+paste_start = b"\x1b[200~"
+paste_end = b"\x1b[201~"
+
+# Longest parameter string we accept inside a CSI sequence
+max_params = 16
+
+# Seconds to wait for the rest of a sequence (or ESC on its own) before giving up
+escape_timeout = 0.05
+
+# Kinds of events
+PRINT, CONTROL, ESC, CSI, SS3, PASTE_START, PASTE, PASTE_END = (
+    "print",
+    "control",
+    "esc",
+    "csi",
+    "ss3",
+    "paste_start",
+    "paste",
+    "paste_end",
+)
+
+# An event has a kind, a value that depends on the kind, and the raw bytes:
+#  print: the text (bytes), control: the byte, esc: the byte after ESC (or
+#  None for a lone or broken sequence), csi and ss3: (params, final byte),
+#  paste: the pasted bytes.
+Event = namedtuple("Event", ["kind", "value", "raw"])
+
+# Parser states
+GROUND, ESCAPE, CSI_PARAM, CSI_INTERMEDIATE, CSI_IGNORE, SS3_PARAM, UTF8, PASTING = (
+    range(8)
+)
+
+# Actions, looked up with the next state by (state, byte)
+(
+    A_PRINT,
+    A_EXECUTE,
+    A_START,
+    A_LEAD,
+    A_CONTINUE,
+    A_INVALID,
+    A_COLLECT,
+    A_PARAM,
+    A_CSI,
+    A_SS3,
+    A_DISPATCH,
+    A_IGNORE,
+    A_ABORT,
+) = range(13)
+
+# Runs of printable ascii and complete utf-8 characters, handled at once
+printable = re.compile(
+    b"(?:[\\x20-\\x7e]|[\\xc2-\\xdf][\\x80-\\xbf]"
+    b"|[\\xe0-\\xef][\\x80-\\xbf]{2}|[\\xf0-\\xf4][\\x80-\\xbf]{3})+"
+)
+
+
+def get_table():
+    """
+    Build the transition table: table[state][byte] is (action, next state).
+    """
+    table = [[(A_ABORT, GROUND)] * 256 for _ in range(8)]
+
+    def add(state, start, end, action, following):
+        for byte in range(start, end + 1):
+            table[state][byte] = (action, following)
+
+    # Ground: text, utf-8 characters and control keys
+    add(GROUND, 0x00, 0x1F, A_EXECUTE, GROUND)
+    add(GROUND, 0x1B, 0x1B, A_START, ESCAPE)
+    add(GROUND, 0x20, 0x7E, A_PRINT, GROUND)
+    add(GROUND, 0x7F, 0x7F, A_EXECUTE, GROUND)
+    add(GROUND, 0x80, 0xFF, A_INVALID, GROUND)
+    add(GROUND, 0xC2, 0xF4, A_LEAD, UTF8)
+
+    # The rest of a utf-8 character
+    add(UTF8, 0x80, 0xBF, A_CONTINUE, UTF8)
+
+    # After ESC: a CSI or SS3 introducer, or an alt (meta) key
+    add(ESCAPE, 0x00, 0xFF, A_DISPATCH, GROUND)
+    add(ESCAPE, 0x1B, 0x1B, A_START, ESCAPE)
+    add(ESCAPE, 0x4F, 0x4F, A_COLLECT, SS3_PARAM)
+    add(ESCAPE, 0x5B, 0x5B, A_COLLECT, CSI_PARAM)
+
+    # CSI parameters, intermediates and the final byte
+    add(CSI_PARAM, 0x20, 0x2F, A_PARAM, CSI_INTERMEDIATE)
+    add(CSI_PARAM, 0x30, 0x3F, A_PARAM, CSI_PARAM)
+    add(CSI_PARAM, 0x40, 0x7E, A_CSI, GROUND)
+    add(CSI_INTERMEDIATE, 0x20, 0x2F, A_PARAM, CSI_INTERMEDIATE)
+    add(CSI_INTERMEDIATE, 0x30, 0x3F, A_IGNORE, CSI_IGNORE)
+    add(CSI_INTERMEDIATE, 0x40, 0x7E, A_CSI, GROUND)
+    add(CSI_IGNORE, 0x20, 0x3F, A_IGNORE, CSI_IGNORE)
+    add(CSI_IGNORE, 0x40, 0x7E, A_DISPATCH, GROUND)
+
+    # SS3 (application cursor keys) can carry modifiers too
+    add(SS3_PARAM, 0x30, 0x3F, A_PARAM, SS3_PARAM)
+    add(SS3_PARAM, 0x40, 0x7E, A_SS3, GROUND)
+
+    # A new ESC in the middle of a sequence starts over
+    for state in CSI_PARAM, CSI_INTERMEDIATE, CSI_IGNORE, SS3_PARAM:
+        add(state, 0x1B, 0x1B, A_ABORT, ESCAPE)
+    return table
+
+
+table = get_table()
+
+# Bytes still to come after a utf-8 lead byte
+utf8_length = {
+    byte: 1 if byte < 0xE0 else 2 if byte < 0xF0 else 3 for byte in range(0xC2, 0xF5)
+}
+
+
+class VtParser:
+    """
+    Turn raw terminal input into events, keeping state across reads.
+
+    A transition table decides what each byte does given the current state
+    (the structure of the DEC ANSI parser, cut down to what keyboards send),
+    so escape sequences and utf-8 characters split across reads come out
+    whole. Runs of text and the body of a bracketed paste are matched in
+    one go, so each byte is looked at once. The bytes of an incomplete
+    sequence are held until it completes, or flush is called (e.g., when
+    ESC was pressed on its own).
+    """
+
+    def __init__(self):
+        self.state = GROUND
+        self.raw = bytearray()
+        self.params = bytearray()
+        self.need = 0
+        self.pasting = False
+        self.events = []
+
+    @property
+    def pending(self):
+        """
+        Bytes of an incomplete sequence or character.
+        """
+        return bytes(self.raw)
+
+    def feed(self, data):
+        """
+        Parse raw bytes, returning a list of events.
+        """
+        self.events = events = []
+        i = 0
+        end = len(data)
+        while i < end:
+            state = self.state
+
+            # Fast paths for text, and the body of a paste
+            if state == GROUND:
+                match = printable.match(data, i)
+                if match:
+                    text = match.group()
+                    events.append(Event(PRINT, text, text))
+                    i = match.end()
+                    continue
+            elif state == PASTING:
+                escape = data.find(b"\x1b", i)
+                if escape == -1:
+                    escape = end
+                if escape > i:
+                    events.append(Event(PASTE, data[i:escape], data[i:escape]))
+                    i = escape
+                    continue
+                state = GROUND
+
+            byte = data[i]
+            action, self.state = table[state][byte]
+            if action == A_ABORT:
+
+                # Let go of the broken sequence, and look at the byte again
+                self.abort()
+                if byte != 0x1B:
+                    self.state = PASTING if self.pasting else GROUND
+                    continue
+                self.raw.append(byte)
+            else:
+                self.act(action, byte)
+            if self.pasting and self.state == GROUND:
+                self.state = PASTING
+            i += 1
+        return events
+
+    def act(self, action, byte):
+        raw = self.raw
+        if action == A_PRINT or action == A_INVALID:
+            self.emit(PRINT, bytes([byte]), bytes([byte]))
+        elif action == A_EXECUTE:
+            self.emit(CONTROL, byte, bytes([byte]))
+        elif action == A_START:
+            if raw:
+                self.abort()
+            raw.append(byte)
+            self.params.clear()
+        elif action == A_LEAD:
+            raw.append(byte)
+            self.need = utf8_length[byte]
+        elif action == A_CONTINUE:
+            raw.append(byte)
+            self.need -= 1
+            if not self.need:
+                self.state = GROUND
+                self.emit(PRINT, bytes(raw), bytes(raw))
+        elif action == A_COLLECT:
+            raw.append(byte)
+        elif action == A_PARAM:
+            raw.append(byte)
+            if len(self.params) < max_params:
+                self.params.append(byte)
+            else:
+                self.state = CSI_IGNORE
+        elif action == A_IGNORE:
+            raw.append(byte)
+        elif action == A_CSI:
+            raw.append(byte)
+            params = bytes(self.params)
+            if params == b"200" and byte == 0x7E and not self.pasting:
+                self.pasting = True
+                self.emit(PASTE_START, None, bytes(raw))
+            elif params == b"201" and byte == 0x7E and self.pasting:
+                self.pasting = False
+                self.emit(PASTE_END, None, bytes(raw))
+            else:
+                self.emit(CSI, (params, byte), bytes(raw))
+        elif action == A_SS3:
+            raw.append(byte)
+            self.emit(SS3, (bytes(self.params), byte), bytes(raw))
+        elif action == A_DISPATCH:
+            raw.append(byte)
+            self.emit(ESC, byte, bytes(raw))
+
+    def emit(self, kind, value, raw):
+        """
+        Add an event, and reset for the next one.
+        """
+        # Inside a paste everything is pasted text, except the end marker
+        if self.pasting and kind != PASTE_START:
+            kind, value = PASTE, raw
+        self.events.append(Event(kind, value, raw))
+        self.raw.clear()
+        self.params.clear()
+        self.need = 0
+
+    def abort(self):
+        """
+        Give up on an incomplete sequence or character, as is.
+        """
+        raw = bytes(self.raw)
+        if not raw:
+            return
+        if raw[0] == 0x1B:
+            self.emit(ESC, None, raw)
+        else:
+            self.emit(PRINT, raw, raw)
+
+    def flush(self):
+        """
+        Give up waiting for the rest of a sequence, returning its events.
+        """
+        self.events = []
+        self.abort()
+        self.state = PASTING if self.pasting else GROUND
+        return self.events
@@ -72,6 +72,18 @@ def get_parser():
     run.add_argument(
         "-s", action="append", help="key=value argument to update settings."
     )
+    run.add_argument(
+        "--record",
+        dest="record",
+        help="record the session as an asciicast in ~/.paks/recordings.",
+        default=False,
+        action="store_true",
+    )
+    run.add_argument(
+        "--record-file",
+        dest="record_file",
+        help="record the session as an asciicast to this file (.gz to compress).",
+    )
 
     # Paks environments
     env = subparsers.add_parser(
@@ -23,4 +23,5 @@ def main(args, parser, extra, subparser):
         registry=args.registry,
         shell=args.shell,
         container_tech=args.container_tech,
+        record=args.record_file or args.record,
     )
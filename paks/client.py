@@ -25,12 +25,12 @@ class PakClient:
     def __str__(self):
         return "[paks-client]"
 
-    def run(self, image, registry=None, shell=None, container_tech=None):
+    def run(self, image, registry=None, shell=None, container_tech=None, record=None):
         """
-        Run a paks image
+        Run a paks image, optionally recording the session to a file.
         """
         shell = shell or self.settings.container_shell
         backend = get_container_backend(container_tech or self.settings.container_tech)
 
         # Pass settings to the backend!
-        backend(image, self.settings).run(shell)
+        backend(image, self.settings).run(shell, record=record)
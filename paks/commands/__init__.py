@@ -1,8 +1,11 @@
-from .inspect import InspectContainer, Size
+from .inspect import ContainerStats, ContainerStatus, InspectContainer, Size
 from .state import SaveContainer
 from .env import EnvLoad, EnvHost, EnvSave
 from .history import History
 from .cp import Copy
+from .pipeline import Pipeline, plan, split_commands
+from .latency import Latency
+from .grep import Grep
 
 # Based functions provided by paks
 # These are currently all for docker and podman
@@ -16,6 +19,10 @@ docker_commands = {
     "#envsave": EnvSave,
     "#cp": Copy,
     "#size": Size,
+    "#latency": Latency,
+    "#grep": Grep,
+    "#status": ContainerStatus,
+    "#stats": ContainerStats,
 }
 
 
@@ -40,10 +47,31 @@ class DockerCommands:
     def history(self):
         return History(self.command)
 
-    def get_executor(self, name, out=None):
+    def get_executor(self, name, out=None, status=None):
         """
         Backend is required to update history
+
+        A line with several commands (#envload github; #inspect config)
+        gets one executor that runs them together, or None if one of them
+        is not a command.
         """
+        lines = split_commands(name)
+        if len(lines) > 1:
+            steps = []
+            for line in lines:
+                executor = self.get_executor(line, out=out, status=status)
+                if executor is None:
+                    return
+                steps.append((line, executor))
+            steps = plan(
+                steps, self.command, required=self.required, out=out, status=status
+            )
+            return Pipeline(
+                self.command, steps, required=self.required, out=out, status=status
+            )
+
         name = self.parse_name(name)
         if name in self.lookup:
-            return self.lookup[name](self.command, required=self.required, out=out)
+            return self.lookup[name](
+                self.command, required=self.required, out=out, status=status
+            )
@@ -2,14 +2,67 @@ __author__ = "Vanessa Sochat, Alec Scott"
 __copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
 __license__ = "Apache-2.0"
 
+from paks.logger import logger
+import collections
 import os
 import locale
+import json
+import selectors
 import subprocess
 import shlex
 import sys
+import time
+import paks.backends.breaker
+import paks.backends.engine
 import paks.env
 import paks.utils
 
+# Bytes read from a pipe at once, and lines of each pipe kept for the result
+chunk_size = 65536
+kept_lines = 1000
+
+
+def read_pipes(process, timeout=None):
+    """
+    Read the stdout and stderr of a process together, yielding (name, lines).
+
+    Both pipes are drained with a selector as data comes, so the process
+    can't block writing to one we aren't reading. Data is read in chunks,
+    and only the complete lines in it are decoded and split (a partial
+    line waits for the rest). If nothing comes for timeout seconds while
+    the pipes are open, subprocess.TimeoutExpired is raised.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    selector = selectors.DefaultSelector()
+    pending = {}
+    for name, pipe in [("out", process.stdout), ("err", process.stderr)]:
+        selector.register(pipe, selectors.EVENT_READ, name)
+        pending[name] = b""
+    try:
+        while selector.get_map():
+            remaining = deadline - time.monotonic() if deadline else None
+            if remaining is not None and remaining <= 0:
+                raise subprocess.TimeoutExpired(process.args, timeout)
+            for key, _ in selector.select(remaining):
+                name = key.data
+                data = os.read(key.fd, chunk_size)
+                if deadline:
+                    deadline = time.monotonic() + timeout
+                if not data:
+                    selector.unregister(key.fileobj)
+                    if pending[name]:
+                        yield name, [pending[name].decode("utf-8", "replace")]
+                    continue
+
+                # Progress is often redrawn with a carriage return
+                data = pending[name] + data
+                end = max(data.rfind(b"\n"), data.rfind(b"\r")) + 1
+                pending[name] = data[end:]
+                if end:
+                    yield name, data[:end].decode("utf-8", "replace").splitlines()
+    finally:
+        selector.close()
+
 
 class Result:
     """
@@ -38,14 +91,27 @@ class Command:
     # Parse kwargs? (e.g., envars will have=)
     parse_kwargs = True
 
-    def __init__(self, tech, required=None, out=None):
+    # Run on a worker (False for quick commands that use session state)
+    background = True
+
+    # Record the time taken under this name (instead of the command's)
+    latency_name = None
+
+    def __init__(self, tech, required=None, out=None, status=None):
         """
         Backend is required to update history.
+
+        out is a descriptor to write to the container, or a function to
+        call with the bytes. status is called with progress lines (they
+        are printed without it).
         """
         self.tech = tech
         self.required = required or []
         self.failed = False
+        self.cancelled = False
+        self.process = None
         self.out = out or sys.stdout.fileno()
+        self.status = status
 
         # We don't need editor for interactive commands
         self.env = paks.env.Environment(quiet=True)
@@ -58,39 +124,158 @@ class Command:
         """
         Execute a command to the container
         """
-        # Extra space prevents saving to history
-        os.write(self.out, self.encode(" \r %s" % cmd))
+        # Extra space prevents saving to history. The line that ran the
+        # paks command has already gone to the shell, so this ends its own
+        self.send(self.encode(" %s\r" % cmd))
+
+    def use_engine(self, func, *args, failure=None, counted=True):
+        """
+        Run func(engine, *args) with the engine API client, if there is one.
+
+        Returns its result (or failure(message) if the engine returned an
+        error, a failed result by default), or None to use the CLI instead
+        when there is no client or the engine can't be reached. If the
+        engine is there but doesn't answer in time, the CLI won't do better,
+        so EngineUnavailable is raised (counted against the engine, unless
+        counted is False for an operation that is slow with more data).
+        """
+        engine = self.kwargs.get("engine")
+        if not engine:
+            return
+        try:
+            return self.breaker.call(func, engine, *args, counted=counted)
+        except paks.backends.engine.EngineError as e:
+            return (failure or self.return_failure)(e.message)
+        except paks.backends.engine.unavailable as e:
+            logger.debug("Engine API failed, using %s: %s" % (self.tech, e))
+
+    def cached(self, kind, fetch, keep=None):
+        """
+        Get data about the container from the session cache, or with fetch.
+
+        By default only successful results are kept.
+        """
+        cache = self.kwargs.get("cache")
+        if not cache:
+            return fetch()
+        if keep is None:
+            keep = lambda result: not result.returncode
+        return cache.get(self.kwargs["container_name"], kind, fetch, keep=keep)
+
+    def inspect_container(self):
+        """
+        Get the inspect document of the container as (info, error).
+        """
+        return self.cached(
+            "inspect", self.get_info, keep=lambda found: found[0] is not None
+        )
+
+    def get_info(self):
+        """
+        Ask the engine (or CLI) for the inspect document, as (info, error).
+        """
+        container_name = self.kwargs["container_name"]
+        found = self.use_engine(
+            lambda engine: (engine.inspect_container(container_name), None),
+            failure=lambda message: (None, message),
+        )
+        if found:
+            return found
+
+        cmd = [self.tech, "inspect", container_name]
+        out, err = self.execute_host(cmd)
+        if self.process.returncode:
+            return None, err.strip() or "Failed: %s" % " ".join(cmd)
+        return json.loads(out)[0], None
+
+    def export(self, name, value, literal=False):
+        """
+        Export an environment variable in the container shell.
+
+        A value from an environment file is shell text (it may be quoted, or
+        use other variables) like it would be typed. A literal value (e.g.,
+        from the host) is quoted. The helper agent is used if there is one,
+        otherwise it is typed.
+        """
+        if literal:
+            value = shlex.quote(value)
+        agent = self.kwargs.get("agent")
+        if agent and agent.export(name, value):
+            return
+        self.execute("export %s=%s" % (name, value))
+
+    def send(self, data):
+        """
+        Write bytes to the container.
+        """
+        if callable(self.out):
+            return self.out(data)
+        os.write(self.out, data)
+
+    def cancel(self):
+        """
+        Stop the command (from another thread), ending what it is running.
+        """
+        self.cancelled = True
+        process = self.process
+        if process and process.poll() is None:
+            process.terminate()
 
     def execute_get(self, runcmd, getcmd):
         """
         Execute and get runs a command inside the container (pipes to temporary
         file) and then loads from the outside.
         """
+        # The helper agent runs it and gives us the output directly
+        agent = self.kwargs.get("agent")
+        if agent:
+            out = agent.run(["/bin/sh", "-c", runcmd])
+            if out is not None:
+                return out.decode("utf-8", "replace")
+
         # This is run inside the container
         self.run_hidden(runcmd)
         out, err = self.execute_host(getcmd)
         return out
 
+    @property
+    def breaker(self):
+        return paks.backends.breaker.get_breaker(self.tech)
+
     def execute_host(self, cmd):
         """
         Execute a command to the host, return out and error
+
+        The command is killed if it takes longer than its budget, and
+        EngineUnavailable is raised (right away if the engine is hung).
         """
+        return self.breaker.call(
+            self._execute_host, cmd, counted=paks.backends.breaker.counted(cmd)
+        )
+
+    def _execute_host(self, cmd):
         # This is run outside the container
-        res = subprocess.Popen(
+        self.process = subprocess.Popen(
             cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             universal_newlines=True,
         )
-        out, err = res.communicate()
-        return out, err
+        try:
+            return self.process.communicate(
+                timeout=paks.backends.breaker.get_budget(cmd)
+            )
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.communicate()
+            raise
 
     def run_hidden(self, cmd):
         """
         Run a hidden command.
         """
         # TODO how to hide this?
-        os.write(self.out, self.encode(" %s\r" % cmd))
+        self.send(self.encode(" %s\r" % cmd))
 
     def check(self, **kwargs):
         """
@@ -168,45 +353,97 @@ class Command:
             print("\r")
         print(line, end="\r")
 
+    def show(self, line):
+        """
+        Report a line of progress.
+        """
+        if self.status:
+            return self.status(line.rstrip())
+        self.do_print(line, False)
+
+    def show_lines(self, lines):
+        """
+        Report lines of progress that came together.
+
+        The status line only needs the last of them, and printed lines
+        go out in one write.
+        """
+        if self.status:
+            for line in reversed(lines):
+                if line.strip():
+                    return self.status(line.rstrip())
+            return
+        sys.stdout.write("".join("%s\n\r" % line for line in lines))
+        sys.stdout.flush()
+
     def run_command(self, cmd, output="output"):
         """
         Wrapper to stream a command, which handles returning a result on error.
         """
-        print("\r")
+        if not self.status:
+            print("\r")
         lines = self.stream_command(cmd, output)
         while True:
             try:
-                line = next(lines)
-                self.do_print(line, False)
+                self.show_lines(next(lines))
 
             # We use this to return the result
             except StopIteration as e:
+                if e.value and self.cancelled:
+                    return self.return_failure("Cancelled.")
                 return e.value
-                break
 
     def stream_command(self, cmd, output="output"):
         """
-        Stream a command and use output or error.
+        Stream a command, yielding lines of its output (or error) as they come.
+
+        Both are read (and the last lines of each kept for a failed result).
+        A command without output for its budget is killed, and EngineUnavailable
+        raised. If the command is slow with more data (e.g., a copy), that
+        isn't the engine's fault, so it is a failed result instead.
         """
-        process = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+        self.breaker.check()
+        self.process = process = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
-        stream = process.stdout.readline
-        if output == "error":
-            stream = process.stderr.readline
-
-        # Stream lines back to the caller
-        for line in iter(stream, ""):
-            yield line
-
-        # If there is an error, raise.
-        process.stdout.close()
-        process.stderr.close()
+        shown = "err" if output == "error" else "out"
+        captured = {
+            "out": collections.deque(maxlen=kept_lines),
+            "err": collections.deque(maxlen=kept_lines),
+        }
+        try:
+            for name, lines in read_pipes(
+                process, paks.backends.breaker.get_budget(cmd)
+            ):
+                captured[name].extend(lines)
+                if name == shown:
+                    yield lines
+        except subprocess.TimeoutExpired as e:
+            # Reap it, so a killed command isn't left behind as a zombie
+            process.kill()
+            process.wait()
+            counted = paks.backends.breaker.counted(cmd)
+            self.breaker.timed_out(counted)
+            message = "%s had no output for %ds." % (" ".join(cmd[:2]), e.timeout)
+            if not counted:
+                return self.return_failure(message)
+            raise paks.backends.breaker.EngineUnavailable(message)
+        except BaseException:
+            self.breaker.release()
+            raise
+        finally:
+            process.stdout.close()
+            process.stderr.close()
         return_code = process.wait()
+        self.breaker.success()
 
         # If failed, send failed result up to calling function
         if return_code:
-            return self.return_failure("Failed: %s" % " ".join(cmd))
+            return self.return_failure(
+                "Failed: %s" % " ".join(cmd),
+                out=list(captured["out"]),
+                err=list(captured["err"]),
+            )
 
     def parse_command(self, cmd):
         """this is called when a new command is provided to ensure we have
@@ -2,7 +2,154 @@ __author__ = "Vanessa Sochat, Alec Scott"
 __copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
 __license__ = "Apache-2.0"
 
-from .command import Command
+from paks.backends.breaker import EngineUnavailable
+from paks.backends.engine import EngineError
+from paks.logger import logger
+from .command import Command, Result
+import tempfile
+import posixpath
+import tarfile
+import shutil
+import errno
+import stat
+import os
+
+# Archives of copies bigger than this are spooled to disk while sent
+spool_size = 16 * 1024 * 1024
+
+# Go's mode bit for a directory (in the stat the engine gives for a path)
+mode_dir = 1 << 31
+
+# Opening a directory in the container (never through a symbolic link)
+dir_flags = os.O_RDONLY | os.O_DIRECTORY
+
+
+def container_parts(path):
+    """
+    Split a path in the container into its names (.. can't go above /).
+    """
+    return [part for part in posixpath.normpath("/" + path).split("/") if part]
+
+
+def open_at(name, flags, dir_fd, mode=0o777):
+    """
+    Open a name in a directory of the container, refusing a symbolic link.
+
+    A link could lead out of the container to the host (or be swapped in
+    by the container while we copy), so we never follow one.
+    """
+    try:
+        return os.open(name, flags | os.O_NOFOLLOW | os.O_CLOEXEC, mode, dir_fd=dir_fd)
+    except OSError as e:
+        # A link opened as a directory is "not a directory"
+        if e.errno not in (errno.ELOOP, errno.ENOTDIR):
+            raise
+        st = os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+        if not stat.S_ISLNK(st.st_mode):
+            raise
+        raise OSError(errno.ELOOP, "Refusing to follow a symbolic link", name) from e
+
+
+def open_under(root_fd, parts):
+    """
+    Open a directory under the container's root, one level at a time.
+    """
+    fd = os.dup(root_fd)
+    try:
+        for part in parts:
+            parent, fd = fd, None
+            try:
+                fd = open_at(part, dir_flags, parent)
+            finally:
+                os.close(parent)
+    except OSError:
+        if fd is not None:
+            os.close(fd)
+        raise
+    return fd
+
+
+def copy_attributes(fd, st):
+    os.chmod(fd, stat.S_IMODE(st.st_mode))
+    os.utime(fd, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def check_file(fd, name):
+    """
+    Make sure what we opened is a regular file (not, e.g., a fifo or device).
+    """
+    if not stat.S_ISREG(os.fstat(fd).st_mode):
+        os.close(fd)
+        raise OSError(errno.EINVAL, "Not a regular file", name)
+    return fd
+
+
+def copy_in(src, dir_fd, name):
+    """
+    Copy a file or directory on the host to a name in a container directory.
+    """
+    st = os.lstat(src)
+    if stat.S_ISLNK(st.st_mode):
+        try:
+            os.unlink(name, dir_fd=dir_fd)
+        except FileNotFoundError:
+            pass
+        os.symlink(os.readlink(src), name, dir_fd=dir_fd)
+        return
+
+    if stat.S_ISDIR(st.st_mode):
+        try:
+            os.mkdir(name, 0o700, dir_fd=dir_fd)
+        except FileExistsError:
+            pass
+        fd = open_at(name, dir_flags, dir_fd)
+        try:
+            for entry in os.listdir(src):
+                copy_in(os.path.join(src, entry), fd, entry)
+            copy_attributes(fd, st)
+        finally:
+            os.close(fd)
+        return
+
+    # Without blocking, in case the container put a fifo there
+    flags = os.O_WRONLY | os.O_CREAT | os.O_NONBLOCK
+    fd = check_file(open_at(name, flags, dir_fd, 0o600), name)
+    with open(src, "rb") as source, os.fdopen(fd, "wb") as target:
+        os.ftruncate(fd, 0)
+        os.set_blocking(fd, True)
+        shutil.copyfileobj(source, target)
+        target.flush()
+        copy_attributes(fd, st)
+
+
+def copy_out(dir_fd, name, dest):
+    """
+    Copy a file or directory in a container directory to the host.
+    """
+    st = os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+    if stat.S_ISLNK(st.st_mode):
+        os.symlink(os.readlink(name, dir_fd=dir_fd), dest)
+        return
+
+    if stat.S_ISDIR(st.st_mode):
+        fd = open_at(name, dir_flags, dir_fd)
+        try:
+            os.makedirs(dest, exist_ok=True)
+            for entry in os.listdir(fd):
+                copy_out(fd, entry, os.path.join(dest, entry))
+            os.chmod(dest, stat.S_IMODE(st.st_mode))
+            os.utime(dest, ns=(st.st_atime_ns, st.st_mtime_ns))
+        finally:
+            os.close(fd)
+        return
+
+    fd = check_file(open_at(name, os.O_RDONLY | os.O_NONBLOCK, dir_fd), name)
+    with os.fdopen(fd, "rb") as source, open(dest, "wb") as target:
+        os.set_blocking(fd, True)
+        shutil.copyfileobj(source, target)
+        target.flush()
+        copy_attributes(target.fileno(), st)
+
 
 # Every command must:
 # 1. subclass Command
@@ -38,6 +185,12 @@ class Copy(Command):
                 "One of copy arguments must be to the host:/path/to/file.txt"
             )
 
+        result = self.use_engine(
+            self.run_mount, container_name, src, dest, counted=False
+        )
+        if result:
+            return result
+
         args = {"src": src, "dest": dest}
         for argtype, path in args.items():
             if "host:" in path:
@@ -47,5 +200,191 @@ class Copy(Command):
             args[argtype] = path
 
         # docker cp!
-        self.run_command([self.tech, "cp", args["src"], args["dest"]])
+        result = self.run_command([self.tech, "cp", args["src"], args["dest"]])
+        return result or self.return_success()
+
+    def run_mount(self, engine, container_name, src, dest):
+        """
+        Copy through the container's mounted filesystem (podman).
+
+        Returns None to use the CLI if the engine can't (or won't) mount,
+        the mount isn't visible to us (e.g., it is in rootless podman's namespace),
+        or there is a symbolic link on the way to the container path. A
+        link at the path itself, or met while copying, is refused: we only
+        open names in the container without following links, a directory
+        at a time, so a copy can't be led out of the container.
+        """
+        if not hasattr(engine, "mount_container"):
+            return
+        try:
+            root = os.path.realpath(engine.mount_container(container_name))
+        except EngineError as e:
+            logger.debug("Could not mount %s, using the CLI: %s" % (container_name, e))
+            return
+        root_fd = None
+        try:
+            if not os.path.ismount(root):
+                return
+            root_fd = os.open(root, dir_flags | os.O_CLOEXEC)
+            if src.startswith("host:"):
+                return self.mount_copy_in(root_fd, src.replace("host:", "", 1), dest)
+            return self.mount_copy_out(root_fd, src, dest.replace("host:", "", 1))
+        except OSError as e:
+            return self.return_failure("Copy failed: %s" % e)
+        finally:
+            if root_fd is not None:
+                os.close(root_fd)
+            try:
+                engine.unmount_container(container_name)
+
+            # A running container stays mounted
+            except EngineError:
+                pass
+
+    def open_parent(self, root_fd, parts):
+        """
+        Open the directory a container path is in, or None if a link is on
+        the way (the CLI resolves those inside of the container).
+        """
+        try:
+            return open_under(root_fd, parts[:-1])
+        except OSError as e:
+            if e.errno != errno.ELOOP:
+                raise
+
+    def mount_copy_in(self, root_fd, src, dest):
+        """
+        Copy from the host to the mounted container.
+        """
+        parts = container_parts(dest)
+        if not parts:
+            parts = ["."]
+        parent = self.open_parent(root_fd, parts)
+        if parent is None:
+            return
+        try:
+            name = parts[-1]
+
+            # Like cp, copying to a directory puts it inside
+            try:
+                fd = open_at(name, dir_flags, parent)
+                os.close(parent)
+                parent, name = fd, os.path.basename(src.rstrip(os.sep))
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+            copy_in(src, parent, name)
+        finally:
+            os.close(parent)
+        return self.return_success()
+
+    def mount_copy_out(self, root_fd, src, dest):
+        """
+        Copy from the mounted container to the host.
+        """
+        parts = container_parts(src)
+        if not parts:
+            return
+        parent = self.open_parent(root_fd, parts)
+        if parent is None:
+            return
+        try:
+            if os.path.isdir(dest):
+                dest = os.path.join(dest, parts[-1])
+            copy_out(parent, parts[-1], dest)
+        finally:
+            os.close(parent)
+        return self.return_success()
+
+
+class CopyBatch(Command):
+    """
+    Copies from the host to the container that came on one line, sent together.
+
+    The files are put in one tar archive and extracted in the container
+    with a single engine request. Without the engine API, each copy runs
+    on its own, and like the steps of a pipeline a failed one doesn't stop
+    the rest.
+    """
+
+    supported_for = ["docker", "podman"]
+    pre_message = "Performing Copies..."
+
+    def __init__(self, tech, copies, required=None, out=None, status=None):
+        super().__init__(tech, required=required, out=out, status=status)
+
+        # (line, Copy) for each copy, and the one running
+        self.copies = copies
+        self.current = None
+
+    @classmethod
+    def accepts(cls, line, executor):
+        """
+        Can a copy go in a batch? (It must be from the host to the container.)
+        """
+        if not isinstance(executor, Copy):
+            return False
+        args, _ = executor.get_args(line)
+        return len(args) == 2 and args[0].startswith("host:") and "host:" not in args[1]
+
+    def run(self, **kwargs):
+        """
+        Copy everything from the host at once.
+        """
+        # Always run this first to make sure container tech is valid
+        self.check(**dict(kwargs, original=None))
+        uploads = [executor.get_args(line)[0] for line, executor in self.copies]
+        result = self.use_engine(
+            self.run_archive, self.kwargs["container_name"], uploads, counted=False
+        )
+        if result:
+            return result
+
+        messages = []
+        failed = False
+        for line, executor in self.copies:
+            if self.cancelled:
+                return self.return_failure("Cancelled.")
+            self.current = executor
+            try:
+                result = executor.run(**dict(kwargs, original=line))
+            except EngineUnavailable as e:
+                result = self.return_failure("%s failed: %s" % (line, e))
+            if result and result.returncode:
+                failed = True
+                messages.append(result.message or "%s failed." % line)
+        return Result(msg="\n\r".join(messages) or None, retval=int(failed))
+
+    def cancel(self):
+        super().cancel()
+        if self.current:
+            self.current.cancel()
+
+    def run_archive(self, engine, container_name, uploads):
+        """
+        Send the copies in one archive, extracted at the container's root.
+
+        Like cp, a copy to a directory that exists goes inside it, so each
+        destination is looked at first (a small request each).
+        """
+        names = []
+        for src, dest in uploads:
+            src = src.replace("host:", "", 1)
+            into = dest.endswith("/")
+            dest = posixpath.normpath(posixpath.join("/", dest))
+            if not into:
+                found = engine.stat_path(container_name, dest)
+                into = bool(found and found.get("mode", 0) & mode_dir)
+            if into:
+                dest = posixpath.join(dest, os.path.basename(src.rstrip(os.sep)))
+            names.append((src, dest.lstrip("/")))
+
+        with tempfile.SpooledTemporaryFile(max_size=spool_size) as archive:
+            try:
+                with tarfile.open(fileobj=archive, mode="w") as tar:
+                    for src, name in names:
+                        tar.add(src, arcname=name)
+            except OSError as e:
+                return self.return_failure("Copy failed: %s" % e)
+            size = archive.tell()
+            engine.put_archive(container_name, "/", archive, size)
         return self.return_success()
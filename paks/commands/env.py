@@ -34,7 +34,7 @@ class EnvRemove(Command):
                 return self.return_failure(
                     "Could not add %s, did you include an =?" % envar
                 )
-            self.execute("export %s" % envar)
+            self.export(*envar.split("=", 1))
         return self.return_success(
             "Successfully added and exported environment variables."
         )
@@ -62,7 +62,7 @@ class EnvSave(Command):
                 return self.return_failure(
                     "Could not add %s, did you include an =?" % envar
                 )
-            self.execute("export %s" % envar)
+            self.export(*envar.split("=", 1))
         return self.return_success(
             "Successfully added and exported environment variables."
         )
@@ -93,7 +93,7 @@ class EnvHost(Command):
             if not value:
                 continue
             found = True
-            self.execute("export %s=%s" % (name, value))
+            self.export(name, value, literal=True)
 
         if not found:
             return self.return_failure("No matching environment variables were found.")
@@ -125,5 +125,5 @@ class EnvLoad(Command):
             )
 
         for key, value in self.env.envars.items():
-            self.execute("export %s=%s" % (key, value))
+            self.export(key, value)
         return self.return_success("Successfully loaded environment %s" % envname)
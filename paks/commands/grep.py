@@ -0,0 +1,71 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from .command import Command
+import re
+
+# Every command must:
+# 1. subclass Command
+# 2. defined what container techs supported for (class attribute) defaults to all
+# 3. define run function with kwargs
+
+highlight = "\033[1;31m%s\033[0m"
+
+
+class Grep(Command):
+
+    supported_for = ["docker", "podman"]
+    background = False
+    parse_kwargs = False
+
+    def run(self, **kwargs):
+        """
+        Search output of the session that has scrolled by.
+
+        #grep [-i] [-m <count>] <pattern>
+        """
+        # Always run this first to make sure container tech is valid
+        self.check(**kwargs)
+
+        scrollback = self.kwargs.get("scrollback")
+        if scrollback is None:
+            return self.return_failure("Scrollback is not enabled.")
+
+        flags = re.MULTILINE
+        limit = 100
+        args = list(self.args)
+        while args and args[0] in ["-i", "-m"]:
+            option = args.pop(0)
+            if option == "-i":
+                flags |= re.IGNORECASE
+            elif args and args[0].isdigit():
+                limit = int(args.pop(0))
+        if not args:
+            return self.return_failure("Usage: #grep [-i] [-m <count>] <pattern>")
+
+        try:
+            pattern = re.compile(" ".join(args).encode("utf-8"), flags)
+        except re.error as e:
+            return self.return_failure("Invalid pattern: %s" % e)
+
+        found = scrollback.grep(pattern, limit=limit)
+        if not found:
+            return self.return_failure("No matches.")
+        return self.return_success("\n\r".join(self.format(*match) for match in found))
+
+    def format(self, number, line, spans):
+        """
+        Show a line number and line, with matches highlighted.
+        """
+        text = ""
+        last = 0
+        for start, end in spans:
+            end = min(end, len(line))
+            if start < last or start >= end:
+                continue
+            text += line[last:start].decode("utf-8", "replace")
+            text += highlight % line[start:end].decode("utf-8", "replace")
+            last = end
+        text += line[last:].decode("utf-8", "replace")
+        return "%7s  %s" % (number, text)
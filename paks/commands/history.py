@@ -16,21 +16,34 @@ class History(Command):
     required = ["container_name"]
 
     def run(self, **kwargs):
-
+        """
+        Read the history file, optionally starting after a byte offset.
+        """
         # Always run this first to make sure container tech is valid
         self.check(**kwargs)
         history_file = kwargs.get("history_file", "/root/.bash_history")
         self.out = self.kwargs.get("out", self.out)
+        offset = self.kwargs.get("offset") or 0
 
         # These are both required for docker/podman
         container_name = self.kwargs["container_name"]
+
+        # The helper agent reads the file without another exec
+        agent = self.kwargs.get("agent")
+        if agent:
+            out = agent.read_file(history_file, offset)
+            if out is not None:
+                return out.decode("utf-8", "replace")
+
+        # This is not interactive, so we don't attach the terminal
         out, err = self.execute_host(
             [
                 self.tech,
                 "exec",
-                "-it",
                 container_name,
-                "/usr/bin/cat",
+                "tail",
+                "-c",
+                "+%s" % (offset + 1),
                 history_file,
             ]
         )
@@ -2,14 +2,55 @@ __author__ = "Vanessa Sochat, Alec Scott"
 __copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
 __license__ = "Apache-2.0"
 
+from paks.backends.engine import human_size, tree_size
+from paks.backends.model import SessionModel
 from .command import Command
 import json
+import re
 
 # Every command must:
 # 1. subclass Command
 # 2. defined what container techs supported for (class attribute) defaults to all
 # 3. define run function with kwargs
 
+# Parts of a path like config.env, $.Mounts[0].Source or mounts[*].source
+path_parts = re.compile(r"\[([^\]]*)\]|([^.\[\]]+)")
+missing = object()
+
+
+def select(document, path):
+    """
+    Select values from a parsed document with a dotted (or JSONPath) path.
+
+    Keys match regardless of case, [n] (or .n) picks from a list and *
+    takes every item. Returns a list of the values found.
+    """
+    if path.startswith("$"):
+        path = path[1:]
+    found = [document]
+    for index, key in path_parts.findall(path):
+        key = (index or key).strip("'\"")
+        selected = []
+        for node in found:
+            if key == "*" and isinstance(node, (dict, list)):
+                selected += list(node.values() if isinstance(node, dict) else node)
+            elif isinstance(node, list):
+                try:
+                    selected.append(node[int(key)])
+                except (ValueError, IndexError):
+                    continue
+            elif isinstance(node, dict):
+                value = node.get(key, missing)
+                if value is missing:
+                    lower = key.lower()
+                    value = next(
+                        (v for k, v in node.items() if k.lower() == lower), missing
+                    )
+                if value is not missing:
+                    selected.append(value)
+        found = selected
+    return found
+
 
 class Size(Command):
 
@@ -18,30 +59,118 @@ class Size(Command):
 
     def run(self, **kwargs):
         """
-        Get a container size.
+        Get a container size, and how much it grew in the session.
         """
         # Always run this first to make sure container tech is valid
         self.check(**kwargs)
+        return self.run_layer() or self.cached("size", self.get_size)
+
+    def run_layer(self):
+        """
+        Get the size from the writable layer we watch, if we can.
+
+        The layer is added up once and then kept up to date as files in
+        it change, so this doesn't ask the engine to walk anything.
+        """
+        sizes = self.kwargs.get("sizes")
+        info, error = self.inspect_container()
+        if not sizes or error:
+            return
+        upper = ((info.get("GraphDriver") or {}).get("Data") or {}).get("UpperDir")
+        layer = sizes.get(self.kwargs["container_name"], upper) if upper else None
+        if not layer:
+            return
+        size = layer.size()
+        if size is None:
+            sizes.forget(self.kwargs["container_name"])
+            return
+
+        # Images don't change, so we only need this once
+        if layer.image_size is None:
+            layer.image_size = self.get_image_size(info["Image"])
+        if layer.image_size is None:
+            return
+        return self.format_size(size, size + layer.image_size)
+
+    def get_image_size(self, image):
+        size = self.use_engine(
+            lambda engine: engine.inspect_image(image)["Size"],
+            failure=lambda message: None,
+        )
+        if size is not None:
+            return size
+        out, _ = self.execute_host(
+            [self.tech, "image", "inspect", "--format", "{{ .Size }}", image]
+        )
+        if not self.process.returncode:
+            return int(out.strip())
 
+    def format_size(self, size, total):
+        """
+        Format sizes like the CLI does, with the growth in the session.
+        """
+        message = "%s (virtual %s)" % (human_size(size), human_size(total))
+        sizes = self.kwargs.get("sizes")
+        if sizes:
+            growth = sizes.growth(self.kwargs["container_name"], size)
+            message += ", %s%s this session" % (
+                "-" if growth < 0 else "+",
+                human_size(abs(growth)),
+            )
+        return self.return_success(message)
+
+    def get_size(self):
+        """
+        Ask the engine (or CLI) for the size of the container.
+        """
         # These are both required for docker/podman
         container_name = self.kwargs["container_name"]
+        result = self.use_engine(self.run_engine, container_name)
+        if result:
+            return result
+
+        # Asking for the container by name (not listing with a filter) is
+        # one lookup however many containers there are
         out, err = self.execute_host(
             [
                 self.tech,
                 "container",
-                "ls",
-                "-s",
-                "--filter",
-                "name=%s" % container_name,
+                "inspect",
+                "--size",
                 "--format",
-                '"{{ json .}}"',
+                # A size the engine leaves out would be <no value>, read it as 0
+                "{{ or .SizeRw 0 }} {{ or .SizeRootFs 0 }}",
+                container_name,
             ]
         )
-        if not err:
-            out = json.loads(out.strip().strip('"'))
-            return self.return_success(out["Size"])
+        if self.process.returncode:
+            return self.return_failure(err.strip())
+        size, total = [int(value) for value in out.split()]
+        return self.format_size(size, total)
 
-        return self.return_failure(err)
+    def run_engine(self, engine, container_name):
+        """
+        Get the size from the engine API, formatted like the CLI.
+
+        If we can read the container's writable layer it is added up here,
+        which saves the engine from walking the whole image too.
+        """
+        # The inspect document is shared with other commands
+        info, error = self.inspect_container()
+        if error:
+            return self.return_failure(error)
+        upper = ((info.get("GraphDriver") or {}).get("Data") or {}).get("UpperDir")
+        try:
+            size = tree_size(upper) if upper else None
+        except OSError:
+            size = None
+
+        if size is None:
+            info = engine.inspect_container(container_name, size=True)
+            size, total = info.get("SizeRw") or 0, info["SizeRootFs"]
+        else:
+            total = size + engine.inspect_image(info["Image"])["Size"]
+        return self.format_size(size, total)
 
 
 class InspectContainer(Command):
@@ -52,28 +181,82 @@ class InspectContainer(Command):
     def run(self, **kwargs):
         """
         Inspect a container fully, or specific sections
+
+        #inspect [path ...] where a path is a section (config), or a dotted
+        or JSONPath path into it (config.env, mounts[0].source).
         """
         # Always run this first to make sure container tech is valid
         self.check(**kwargs)
 
-        # These are both required for docker/podman
+        # One document is kept (parsed), and every path is taken from it
+        info, error = self.inspect_container()
+        if error:
+            return self.return_failure(error)
+
+        # The result is shown in one write, above the prompt
+        if not self.args:
+            return self.return_success(
+                "\n\r".join(json.dumps([info], indent=4).split("\n"))
+            )
+        lines = []
+        for path in self.args:
+            found = select(info, path)
+            if "*" in path:
+                value = found
+            elif found:
+                value = found[0]
+            else:
+                return self.return_failure("%s was not found." % path)
+            value = json.dumps(value, separators=(",", ":"))
+            lines.append(value if len(self.args) == 1 else "%s: %s" % (path, value))
+        return self.return_success("\n\r".join(lines))
+
+
+class ContainerStatus(Command):
+
+    supported_for = ["docker", "podman"]
+    pre_message = "Checking container..."
+
+    def run(self, **kwargs):
+        """
+        Show the state of the container, as engine events have told us.
+        """
+        # Always run this first to make sure container tech is valid
+        self.check(**kwargs)
         container_name = self.kwargs["container_name"]
+        model = self.kwargs.get("model") or SessionModel()
 
-        # inspect defaults to labels and environment
-        if self.args:
-            for section in self.args:
-                result = self.run_command(
-                    [
-                        self.tech,
-                        "inspect",
-                        "--format",
-                        "{{json .%s }}" % section.capitalize(),
-                        container_name,
-                    ]
-                )
+        # We only ask the engine if events can't have told us everything
+        state = model.get(container_name)
+        if not state or not state.synced:
+            info, error = self.inspect_container()
+            if error:
+                return self.return_failure(error)
+            state = model.sync(container_name, info)
+        return self.return_success(state.summary())
 
-        else:
-            result = self.run_command([self.tech, "inspect", container_name])
-            if result:
-                return result
-        return self.return_success()
+
+class ContainerStats(Command):
+
+    supported_for = ["docker", "podman"]
+    background = False
+
+    def run(self, **kwargs):
+        """
+        Start (or stop) showing resource use of the container in the status line.
+
+        #stats toggles the monitor, #stats stop stops it.
+        """
+        # Always run this first to make sure container tech is valid
+        self.check(**kwargs)
+        monitor = self.kwargs.get("stats")
+        if not monitor:
+            return self.return_failure("Stats are not available in this session.")
+
+        if monitor.running:
+            monitor.stop()
+            return self.return_success("Stopped showing stats.")
+        if self.args and self.args[0] == "stop":
+            return self.return_success("Stats are not being shown.")
+        monitor.start()
+        return self.return_success("Showing stats in the status line, #stats to stop.")
@@ -0,0 +1,28 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from .command import Command
+
+# Every command must:
+# 1. subclass Command
+# 2. defined what container techs supported for (class attribute) defaults to all
+# 3. define run function with kwargs
+
+
+class Latency(Command):
+
+    supported_for = ["docker", "podman"]
+    background = False
+
+    def run(self, **kwargs):
+        """
+        Show keystroke echo and command latency for the session.
+        """
+        # Always run this first to make sure container tech is valid
+        self.check(**kwargs)
+
+        latency = self.kwargs.get("latency")
+        if not latency or not latency.histograms:
+            return self.return_failure("No latency has been recorded yet.")
+        return self.return_success("\n\r".join(latency.table()))
@@ -0,0 +1,149 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.cache import MetadataCache
+from paks.logger import logger
+from .command import Command, Result
+from .cp import CopyBatch
+import concurrent.futures
+import time
+import re
+
+# Commands on one line are separated by a semicolon before the next #
+separator = re.compile(r"\s*;\s*(?=#)")
+
+
+def split_commands(line):
+    """
+    Split a line into the paks commands on it (#envload github; #inspect config).
+    """
+    return [part.strip() for part in separator.split(line.strip()) if part.strip()]
+
+
+def plan(steps, tech, required=None, out=None, status=None):
+    """
+    Plan the (line, executor) steps of a line to run together.
+
+    Copies from the host to the container that come one after another
+    are merged into one batch (a single archive).
+    """
+    planned = []
+    for line, executor in steps:
+        if CopyBatch.accepts(line, executor):
+            last = planned[-1][1] if planned else None
+            if isinstance(last, CopyBatch):
+                last.copies.append((line, executor))
+                continue
+            executor = CopyBatch(
+                tech, [(line, executor)], required=required, out=out, status=status
+            )
+        planned.append((line, executor))
+
+    # A single copy doesn't need a batch
+    return [
+        (
+            (line, executor.copies[0][1])
+            if isinstance(executor, CopyBatch) and len(executor.copies) == 1
+            else (line, executor)
+        )
+        for line, executor in planned
+    ]
+
+
+class Pipeline(Command):
+    """
+    Several paks commands from one line, run in order on one worker.
+
+    They share the session's data, so the inspect document (for example)
+    is fetched once for all of them, even when the session has no cache.
+    Like commands separated by ; in the shell, a failure doesn't stop
+    the ones after it, and their messages are shown together. Commands
+    that must run on the session's loop (background = False) are handed
+    back to it, and the time of each is recorded under its own name.
+    """
+
+    supported_for = ["docker", "podman"]
+    latency_name = "pipeline"
+
+    def __init__(self, tech, steps, required=None, out=None, status=None):
+        super().__init__(tech, required=required, out=out, status=status)
+
+        # (line, executor) for each step, and the one running
+        self.steps = steps
+        self.current = None
+        self.pre_message = "Running %s commands..." % len(steps)
+
+    @property
+    def background(self):
+        return any(executor.background for _, executor in self.steps)
+
+    def run(self, **kwargs):
+        """
+        Run each command with the shared session data.
+        """
+        # Always run this first to make sure container tech is valid
+        self.check(**dict(kwargs, original=None))
+        if not kwargs.get("cache"):
+            kwargs["cache"] = MetadataCache()
+
+        messages = []
+        failed = False
+        for line, executor in self.steps:
+            if self.cancelled:
+                return self.return_failure("Cancelled.")
+            self.current = executor
+            if executor.pre_message:
+                self.show(executor.pre_message)
+            name = line.split(" ")[0]
+            start = time.monotonic()
+            try:
+                result = self.run_step(executor, **dict(kwargs, original=line))
+            except Exception as e:
+                logger.debug("%s failed: %s" % (line, e))
+                result = self.return_failure("%s failed: %s" % (name, e))
+            self.record(kwargs, name, time.monotonic() - start)
+            if result and result.message:
+                messages.append(result.message)
+            failed = failed or bool(result and result.returncode)
+        return Result(msg="\n\r".join(messages) or None, retval=int(failed))
+
+    def run_step(self, executor, **kwargs):
+        """
+        Run a step, on the session's loop if it must be (and we are not).
+        """
+        on_loop = kwargs.get("on_loop")
+        if executor.background or not self.background or not on_loop:
+            return executor.run(**kwargs)
+
+        future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(executor.run(**kwargs))
+            except Exception as e:
+                future.set_exception(e)
+
+        on_loop(run)
+        while not self.cancelled:
+            try:
+                return future.result(timeout=0.1)
+            except concurrent.futures.TimeoutError:
+                continue
+        return self.return_failure("Cancelled.")
+
+    def record(self, kwargs, name, seconds):
+        """
+        Record the time a step took, on the session's loop if we are not.
+        """
+        latency = kwargs.get("latency")
+        if not latency:
+            return
+        if self.background and kwargs.get("on_loop"):
+            return kwargs["on_loop"](latency.record, name, seconds)
+        latency.record(name, seconds)
+
+    def cancel(self):
+        super().cancel()
+        if self.current:
+            self.current.cancel()
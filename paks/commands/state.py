@@ -3,9 +3,14 @@ __copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
 __license__ = "Apache-2.0"
 
 from paks.utils.names import namer
+from paks.logger import logger
 from .command import Command
-import shutil
+import paks.backends.breaker
+import paks.backends.engine
 import tempfile
+import tarfile
+import shutil
+import io
 import os
 
 # Every command must:
@@ -34,37 +39,108 @@ class SaveContainer(Command):
 
         # Not required, so we have a default
         suffix = self.kwargs.get("suffix", "-saved")
+        result = self.use_engine(
+            self.run_engine, container_name, tmp_name, name + suffix, counted=False
+        )
+        if result:
+            return result
 
         # Run the command (show in real time)
         result = self.run_command([self.tech, "commit", container_name, tmp_name])
         if result:
             return result
 
-        # Keep track of where we are to change back to
-        here = os.getcwd()
-
-        # Create a temporary context
+        # Build from it in a temporary context, removing both however it went
         tempdir = tempfile.mkdtemp()
-        dockerfile = os.path.join(tempdir, "Dockerfile")
-        with open(dockerfile, "w") as fd:
-            fd.write("FROM %s\n" % tmp_name)
-        os.chdir(tempdir)
+        try:
+            dockerfile = os.path.join(tempdir, "Dockerfile")
+            with open(dockerfile, "w") as fd:
+                fd.write("FROM %s\n" % tmp_name)
 
-        result = self.run_command(
-            [self.tech, "build", "--squash", "-t", name + suffix, "."], "error"
-        )
-        if result:
-            return result
-
-        result = self.run_command([self.tech, "rmi", tmp_name])
+            # Commands run on a worker, so the build context is given (not cd)
+            result = self.run_command(
+                [self.tech, "build", "--squash", "-t", name + suffix, tempdir],
+                "error",
+            )
+        finally:
+            shutil.rmtree(tempdir, ignore_errors=True)
+            removed = self.remove_temporary(tmp_name)
         if result:
             return result
+        if removed:
+            return removed
 
         # Remove dangling None images (not recommended lol)
-        os.system(
-            '%s rmi --force $(%s images --filter "dangling=true" -q --no-trunc) >/dev/null 2>&1'
-            % (self.tech, self.tech)
-        )
-        os.chdir(here)
-        shutil.rmtree(tempdir)
+        try:
+            self.execute_host(
+                [
+                    "/bin/sh",
+                    "-c",
+                    '%s rmi --force $(%s images --filter "dangling=true" -q --no-trunc)'
+                    % (self.tech, self.tech),
+                ]
+            )
+        except paks.backends.breaker.EngineUnavailable as e:
+            logger.debug("Could not remove dangling images: %s" % e)
+        return self.return_success("Successfully saved container! ⭐️")
+
+    def remove_temporary(self, tmp_name):
+        """
+        Remove the temporary image the container was committed to.
+        """
+        try:
+            return self.run_command([self.tech, "rmi", tmp_name])
+        except paks.backends.breaker.EngineUnavailable as e:
+            return self.return_failure("Could not remove %s: %s" % (tmp_name, e))
+
+    def run_engine(self, engine, container_name, tmp_name, tag):
+        """
+        Save the container with the engine API, in the same steps as the CLI.
+
+        Only when the engine can't be reached at all is the CLI used instead.
+        Once the commit was sent it may have been made, so a lost connection
+        is a failure (and a timeout raises EngineUnavailable), rather than
+        committing again with the CLI.
+        """
+        try:
+            engine.commit(container_name, tmp_name)
+        except paks.backends.engine.unreachable + paks.backends.breaker.timeouts:
+            raise
+        except paks.backends.engine.unavailable as e:
+            return self.return_failure("Commit of %s failed: %s" % (container_name, e))
+
+        # The build context is only the Dockerfile, made in memory
+        dockerfile = ("FROM %s\n" % tmp_name).encode("utf-8")
+        context = io.BytesIO()
+        with tarfile.open(fileobj=context, mode="w") as tar:
+            info = tarfile.TarInfo("Dockerfile")
+            info.size = len(dockerfile)
+            tar.addfile(info, io.BytesIO(dockerfile))
+
+        try:
+            for message in engine.build(context.getvalue(), tag, squash=True):
+                if self.cancelled:
+                    return self.return_failure("Cancelled.")
+                if "error" in message:
+                    return self.return_failure(message["error"])
+                if message.get("stream", "").strip():
+                    self.show(message["stream"])
+        except paks.backends.breaker.timeouts:
+            raise
+        except paks.backends.engine.unavailable as e:
+            return self.return_failure("Build of %s failed: %s" % (tag, e))
+        finally:
+            try:
+                engine.remove_image(tmp_name)
+            except (
+                paks.backends.engine.EngineError,
+            ) + paks.backends.engine.unavailable as e:
+                logger.debug("Could not remove %s: %s" % (tmp_name, e))
+
+        try:
+            engine.prune_images()
+        except (
+            paks.backends.engine.EngineError,
+        ) + paks.backends.engine.unavailable as e:
+            logger.debug("Could not remove dangling images: %s" % e)
         return self.return_success("Successfully saved container! ⭐️")
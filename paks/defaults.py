@@ -17,6 +17,15 @@ pakshome = os.path.expanduser("~/.paks")
 # Paks environments
 paksenvs = os.path.join(pakshome, "envs")
 
+# History of paks sessions, one file per image
+history_dir = os.path.join(pakshome, "history")
+
+# Latency histograms saved when a session ends
+latency_dir = os.path.join(pakshome, "latency")
+
+# Sessions recorded with paks run --record
+recordings_dir = os.path.join(pakshome, "recordings")
+
 # The user settings file can be created to over-ride default
 user_settings_file = os.path.join(pakshome, "settings.yml")
 
@@ -14,13 +14,23 @@ settingsProperties = {
     "config_editor": {"type": "string"},
     "updated_at": {"type": ["string", "null"]},
     "user": {"type": "string"},
+    "engine_api": {"type": "boolean"},
+    "helper_agent": {"type": "boolean"},
     "history_file": {"type": "string"},
+    "history_persist": {"type": "boolean"},
+    "history_size": {"type": "integer", "minimum": 1},
+    "history_sync_interval": {"type": "number", "minimum": 0},
     "cache_dir": {"type": ["string", "null"]},
     "container_shell": {
         "type": "string",
         "enum": ["/bin/bash", "/bin/sh", "/bin/csh", "/bin/tsch"],
     },
     "container_tech": {"type": "string", "enum": ["docker", "podman"]},
+    "command_workers": {"type": "integer", "minimum": 1},
+    "output_frame_rate": {"type": ["number", "null"], "exclusiveMinimum": 0},
+    "output_passthrough": {"type": "boolean"},
+    "predict_echo": {"type": "string", "enum": ["adaptive", "always", "never"]},
+    "scrollback_size": {"type": "number", "minimum": 0},
     # We pull from these
     "trusted_pull_registries": {"type": "array", "items": {"type": "string"}},
     # This is where we push to
@@ -191,7 +191,7 @@ class EmptySettings:
         """
         Given a value, make substitutions
         """
-        if isinstance(value, bool) or not value:
+        if isinstance(value, (bool, int, float)) or not value:
             return value
 
         # Currently dicts only support boolean or null so we return as is
@@ -2,7 +2,7 @@ __author__ = "Vanessa Sochat, Alec Scott"
 __copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
 __license__ = "Apache-2.0"
 
-__version__ = "0.1.1"
+__version__ = "0.1.2"
 AUTHOR = "Vanessa Sochat, Alec Scott"
 EMAIL = "vsoch@noreply.github.users.com"
 NAME = "paks"
@@ -0,0 +1,37 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.agent import HelperAgent
+from engine_server import EngineServer
+import paks.backends.agent
+import tempfile
+import pytest
+import os
+
+
+@pytest.fixture
+def engine_server():
+    """
+    A stand-in engine API (the socket path must be short, so not tmp_path).
+    """
+    tempdir = tempfile.mkdtemp(prefix="paks-")
+    server = EngineServer(os.path.join(tempdir, "engine.sock"))
+    server.start()
+    yield server
+    server.stop()
+    os.rmdir(tempdir)
+
+
+@pytest.fixture
+def agent(tmp_path, monkeypatch):
+    """
+    An agent run on the host, by an engine that runs exec commands as they are.
+    """
+    engine = tmp_path / "engine"
+    engine.write_text('#!/bin/sh\n[ "$1" = exec ] || exit 1\nshift 3\nexec "$@"\n')
+    engine.chmod(0o755)
+    monkeypatch.setattr(paks.backends.agent, "env_prefix", str(tmp_path / "paks-"))
+    agent = HelperAgent(str(engine), "app", exports=True)
+    yield agent
+    agent.close()
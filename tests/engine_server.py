@@ -0,0 +1,129 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+# A stand-in for a container engine's API, used by the paks tests. It
+# listens on a unix socket and answers with the routes a test gives it,
+# keeping the requests it got and how many connections were made.
+#
+#   server = EngineServer(path)
+#   server.route("GET", "/containers/app/json", lambda r: r.reply(200, {}))
+
+from http.server import BaseHTTPRequestHandler
+import socketserver
+import threading
+import json
+import os
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.engine.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def address_string(self):
+        return "unix"
+
+    @property
+    def body(self):
+        if not hasattr(self, "_body"):
+            size = int(self.headers.get("Content-Length") or 0)
+            self._body = self.rfile.read(size)
+        return self._body
+
+    def reply(self, status, obj=None, raw=None, headers=None):
+        """
+        Answer with json (obj) or bytes (raw), and any extra headers.
+        """
+        body = raw if raw is not None else json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header(
+            "Content-Type", "application/json" if raw is None else "text/plain"
+        )
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def stream(self, chunks, status=200):
+        """
+        Answer with a chunked response, one chunk for each of chunks.
+        """
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        # A client may stop reading early, and close the connection
+        try:
+            for chunk in chunks:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def drop(self):
+        """
+        Close the connection without an answer.
+        """
+        self.close_connection = True
+
+    def handle_request(self):
+        engine = self.server.engine
+        path = self.path.split("?", 1)[0]
+        engine.requests.append((self.command, self.path))
+        route = engine.routes.get((self.command, path))
+        if not route:
+            return self.reply(404, {"message": "page not found"})
+        self.body
+        route(self)
+
+    do_GET = do_HEAD = do_PUT = do_POST = do_DELETE = handle_request
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class EngineServer:
+    """
+    An engine API on a unix socket, answering with the routes it is given.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.routes = {}
+        self.requests = []
+        self.connections = 0
+        self.server = None
+
+    def route(self, method, path, answer):
+        """
+        Answer requests for a path (without the query) with answer(request).
+        """
+        self.routes[(method, path)] = answer
+
+    def count(self, method, path):
+        return sum(
+            1 for r in self.requests if r[0] == method and r[1].split("?")[0] == path
+        )
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.server = Server(self.path, Handler)
+        self.server.engine = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        os.remove(self.path)
@@ -0,0 +1,39 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.agent import HelperAgent
+import stat
+import os
+
+
+def test_export_makes_private_directory(agent):
+    env_dir = agent.env_dir
+    assert not os.path.exists(env_dir)
+    assert agent.export("GREETING", "hello")
+    assert stat.S_IMODE(os.stat(env_dir).st_mode) == 0o700
+    with open(agent.env_file) as fd:
+        assert fd.read() == "export GREETING=hello\n"
+
+    # The directory goes away with the session
+    agent.close()
+    assert not os.path.exists(env_dir)
+
+
+def test_export_is_tried_again(agent):
+    # Another's directory (here, not private) is never used
+    os.mkdir(agent.env_dir, 0o755)
+    os.chmod(agent.env_dir, 0o755)
+    assert not agent.export("GREETING", "hello")
+    assert not os.path.exists(agent.env_file)
+
+    # But once it can be made, exports go there
+    os.rmdir(agent.env_dir)
+    assert agent.export("GREETING", "hello")
+    assert os.path.exists(agent.env_file)
+
+
+def test_no_exports(tmp_path):
+    agent = HelperAgent("docker", "app")
+    assert agent.env_file is None
+    assert not agent.export("GREETING", "hello")
@@ -0,0 +1,91 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.breaker import CircuitBreaker, EngineUnavailable
+from paks.commands.command import Command
+import paks.backends.breaker
+import subprocess
+import pytest
+
+
+def hang():
+    raise subprocess.TimeoutExpired(["docker", "inspect"], 15)
+
+
+def test_budgets():
+    get_budget = paks.backends.breaker.get_budget
+    assert get_budget(["docker", "inspect", "app"]) == 15
+    assert get_budget(["docker", "build", "."]) == 1800
+    assert get_budget(["docker"]) == paks.backends.breaker.default_budget
+    assert paks.backends.breaker.counted(["docker", "inspect", "app"])
+    for cmd in ["docker", "cp"], ["podman", "commit"], ["docker", "build"]:
+        assert not paks.backends.breaker.counted(cmd)
+
+
+def test_opens_after_timeouts(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(paks.backends.breaker.time, "monotonic", lambda: now[0])
+    told = []
+    breaker = CircuitBreaker("docker", notify=told.append)
+    for _ in range(paks.backends.breaker.failure_threshold):
+        with pytest.raises(EngineUnavailable):
+            breaker.call(hang)
+    assert not breaker.closed
+    assert "wait 2s" in told[-1]
+
+    # Calls fail right away, until one is let through after the backoff
+    with pytest.raises(EngineUnavailable, match="trying again in 2s"):
+        breaker.call(lambda: "answer")
+    now[0] += 2
+    assert breaker.call(lambda: "answer") == "answer"
+    assert breaker.closed
+    assert told[-1] == "docker is responding again."
+
+
+def test_uncounted_timeouts_leave_it_closed():
+    breaker = CircuitBreaker("docker")
+    for _ in range(paks.backends.breaker.failure_threshold + 1):
+        with pytest.raises(EngineUnavailable, match="did not finish"):
+            breaker.call(hang, counted=False)
+    assert breaker.closed
+
+
+def stream(cmd):
+    """
+    Stream a command, returning the lines shown and the result.
+    """
+    lines = []
+    command = Command("docker")
+    streamed = command.stream_command(cmd)
+    try:
+        while True:
+            lines += next(streamed)
+    except StopIteration as e:
+        return lines, e.value, command.breaker
+
+
+@pytest.fixture
+def budgets(monkeypatch):
+    monkeypatch.setattr(paks.backends.breaker, "breakers", {})
+    monkeypatch.setitem(paks.backends.breaker.budgets, "-c", 0.5)
+
+
+def test_stream_times_out_on_inactivity(budgets):
+    # It runs longer than the budget, but never goes quiet that long
+    script = "for i in 1 2 3 4 5; do echo $i; sleep 0.2; done"
+    lines, result, breaker = stream(["sh", "-c", script])
+    assert lines == ["1", "2", "3", "4", "5"]
+    assert result is None
+
+    with pytest.raises(EngineUnavailable, match="no output"):
+        stream(["sh", "-c", "echo started; sleep 5"])
+    assert breaker.failures == 1
+
+
+def test_slow_data_bound_command_is_a_failure(budgets, monkeypatch):
+    monkeypatch.setattr(paks.backends.breaker, "data_bound", ("-c",))
+    _, result, breaker = stream(["sh", "-c", "sleep 5"])
+    assert result.returncode
+    assert "no output" in result.message
+    assert not breaker.failures
@@ -0,0 +1,82 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.cache import MetadataCache
+import paks.backends.cache
+import threading
+import pytest
+
+
+def test_values_are_kept_until_they_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(paks.backends.cache.time, "monotonic", lambda: now[0])
+    cache = MetadataCache()
+    calls = []
+    fetch = lambda: calls.append(1) or len(calls)
+    assert cache.get("app", "size", fetch) == 1
+    assert cache.get("app", "size", fetch) == 1
+    now[0] += paks.backends.cache.default_ttls["size"] + 1
+    assert cache.get("app", "size", fetch) == 2
+
+
+def test_invalidate_and_keep():
+    cache = MetadataCache()
+    assert cache.get("app", "inspect", lambda: "old") == "old"
+    cache.invalidate("app", ["inspect"])
+    assert cache.get("app", "inspect", lambda: "new") == "new"
+
+    # A value keep refuses is fetched again next time
+    cache.invalidate("app")
+    assert cache.get("app", "inspect", lambda: None, keep=bool) is None
+    assert cache.get("app", "inspect", lambda: "found", keep=bool) == "found"
+
+
+def test_callers_share_a_fetch():
+    cache = MetadataCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "doc"
+
+    results = []
+    first = threading.Thread(
+        target=lambda: results.append(cache.get("app", "inspect", fetch))
+    )
+    first.start()
+    started.wait(5)
+    second = threading.Thread(
+        target=lambda: results.append(cache.get("app", "inspect", fetch))
+    )
+    second.start()
+    release.set()
+    for thread in first, second:
+        thread.join(5)
+    assert results == ["doc", "doc"]
+    assert len(calls) == 1
+
+
+def test_fetch_finished_after_invalidate_is_not_kept():
+    cache = MetadataCache()
+
+    def fetch():
+        cache.invalidate("app")
+        return "stale"
+
+    assert cache.get("app", "inspect", fetch) == "stale"
+    assert cache.get("app", "inspect", lambda: "fresh") == "fresh"
+
+
+def test_errors_are_not_kept():
+    cache = MetadataCache()
+
+    def fail():
+        raise OSError("engine is gone")
+
+    with pytest.raises(OSError):
+        cache.get("app", "inspect", fail)
+    assert cache.get("app", "inspect", lambda: "doc") == "doc"
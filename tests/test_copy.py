@@ -0,0 +1,230 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.engine import EngineClient, LibpodClient
+from paks.commands import DockerCommands
+from paks.commands.cp import Copy
+import tarfile
+import base64
+import json
+import io
+import os
+import pytest
+
+
+def path_stat(request, found):
+    """
+    Answer a HEAD of a container path like the engine, from found (path: mode).
+    """
+    path = request.path.split("path=", 1)[1].replace("%2F", "/")
+    if path not in found:
+        return request.reply(404, {"message": "no such path"})
+    stat = {"name": os.path.basename(path), "mode": found[path], "size": 0}
+    header = base64.b64encode(json.dumps(stat).encode()).decode()
+    request.reply(200, raw=b"", headers={"X-Docker-Container-Path-Stat": header})
+
+
+def receive_archive(archives):
+    def answer(request):
+        with tarfile.open(fileobj=io.BytesIO(request.body)) as tar:
+            archives.append((request.path, tar.getnames()))
+        request.reply(200, raw=b"")
+
+    return answer
+
+
+def test_stat_path(engine_server):
+    found = {"/tmp": (1 << 31) | 0o1777, "/etc/hosts": 0o644}
+    engine_server.route(
+        "HEAD", "/containers/app/archive", lambda request: path_stat(request, found)
+    )
+    client = EngineClient(engine_server.path)
+    assert client.stat_path("app", "/tmp")["mode"] == (1 << 31) | 0o1777
+    assert client.stat_path("app", "/etc/hosts")["name"] == "hosts"
+    assert client.stat_path("app", "/missing") is None
+    client.close()
+
+
+def test_put_archive(engine_server, tmp_path):
+    archives = []
+    engine_server.route("PUT", "/containers/app/archive", receive_archive(archives))
+    (tmp_path / "notes.txt").write_text("notes")
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        tar.add(str(tmp_path / "notes.txt"), arcname="notes.txt")
+    client = EngineClient(engine_server.path)
+    client.put_archive("app", "/root", archive, archive.tell())
+    assert archives == [("/containers/app/archive?path=%2Froot", ["notes.txt"])]
+    client.close()
+
+
+def test_copies_on_a_line_are_one_archive(engine_server, tmp_path):
+    archives = []
+    found = {"/tmp": (1 << 31) | 0o1777}
+    engine_server.route(
+        "HEAD", "/containers/app/archive", lambda request: path_stat(request, found)
+    )
+    engine_server.route("PUT", "/containers/app/archive", receive_archive(archives))
+    for name in "a.txt", "b.txt":
+        (tmp_path / name).write_text(name)
+    line = "#cp host:%s/a.txt /tmp; #cp host:%s/b.txt /data/b.txt" % (
+        tmp_path,
+        tmp_path,
+    )
+    executor = DockerCommands("docker").get_executor(line)
+    client = EngineClient(engine_server.path)
+    result = executor.run(container_name="app", name="ubuntu", engine=client)
+    assert not result.returncode
+    assert archives == [
+        ("/containers/app/archive?path=%2F", ["tmp/a.txt", "data/b.txt"])
+    ]
+    client.close()
+
+
+@pytest.fixture
+def mounted(engine_server, tmp_path, monkeypatch):
+    """
+    A podman engine that mounts the container at a directory, and the host.
+    """
+    root = tmp_path / "root"
+    host = tmp_path / "host"
+    outside = tmp_path / "outside"
+    for path in root / "etc", root / "usr/lib", host, outside:
+        path.mkdir(parents=True)
+    engine_server.route(
+        "GET",
+        "/libpod/_ping",
+        lambda request: request.reply(
+            200, raw=b"OK", headers={"Libpod-API-Version": "4.9.3"}
+        ),
+    )
+    prefix = "/v4.9.3/libpod/containers/app"
+    engine_server.route(
+        "POST", prefix + "/mount", lambda request: request.reply(200, str(root))
+    )
+    engine_server.route(
+        "POST", prefix + "/unmount", lambda request: request.reply(204, raw=b"")
+    )
+    realpath = os.path.realpath(str(root))
+    monkeypatch.setattr(os.path, "ismount", lambda path: path == realpath)
+    client = LibpodClient(engine_server.path)
+    client.ping()
+    yield client, root, host, outside
+    client.close()
+
+
+def copy(client, src, dest):
+    return Copy("podman").run_mount(client, "app", src, dest)
+
+
+def test_mount_copy_to_container(mounted):
+    client, root, host, _ = mounted
+    (host / "notes.txt").write_text("notes")
+    (host / "tree/sub").mkdir(parents=True)
+    (host / "tree/sub/file").write_text("file")
+    os.symlink("sub/file", str(host / "tree/link"))
+
+    assert not copy(client, "host:%s/notes.txt" % host, "/etc").returncode
+    assert (root / "etc/notes.txt").read_text() == "notes"
+    assert not copy(client, "host:%s/notes.txt" % host, "/etc/renamed").returncode
+    assert (root / "etc/renamed").read_text() == "notes"
+
+    # Copied twice, a tree is merged into what is there
+    for _ in range(2):
+        assert not copy(client, "host:%s/tree" % host, "/").returncode
+    assert (root / "tree/sub/file").read_text() == "file"
+    assert os.readlink(str(root / "tree/link")) == "sub/file"
+
+
+def test_mount_copy_to_host(mounted):
+    client, root, host, _ = mounted
+    (root / "etc/tree").mkdir()
+    (root / "etc/tree/file").write_text("file")
+    os.symlink("/etc/passwd", str(root / "etc/tree/link"))
+
+    assert not copy(client, "/../../etc/tree", "host:%s" % host).returncode
+    assert (host / "tree/file").read_text() == "file"
+
+    # A link in the container is copied as a link, not followed on the host
+    assert os.readlink(str(host / "tree/link")) == "/etc/passwd"
+
+
+def test_mount_copy_refuses_planted_symlink(mounted):
+    client, root, host, outside = mounted
+    (host / "notes.txt").write_text("notes")
+    (outside / "target").write_text("host file")
+    os.symlink(str(outside / "target"), str(root / "etc/notes.txt"))
+    os.symlink(str(outside), str(root / "etc/dir"))
+
+    # At the destination, or met while copying a file into a directory
+    for dest in "/etc/notes.txt", "/etc/dir":
+        result = copy(client, "host:%s/notes.txt" % host, dest)
+        assert result.returncode
+        assert "symbolic link" in result.message
+    result = copy(client, "host:%s/notes.txt" % host, "/etc")
+    assert result.returncode
+    assert (outside / "target").read_text() == "host file"
+    assert os.listdir(str(outside)) == ["target"]
+
+
+def test_mount_copy_refuses_symlink_in_tree(mounted):
+    client, root, host, outside = mounted
+    (host / "tree/sub").mkdir(parents=True)
+    (host / "tree/sub/file").write_text("file")
+    (root / "tree").mkdir()
+    os.symlink(str(outside), str(root / "tree/sub"))
+
+    result = copy(client, "host:%s/tree" % host, "/")
+    assert result.returncode
+    assert not os.listdir(str(outside))
+
+
+def test_mount_copy_through_link_uses_cli(mounted):
+    client, root, host, outside = mounted
+    (host / "notes.txt").write_text("notes")
+    os.symlink("usr/lib", str(root / "lib"))
+    os.symlink(str(outside), str(root / "etc/dir"))
+
+    # The CLI resolves links on the way inside of the container
+    for dest in "/lib/notes.txt", "/etc/dir/notes.txt":
+        assert copy(client, "host:%s/notes.txt" % host, dest) is None
+    assert copy(client, "/etc/dir/target", "host:%s" % host) is None
+    assert not os.listdir(str(outside))
+
+
+def test_mount_copy_uses_cli_when_mount_fails(mounted, engine_server):
+    client, root, host, _ = mounted
+    (host / "notes.txt").write_text("notes")
+    engine_server.route(
+        "POST",
+        "/v4.9.3/libpod/containers/app/mount",
+        lambda request: request.reply(500, {"message": "cannot mount"}),
+    )
+    assert copy(client, "host:%s/notes.txt" % host, "/etc") is None
+
+
+def test_batch_copies_go_on_after_failure(tmp_path, monkeypatch):
+    # A CLI that copies (into root, for the container) and fails for missing files
+    root = tmp_path / "root"
+    root.mkdir()
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    docker = bin_dir / "docker"
+    docker.write_text(
+        '#!/bin/sh\n[ "$1" = cp ] || exit 1\n'
+        'exec cp "$2" "%s/$(basename "${3#*:}")"\n' % root
+    )
+    docker.chmod(0o755)
+    monkeypatch.setenv("PATH", "%s:%s" % (bin_dir, os.environ["PATH"]))
+    (tmp_path / "b.txt").write_text("b")
+
+    line = "#cp host:%s/missing.txt /a.txt; #cp host:%s/b.txt /b.txt" % (
+        tmp_path,
+        tmp_path,
+    )
+    executor = DockerCommands("docker").get_executor(line, status=lambda line: None)
+    result = executor.run(container_name="app", name="ubuntu")
+    assert result.returncode
+    assert "missing.txt" in result.message
+    assert os.listdir(str(root)) == ["b.txt"]
@@ -0,0 +1,73 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.editor import LineEditor
+from paks.backends.vt import VtParser
+import pytest
+
+left, right, home, end = b"\x1b[D", b"\x1b[C", b"\x01", b"\x05"
+
+
+def type_keys(keys, editor=None):
+    """
+    Type keys into an editor, returning it and the actions that came out.
+    """
+    editor = editor or LineEditor()
+    parser = VtParser()
+    actions = []
+    for event in parser.feed(keys):
+        action = editor.handle(event)
+        if action:
+            actions.append(action)
+    return editor, actions
+
+
+@pytest.mark.parametrize(
+    "keys,line,cursor",
+    [
+        (b"echo hi", "echo hi", 7),
+        (b"echo hi" + left * 2 + b"X", "echo Xhi", 6),
+        (b"abc" + home + b">" + end + b"<", ">abc<", 5),
+        (b"abc" + left + b"\x7f", "ac", 1),
+        (b"abc" + home + b"\x1b[3~", "bc", 0),
+        (b"abc" + left * 5 + right + b"-", "a-bc", 2),
+        (b"ls -la /tmp\x17", "ls -la ", 7),
+        (b"ls -la /tmp" + left * 4 + b"\x0b", "ls -la ", 7),
+        (b"ls -la /tmp" + left * 4 + b"\x15", "/tmp", 0),
+    ],
+)
+def test_editing(keys, line, cursor):
+    editor, actions = type_keys(keys)
+    assert (editor.line, editor.cursor) == (line, cursor)
+    assert not actions
+
+
+def test_characters_move_and_delete_whole():
+    editor, _ = type_keys("añ✓b".encode("utf-8") + left * 2)
+    assert editor.cursor == len("añ".encode("utf-8"))
+    type_keys(b"\x7f" + b"\x1b[3~", editor)
+    assert editor.line == "ab"
+
+
+def test_actions():
+    _, actions = type_keys(b"\x1b[A\x1bOB\x12")
+    assert actions == [("up", None), ("down", None), ("search", None)]
+
+    editor, actions = type_keys(b"make\r")
+    assert actions == [("submit", "make")]
+    assert editor.line == ""
+
+
+def test_paste_keeps_text_after_last_newline():
+    editor, _ = type_keys(b"x\x1b[200~ls\rcd /tmp\x1b[201~")
+    assert editor.line == "cd /tmp"
+
+
+def test_long_line_is_not_submitted():
+    editor, actions = type_keys(b"abcdef\r", LineEditor(limit=4))
+    assert actions == [("submit", None)]
+
+    # The next line is tracked again
+    _, actions = type_keys(b"ab\r", editor)
+    assert actions == [("submit", "ab")]
@@ -0,0 +1,179 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.cache import EventWatcher
+from paks.backends.engine import EngineClient, EngineError, LibpodClient
+import paks.backends.engine
+import threading
+import json
+import pytest
+
+
+def inspect(request):
+    request.reply(200, {"Id": "abc", "Name": "/app"})
+
+
+def test_connection_is_reused(engine_server):
+    engine_server.route("GET", "/containers/app/json", inspect)
+    client = EngineClient(engine_server.path)
+    for _ in range(3):
+        assert client.inspect_container("app")["Id"] == "abc"
+    assert engine_server.connections == 1
+    client.close()
+
+
+def test_closed_idle_connection_is_retried(engine_server):
+    def inspect_and_close(request):
+        inspect(request)
+        request.close_connection = True
+
+    engine_server.route("GET", "/containers/app/json", inspect_and_close)
+    client = EngineClient(engine_server.path)
+    assert client.inspect_container("app")["Id"] == "abc"
+
+    # The engine closed the connection we kept, so a new one is made
+    assert client.inspect_container("app")["Id"] == "abc"
+    assert engine_server.connections == 2
+    assert engine_server.count("GET", "/containers/app/json") == 2
+    client.close()
+
+
+def test_post_is_sent_once(engine_server):
+    engine_server.route("GET", "/containers/app/json", inspect)
+    engine_server.route("POST", "/commit", lambda request: request.drop())
+    client = EngineClient(engine_server.path)
+    client.inspect_container("app")
+
+    # A POST doesn't use the idle connection, so it isn't sent again
+    with pytest.raises(paks.backends.engine.unavailable):
+        client.commit("app", "app-tmp")
+    assert engine_server.count("POST", "/commit") == 1
+    assert len(client.idle) == 1
+    client.close()
+
+
+def test_stream_decodes_documents_across_chunks(engine_server):
+    messages = [{"stream": "Step 1/1 : FROM ubuntu\n"}, {"aux": {"ID": "sha"}}]
+    messages += [{"stream": "Successfully built ✓\n"}]
+    data = b"\r\n".join(json.dumps(m, ensure_ascii=False).encode() for m in messages)
+
+    # Documents split anywhere (even in a character) and several in a chunk
+    chunks = [data[i : i + 7] for i in range(0, len(data), 7)]
+    engine_server.route("POST", "/build", lambda request: request.stream(chunks))
+    client = EngineClient(engine_server.path)
+    assert list(client.build(b"context", "app-saved")) == messages
+
+    # The stream was read to the end, so its connection is kept
+    assert len(client.idle) == 1
+    client.close()
+
+
+def test_stream_stopped_early_closes_connection(engine_server):
+    chunks = [b'{"Action": "start"}\n', b'{"Action": "die"}\n']
+    engine_server.route("GET", "/events", lambda request: request.stream(chunks))
+    client = EngineClient(engine_server.path)
+    events = client.events()
+    assert next(events) == {"Action": "start"}
+    events.close()
+    assert not client.idle
+
+
+def test_stopped_watcher_closes_stream(engine_server):
+    finished = threading.Event()
+
+    def events():
+        yield b'{"Action": "start"}\n'
+        finished.wait(10)
+
+    engine_server.route("GET", "/events", lambda request: request.stream(events()))
+    client = EngineClient(engine_server.path)
+    seen = []
+    watcher = EventWatcher("docker", {}, seen.append, engine=client).start()
+    while not seen:
+        watcher.thread.join(0.01)
+
+    # The watcher is waiting on the engine for more, stopping ends that
+    watcher.stop()
+    watcher.thread.join(5)
+    finished.set()
+    assert not watcher.thread.is_alive()
+    assert seen == [{"Action": "start"}]
+    assert not client.idle
+
+
+@pytest.mark.parametrize(
+    "answer,message",
+    [
+        ({"obj": {"message": "No such container: app"}}, "No such container: app"),
+        ({"raw": b"engine is down\n"}, "engine is down"),
+        ({"raw": b""}, "Internal Server Error"),
+    ],
+)
+def test_errors_are_mapped(engine_server, answer, message):
+    status = 404 if "obj" in answer else 500
+    engine_server.route(
+        "GET", "/containers/app/json", lambda request: request.reply(status, **answer)
+    )
+    engine_server.route(
+        "GET", "/events", lambda request: request.reply(status, **answer)
+    )
+    client = EngineClient(engine_server.path)
+    with pytest.raises(EngineError) as error:
+        client.inspect_container("app")
+    assert (error.value.status, error.value.message) == (status, message)
+
+    # The connection is still good after an error
+    with pytest.raises(EngineError) as error:
+        list(client.events())
+    assert (error.value.status, error.value.message) == (status, message)
+    assert engine_server.connections == 1
+    client.close()
+
+
+def test_engine_not_there(tmp_path):
+    client = EngineClient(str(tmp_path / "missing.sock"))
+    with pytest.raises(paks.backends.engine.unreachable):
+        client.ping()
+
+
+@pytest.mark.parametrize("version,prefix", [("4.9.3", "/v4.9.3/libpod"), (None, None)])
+def test_libpod_prefix(engine_server, version, prefix):
+    prefix = prefix or "/v%s/libpod" % paks.backends.engine.libpod_version
+    headers = {"Libpod-API-Version": version} if version else {}
+    engine_server.route(
+        "GET",
+        "/libpod/_ping",
+        lambda request: request.reply(200, raw=b"OK", headers=headers),
+    )
+    engine_server.route("GET", prefix + "/containers/app/json", inspect)
+    engine_server.route(
+        "POST", prefix + "/containers/app/mount", lambda r: r.reply(200, "/mnt/app")
+    )
+    engine_server.route(
+        "GET",
+        "/containers/app/stats",
+        lambda request: request.stream([b'{"read": "now"}\n']),
+    )
+    client = LibpodClient(engine_server.path)
+    assert client.ping()
+    assert client.prefix == prefix
+    assert client.inspect_container("app")["Id"] == "abc"
+    assert client.mount_container("app") == "/mnt/app"
+
+    # Stats come from the compatible (Docker) endpoint, without the prefix
+    assert list(client.stats("app")) == [{"read": "now"}]
+    client.close()
+
+
+def test_get_client(engine_server, monkeypatch):
+    engine_server.route("GET", "/_ping", lambda request: request.reply(200, raw=b"OK"))
+    monkeypatch.setenv("DOCKER_HOST", "unix://" + engine_server.path)
+    assert isinstance(paks.backends.engine.get_client("docker"), EngineClient)
+
+    monkeypatch.setenv("DOCKER_HOST", "unix://" + engine_server.path + ".missing")
+    assert paks.backends.engine.get_client("docker") is None
+
+    # A remote engine is for the CLI
+    monkeypatch.setenv("DOCKER_HOST", "tcp://127.0.0.1:2375")
+    assert paks.backends.engine.get_client("docker") is None
@@ -0,0 +1,51 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.commands import DockerCommands
+import paks.defaults
+import subprocess
+import pytest
+
+environment = 'GREETING="hello world"\nSEARCH=$HOME/bin:/opt\n'
+
+
+@pytest.fixture
+def envs(tmp_path, monkeypatch):
+    monkeypatch.setattr(paks.defaults, "paksenvs", str(tmp_path))
+    (tmp_path / "dev").write_text(environment)
+    monkeypatch.setenv("PAKS_LITERAL", "it's $HOME")
+
+
+def run(line, agent=None):
+    typed = []
+    executor = DockerCommands("docker").get_executor(line, out=typed.append)
+    result = executor.run(
+        container_name="app", name="ubuntu", original=line, agent=agent
+    )
+    assert not result.returncode
+    return b"".join(typed).decode("utf-8")
+
+
+def shell_values(script):
+    """
+    What the exports mean to the shell.
+    """
+    script += '\nprintf "%s|%s|%s" "$GREETING" "$SEARCH" "$PAKS_LITERAL"'
+    env = {"HOME": "/home/dinosaur", "PATH": "/usr/bin:/bin"}
+    return subprocess.check_output(["bash", "-c", script], env=env).decode("utf-8")
+
+
+expected = "hello world|/home/dinosaur/bin:/opt|it's $HOME"
+
+
+def test_typed_exports(envs):
+    typed = run("#envload dev") + run("#envhost PAKS_LITERAL")
+    assert ' export GREETING="hello world"\r' in typed
+    assert shell_values(typed.replace("\r", "\n")) == expected
+
+
+def test_agent_exports(envs, agent):
+    assert run("#envload dev; #envhost PAKS_LITERAL", agent) == ""
+    with open(agent.env_file) as fd:
+        assert shell_values(fd.read()) == expected
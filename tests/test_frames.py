@@ -0,0 +1,68 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.frames import FrameCoalescer
+import os
+import pytest
+
+
+class Proxy:
+    """
+    Keeps what the coalescer schedules and writes, instead of a terminal.
+    """
+
+    def __init__(self):
+        self.to_terminal = bytearray()
+        self.timers = []
+        self.written = []
+
+    def call_later(self, delay, callback):
+        self.timers.append(callback)
+
+    def echo(self, data):
+        self.written.append(data)
+
+    def run_timers(self):
+        timers, self.timers = self.timers, []
+        for callback in timers:
+            callback()
+
+
+@pytest.fixture
+def frames(monkeypatch):
+    monkeypatch.setattr("shutil.get_terminal_size", lambda: os.terminal_size((80, 3)))
+    proxy = Proxy()
+    return FrameCoalescer(proxy, 60), proxy
+
+
+def test_output_between_frames_is_one_write(frames):
+    coalescer, proxy = frames
+    coalescer.feed(b"one\n")
+    coalescer.feed(b"two\n")
+    assert not proxy.written and len(proxy.timers) == 1
+
+    # The terminal hasn't taken the last frame yet, so it waits
+    proxy.to_terminal += b"x"
+    proxy.run_timers()
+    assert not proxy.written
+    proxy.to_terminal.clear()
+    proxy.run_timers()
+    assert proxy.written == [b"one\ntwo\n"]
+
+
+def test_lines_past_the_screen_are_skipped(frames):
+    coalescer, proxy = frames
+    for number in range(10):
+        coalescer.feed(b"line %d\n" % number)
+    coalescer.flush()
+
+    # What fits above the cursor's row
+    assert proxy.written == [b"line 8\nline 9\n"]
+
+
+def test_lines_with_escapes_are_kept(frames):
+    coalescer, proxy = frames
+    coalescer.feed(b"a\nb\n\x1b[31mred\nc\nd\ne\nf\n")
+    coalescer.flush()
+    assert proxy.written == [b"\x1b[31mred\nc\nd\ne\nf\n"]
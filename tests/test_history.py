@@ -0,0 +1,52 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.history import SessionHistory
+
+
+def lines(history):
+    return [history.get(i) for i in range(len(history), 0, -1)]
+
+
+def test_running_command_is_kept():
+    history = SessionHistory()
+    history.add("ls")
+    history.add("make")
+
+    # The sync ran while make was running, so only ls is in the file
+    history.update("ls\n")
+    assert lines(history) == ["ls", "make"]
+    assert history.get(1) == "make"
+
+    # Once make finished it is confirmed, not added again
+    history.update("make\n")
+    assert lines(history) == ["ls", "make"]
+    assert not history.pending
+
+
+def test_lines_the_shell_skipped_are_dropped():
+    history = SessionHistory()
+    for line in "ls", "secret", "pwd":
+        history.add(line)
+
+    # pwd was kept after secret, so the shell isn't keeping secret
+    history.update("ls\npwd\n")
+    assert lines(history) == ["ls", "pwd"]
+
+
+def test_file_adds_lines_and_partial_line_waits():
+    history = SessionHistory()
+    history.add("ls")
+    history.update("cd /tmp\nls\nech")
+    assert lines(history) == ["cd /tmp", "ls"]
+    assert history.offset == len("cd /tmp\nls\n")
+
+
+def test_ignored_lines():
+    history = SessionHistory()
+    for line in "ls", "ls", " secret", "":
+        history.add(line)
+    assert lines(history) == ["ls"]
+    history.update("ls\nls\n")
+    assert lines(history) == ["ls"]
@@ -0,0 +1,45 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.latency import Histogram, LatencyTracker
+import paks.backends.latency
+import pytest
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 129, 1000, 123456, 2**35 + 7])
+def test_bucket_error_is_bounded(value):
+    histogram = Histogram()
+    upper = histogram.value(histogram.index(value))
+    assert value <= upper <= value * 1.016 + 1
+
+
+def test_percentiles():
+    histogram = Histogram()
+    for ms in range(1, 101):
+        histogram.record(ms / 1000)
+    summary = histogram.summary()
+    assert summary["count"] == 100
+    assert (summary["min"], summary["max"]) == (1, 100)
+    assert summary["p50"] == pytest.approx(50, rel=0.01)
+    assert summary["p99"] == pytest.approx(99, rel=0.01)
+    assert Histogram().summary() == {"count": 0}
+
+
+def test_keystroke_echo(monkeypatch):
+    now = [10.0]
+    monkeypatch.setattr(paks.backends.latency.time, "monotonic", lambda: now[0])
+    tracker = LatencyTracker()
+    tracker.typed(b"l")
+    tracker.typed(b"\r")
+    now[0] += 0.02
+    tracker.output(b"l")
+    assert tracker.get("keystroke").count == 1
+    assert tracker.srtt == pytest.approx(0.02)
+
+    # A key that never comes back is given up on
+    tracker.typed(b"s")
+    now[0] += paks.backends.latency.echo_timeout + 1
+    tracker.output(b"x")
+    assert not tracker.pending
+    assert tracker.get("keystroke").count == 1
@@ -0,0 +1,64 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.model import SessionModel, parse_event
+
+
+def api_event(action, **attributes):
+    attributes.setdefault("name", "app")
+    return {"Action": action, "Actor": {"Attributes": attributes}}
+
+
+def test_parse_event():
+    assert parse_event(api_event("start", image="ubuntu")) == (
+        "app",
+        "start",
+        {"name": "app", "image": "ubuntu"},
+    )
+
+    # Podman's CLI events, and docker's health in the action
+    podman = {"Name": "app", "Status": "died", "Image": "ubuntu"}
+    assert parse_event(podman) == ("app", "died", {"image": "ubuntu"})
+    name, action, attributes = parse_event(api_event("health_status: unhealthy"))
+    assert (action, attributes["health"]) == ("health_status", "unhealthy")
+
+
+def test_events_update_state():
+    model = SessionModel()
+    state, action, notice = model.update(api_event("start", image="ubuntu"))
+    assert (state.state, action, notice) == ("running", "start", None)
+
+    _, _, notice = model.update(api_event("oom"))
+    assert "out of memory" in notice
+    model.update(api_event("die", exitCode="137"))
+    _, _, notice = model.update(api_event("restart"))
+    assert notice == "Container was restarted."
+    _, _, notice = model.update(api_event("start", image="ubuntu:24.04"))
+    assert notice == "Container image is now ubuntu:24.04."
+    assert state.summary() == (
+        "running, 1 OOM kill, 1 restart, image ubuntu:24.04, image changed 1 times"
+    )
+
+    # A health status is told once, when it changes
+    _, _, notice = model.update(api_event("health_status: healthy"))
+    assert notice == "Container is healthy."
+    _, _, notice = model.update(api_event("health_status: healthy"))
+    assert notice is None
+    assert model.update({"Action": "prune"}) == (None, "prune", None)
+
+
+def test_sync_and_disconnect():
+    model = SessionModel()
+    info = {
+        "State": {"Status": "exited", "ExitCode": 1, "OOMKilled": True},
+        "RestartCount": 2,
+        "Config": {"Image": "ubuntu"},
+    }
+    state = model.sync("app", info)
+    assert state.synced
+    assert state.summary() == (
+        "exited, exit code 1, 1 OOM kill, 2 restarts, image ubuntu"
+    )
+    model.disconnected()
+    assert not model.get("app").synced
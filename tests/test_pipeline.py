@@ -0,0 +1,63 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.engine import EngineClient
+from paks.commands import DockerCommands
+from paks.commands.pipeline import split_commands
+import pytest
+
+
+def test_split_commands():
+    line = "#envload github ; #inspect config;#cp host:a;b /tmp"
+    assert split_commands(line) == [
+        "#envload github",
+        "#inspect config",
+        "#cp host:a;b /tmp",
+    ]
+    assert split_commands("  #size  ") == ["#size"]
+
+
+def test_plan_batches_copies_to_the_container():
+    line = "#cp host:a /a; #cp host:b /b; #size; #cp host:c /c; #cp /d host:d"
+    executor = DockerCommands("docker").get_executor(line)
+    kinds = [type(step).__name__ for _, step in executor.steps]
+    assert kinds == ["CopyBatch", "Size", "Copy", "Copy"]
+    assert len(executor.steps[0][1].copies) == 2
+
+
+def test_unknown_command_is_not_a_pipeline():
+    assert DockerCommands("docker").get_executor("#size; #nope") is None
+
+
+@pytest.fixture
+def inspected(engine_server):
+    document = {"Id": "abc", "Config": {"Env": ["A=1"]}}
+    engine_server.route(
+        "GET", "/containers/app/json", lambda request: request.reply(200, document)
+    )
+    client = EngineClient(engine_server.path)
+    yield client
+    client.close()
+
+
+def run(line, engine):
+    shown = []
+    executor = DockerCommands("docker").get_executor(line, status=shown.append)
+    return executor.run(container_name="app", name="ubuntu", engine=engine)
+
+
+def test_inspect_is_fetched_once(engine_server, inspected):
+    result = run("#inspect Config.Env; #inspect Id", inspected)
+    assert not result.returncode
+    assert result.message == '["A=1"]\n\r"abc"'
+    assert engine_server.count("GET", "/containers/app/json") == 1
+
+
+def test_failure_does_not_stop_later_steps(engine_server, inspected):
+    result = run("#cp nothing; #inspect Id", inspected)
+    assert result.returncode
+    assert result.message.split("\n\r") == [
+        "You must provide a src and dest for copy.",
+        '"abc"',
+    ]
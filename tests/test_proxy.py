@@ -0,0 +1,33 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.proxy import PtyProxy
+import subprocess
+import threading
+import pty
+import os
+
+
+def test_session_ends_when_terminal_hangs_up():
+    openpty, opentty = pty.openpty()
+    process = subprocess.Popen(
+        ["sleep", "30"], stdin=opentty, stdout=opentty, stderr=opentty
+    )
+    os.close(opentty)
+    stdin, typing = os.pipe()
+    output = open(os.devnull, "wb")
+    proxy = PtyProxy(process, openpty, stdin=stdin, stdout=output.fileno())
+    try:
+        os.write(typing, b"ls\r")
+        os.close(typing)
+        thread = threading.Thread(target=proxy.run, daemon=True)
+        thread.start()
+        thread.join(5)
+        assert not thread.is_alive()
+    finally:
+        process.kill()
+        process.wait()
+        for fd in openpty, stdin:
+            os.close(fd)
+        output.close()
@@ -0,0 +1,51 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.commands.command import read_pipes
+import subprocess
+import pytest
+
+
+def read(script, timeout=None):
+    """
+    Run a shell script, returning what read_pipes yields for it.
+    """
+    process = subprocess.Popen(
+        ["sh", "-c", script], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        return list(read_pipes(process, timeout))
+    finally:
+        process.kill()
+        process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def test_partial_lines_wait_for_the_rest():
+    found = read("printf 'one\\ntw'; sleep 0.2; printf 'o\\nthr'; sleep 0.2; printf ee")
+    assert found == [("out", ["one"]), ("out", ["two"]), ("out", ["three"])]
+
+
+def test_progress_lines():
+    found = read("printf '10%%\\r'; sleep 0.2; printf '50%%\\r100%%\\r\\ndone\\n'")
+    lines = [line for _, chunk in found for line in chunk]
+    assert lines == ["10%", "50%", "100%", "done"]
+
+
+def test_both_pipes_are_read():
+    # More than a pipe holds on stderr, while stdout is also written
+    found = read("head -c 200000 /dev/zero | tr '\\0' x >&2; echo out")
+    assert ("out", ["out"]) in found
+    assert sum(len(line) for name, chunk in found for line in chunk) == 200003
+
+
+def test_characters_split_across_reads():
+    found = read("printf '\\342\\234'; sleep 0.2; printf '\\223\\n'")
+    assert found == [("out", ["✓"])]
+
+
+def test_timeout_without_output():
+    with pytest.raises(subprocess.TimeoutExpired):
+        read("echo started; sleep 5", timeout=0.3)
@@ -0,0 +1,32 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.recorder import SessionRecorder
+import stat
+import json
+import gzip
+import os
+import pytest
+
+
+@pytest.mark.parametrize("name", ["session.cast.gz", "session.cast"])
+def test_recording_is_private(tmp_path, name):
+    path = str(tmp_path / "recordings" / name)
+    umask = os.umask(0o022)
+    try:
+        recorder = SessionRecorder(path, env={"SHELL": "/bin/bash"}).open()
+    finally:
+        os.umask(umask)
+    recorder.input(b"hunter2\r")
+    recorder.output(b"\xe2\x9c")
+    recorder.output(b"\x93 done\r\n")
+    recorder.close()
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    opener = gzip.open if name.endswith(".gz") else open
+    with opener(path, "rt") as fd:
+        header, *events = [json.loads(line) for line in fd]
+    assert header["env"] == {"SHELL": "/bin/bash"}
+    assert ["i", "hunter2\r"] in [event[1:] for event in events]
+    assert "".join(event[2] for event in events if event[1] == "o") == "✓ done\r\n"
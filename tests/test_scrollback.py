@@ -0,0 +1,34 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.scrollback import Scrollback
+import paks.backends.scrollback
+
+
+def test_grep_finds_lines_without_escapes():
+    scrollback = Scrollback()
+    scrollback.feed(b"\x1b[1;32mok\x1b[0m build\r\nerror: missing\r\n")
+    scrollback.feed(b"warning: old\r\nerror: again\r\n$ gre")
+    assert scrollback.grep("^error") == [
+        (2, b"error: missing", [(0, 5)]),
+        (4, b"error: again", [(0, 5)]),
+    ]
+    assert scrollback.grep("ok build")[0][:2] == (1, b"ok build")
+
+    # The line being typed isn't searched, and the limit keeps the newest
+    assert scrollback.grep("gre") == []
+    assert [line for _, line, _ in scrollback.grep("error", limit=1)] == [
+        b"error: again"
+    ]
+
+
+def test_oldest_chunks_are_dropped(monkeypatch):
+    monkeypatch.setattr(paks.backends.scrollback, "chunk_size", 100)
+    scrollback = Scrollback(size=300)
+    for number in range(100):
+        scrollback.feed(b"line %03d\n" % number)
+    found = scrollback.grep("line")
+    assert found[-1][:2] == (100, b"line 099")
+    assert len(found) < 60
+    assert found[0][0] == int(found[0][1][5:]) + 1
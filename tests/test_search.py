@@ -0,0 +1,56 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.search import HistoryIndex
+import stat
+import os
+
+
+def index_of(*lines):
+    index = HistoryIndex()
+    for line in lines:
+        index.add(line)
+    return index
+
+
+def test_most_recent_match_first():
+    index = index_of("make test", "git status", "make docs", "ls")
+    uid, line = index.search("make")
+    assert line == "make docs"
+
+    # Searching again goes to older matches
+    uid, line = index.search("make", before=uid)
+    assert line == "make test"
+    assert index.search("make", before=uid) == (None, None)
+
+
+def test_prefix_and_substring():
+    index = index_of("echo make", "make docs")
+    assert index.search("^ech")[1] == "echo make"
+    assert index.search("^docs") == (None, None)
+    assert index.search("e d")[1] == "make docs"
+    assert index.search("cs")[1] == "make docs"
+    assert index.search("missing") == (None, None)
+
+
+def test_repeated_line_moves_to_front():
+    index = index_of("make test", "make docs", "make test")
+    assert len(index) == 2
+    uid, line = index.search("make")
+    assert line == "make test"
+    assert index.search("make", before=uid)[1] == "make docs"
+    assert index.search("make", before=uid - 1) == (None, None)
+
+
+def test_saved_lines_are_private_and_loaded(tmp_path):
+    path = str(tmp_path / "ubuntu")
+    index = HistoryIndex(path)
+    for line in "make test", "", "make docs":
+        index.save(line)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    index = HistoryIndex(path)
+    index.load(background=False)
+    assert index.search("make")[1] == "make docs"
+    assert len(index) == 2
@@ -0,0 +1,62 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.size import LayerSizes
+import paks.backends.size
+import os
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    not paks.backends.size.libc, reason="inotify is not available"
+)
+
+
+@pytest.fixture
+def sizes():
+    sizes = LayerSizes()
+    yield sizes
+    sizes.close()
+
+
+def test_layer_follows_changes(sizes, tmp_path):
+    (tmp_path / "etc").mkdir()
+    (tmp_path / "etc/hosts").write_bytes(b"x" * 100)
+    layer = sizes.get("app", str(tmp_path))
+    assert layer.size() == 100
+
+    # New directories are watched, and hard links counted once
+    (tmp_path / "var/lib").mkdir(parents=True)
+    (tmp_path / "var/lib/db").write_bytes(b"x" * 1000)
+    assert layer.size() == 1100
+    os.link(str(tmp_path / "var/lib/db"), str(tmp_path / "etc/db"))
+    (tmp_path / "etc/hosts").write_bytes(b"x" * 10)
+    assert layer.size() == 1010
+
+    os.remove(str(tmp_path / "var/lib/db"))
+    assert layer.size() == 1010
+    os.rename(str(tmp_path / "etc"), str(tmp_path / "var/etc"))
+    assert layer.size() == 1010
+    os.remove(str(tmp_path / "var/etc/db"))
+    assert layer.size() == 10
+
+    # The same layer is kept while it is there
+    assert sizes.get("app", str(tmp_path)) is layer
+
+
+def test_removed_layer(sizes, tmp_path):
+    path = tmp_path / "upper"
+    path.mkdir()
+    layer = sizes.get("app", str(path))
+    path.rmdir()
+    assert layer.size() is None
+    assert not layer.active
+    assert sizes.get("app", str(path)) is None
+
+
+def test_growth_from_baseline(sizes):
+    assert not sizes.has_baseline("app")
+    assert sizes.growth("app", 100) == 0
+    assert sizes.has_baseline("app")
+    assert sizes.growth("app", 250) == 150
+    assert sizes.growth("app", 40) == -60
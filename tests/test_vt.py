@@ -0,0 +1,53 @@
+__author__ = "Vanessa Sochat, Alec Scott"
+__copyright__ = "Copyright 2021-2022, Vanessa Sochat and Alec Scott"
+__license__ = "Apache-2.0"
+
+from paks.backends.vt import VtParser
+import paks.backends.vt as vt
+
+
+def events_of(*reads):
+    parser = VtParser()
+    events = []
+    for data in reads:
+        events += parser.feed(data)
+    return [(event.kind, event.value) for event in events], parser
+
+
+def test_text_and_controls():
+    events, _ = events_of(b"ls -l\x7f\r")
+    assert events == [(vt.PRINT, b"ls -l"), (vt.CONTROL, 0x7F), (vt.CONTROL, 0x0D)]
+
+
+def test_sequences_split_across_reads():
+    events, parser = events_of(b"a\x1b", b"[", b"3~b\x1bO", b"A")
+    assert events == [
+        (vt.PRINT, b"a"),
+        (vt.CSI, (b"3", 0x7E)),
+        (vt.PRINT, b"b"),
+        (vt.SS3, (b"", 0x41)),
+    ]
+    assert not parser.pending
+
+
+def test_characters_split_across_reads():
+    data = "✓".encode("utf-8")
+    events, _ = events_of(data[:1], data[1:2], data[2:])
+    assert events == [(vt.PRINT, data)]
+
+
+def test_lone_escape_is_flushed():
+    events, parser = events_of(b"\x1b")
+    assert events == []
+    assert parser.pending == b"\x1b"
+    assert [(e.kind, e.value) for e in parser.flush()] == [(vt.ESC, None)]
+
+
+def test_paste_is_text():
+    paste = vt.paste_start + b"rm -rf /tmp/x\r\x1b[A" + vt.paste_end
+    events, _ = events_of(paste[:8], paste[8:] + b"\r")
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == vt.PASTE_START
+    assert kinds[-2:] == [vt.PASTE_END, vt.CONTROL]
+    pasted = b"".join(value for kind, value in events if kind == vt.PASTE)
+    assert pasted == b"rm -rf /tmp/x\r\x1b[A"